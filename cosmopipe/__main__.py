@@ -9,8 +9,10 @@ def main(args=None):
                         help='Name of configuration file')
     parser.add_argument('--pipe-graph-fn', type=str, default=None,
                         help='If provided, save graph of the pipeline to this file name')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Profile modules and print report at the end')
     opt = parser.parse_args(args=args)
-    return cosmopipe_main(config=opt.config_fn,pipe_graph_fn=opt.pipe_graph_fn)
+    return cosmopipe_main(config=opt.config_fn,pipe_graph_fn=opt.pipe_graph_fn,profile=opt.profile)
 
 
 if __name__ == '__main__':
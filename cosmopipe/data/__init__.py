@@ -1,4 +1,4 @@
-__all__ = ['DataVector','CovarianceMatrix','MockCovarianceMatrix']
+__all__ = ['DataVector','CovarianceMatrix','MockCovarianceMatrix','CovarianceAccumulator']
 
 from .data_vector import DataVector
-from .covariance import CovarianceMatrix, MockCovarianceMatrix
+from .covariance import CovarianceMatrix, MockCovarianceMatrix, CovarianceAccumulator
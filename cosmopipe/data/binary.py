@@ -0,0 +1,132 @@
+"""
+Binary container for arrays, used to store :class:`~cosmopipe.data.data_vector.DataVector` and
+:class:`~cosmopipe.data.covariance.CovarianceMatrix` instances.
+
+Layout (all integers little-endian):
+
+  - 8 bytes: magic string ``CPBIN001``
+  - 8 bytes: unsigned integer, size of the header in bytes
+  - header: utf-8 encoded json dictionary, with:
+
+    - ``arrays``: dictionary of array name: {``dtype``, ``shape``, ``offset``}, ``dtype`` being a numpy dtype string
+      (e.g. ``'<f8'``) and ``offset`` the position (in bytes) of the array from the start of the container
+    - ``meta``: any json-serializable information (e.g. class name, attributes)
+
+  - arrays: raw C-contiguous arrays, each starting at a multiple of 64 bytes.
+
+Arrays are read through :class:`numpy.memmap`, hence without copy: only the parts actually accessed are read from disk.
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+from cosmopipe import utils
+
+
+logger = logging.getLogger('Binary')
+
+extension = '.cpb'
+magic = b'CPBIN001'
+alignment = 64
+
+
+class BinaryError(Exception):
+
+    pass
+
+
+def is_binary(filename):
+    """Whether ``filename`` has the binary container extension."""
+    return os.path.splitext(filename)[-1] == extension
+
+
+def _align(offset):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def get_layout(arrays, meta=None):
+    """
+    Return header (bytes), dictionary of array offsets and total size (in bytes) of the container for ``arrays``.
+
+    Parameters
+    ----------
+    arrays : dict
+        Dictionary of name: array.
+
+    meta : dict, default=None
+        Json-serializable information to save in the header.
+    """
+    arrays = {name:np.ascontiguousarray(array) for name,array in arrays.items()}
+    description = {name:{'dtype':array.dtype.str,'shape':list(array.shape),'offset':0} for name,array in arrays.items()}
+    for array in arrays.values():
+        if array.dtype.hasobject:
+            raise BinaryError('Cannot save object arrays in binary container.')
+
+    def make_header():
+        return json.dumps({'arrays':description,'meta':meta or {}}).encode('utf-8')
+
+    # offsets are written in the header, hence header size depends on them: iterate until stable
+    header_size = -1
+    header = make_header()
+    while len(header) != header_size:
+        header_size = len(header)
+        offset = _align(len(magic) + 8 + header_size)
+        for name,array in arrays.items():
+            description[name]['offset'] = offset
+            offset = _align(offset + array.nbytes)
+        header = make_header()
+    return header,{name:desc['offset'] for name,desc in description.items()},offset
+
+
+def write_buffer(buffer, arrays, meta=None):
+    """
+    Write ``arrays`` and ``meta`` into ``buffer``, which must be of size (at least) given by :func:`get_layout`.
+    The magic string is written last, such that a concurrent reader (e.g. of shared memory) can tell when the container is complete.
+    """
+    header,offsets,size = get_layout(arrays,meta=meta)
+    buffer = np.frombuffer(buffer,dtype='u1',count=size)
+    buffer[len(magic):len(magic)+8] = np.frombuffer(np.array(len(header),dtype='<u8').tobytes(),dtype='u1')
+    buffer[len(magic)+8:len(magic)+8+len(header)] = np.frombuffer(header,dtype='u1')
+    for name,array in arrays.items():
+        array = np.ascontiguousarray(array)
+        buffer[offsets[name]:offsets[name]+array.nbytes] = np.frombuffer(array,dtype='u1')
+    buffer[:len(magic)] = np.frombuffer(magic,dtype='u1')
+
+
+def read_buffer(buffer):
+    """Return dictionary of arrays (views of ``buffer``) and ``meta`` dictionary from container in ``buffer``."""
+    buffer = np.frombuffer(buffer,dtype='u1')
+    if buffer[:len(magic)].tobytes() != magic:
+        raise BinaryError('Not a binary container (wrong magic string).')
+    header_size = int(np.frombuffer(buffer[len(magic):len(magic)+8].tobytes(),dtype='<u8')[0])
+    header = json.loads(buffer[len(magic)+8:len(magic)+8+header_size].tobytes().decode('utf-8'))
+    arrays = {}
+    for name,desc in header['arrays'].items():
+        dtype = np.dtype(desc['dtype'])
+        count = int(np.prod(desc['shape'],dtype='i8'))
+        arrays[name] = np.frombuffer(buffer,dtype=dtype,count=count,offset=desc['offset']).reshape(desc['shape'])
+    return arrays,header['meta']
+
+
+def save(filename, arrays, meta=None):
+    """Save ``arrays`` and ``meta`` to ``filename``."""
+    utils.mkdir(os.path.dirname(filename))
+    logger.info('Saving to {}.'.format(filename))
+    header,offsets,size = get_layout(arrays,meta=meta)
+    with open(filename,'wb') as file:
+        file.write(magic)
+        file.write(np.array(len(header),dtype='<u8').tobytes())
+        file.write(header)
+        for name,array in arrays.items():
+            file.seek(offsets[name])
+            np.ascontiguousarray(array).tofile(file)
+        file.truncate(size)
+
+
+def load(filename):
+    """Return dictionary of (memory-mapped, read-only) arrays and ``meta`` dictionary from ``filename``."""
+    logger.info('Loading {}.'.format(filename))
+    return read_buffer(np.memmap(filename,dtype='u1',mode='r'))
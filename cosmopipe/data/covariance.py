@@ -1,13 +1,14 @@
 import logging
 import json
+import itertools
+import multiprocessing
 
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.colors import Normalize
 
-from .data_vector import DataVector
-from cosmopipe.utils import BaseClass, savefile, blockinv
-from cosmopipe.plotting import PlottingStyle, suplabel, saveplot
+from .data_vector import DataVector, read_txt_chunks, load_txt_columns
+from . import binary
+from cosmopipe.utils import BaseClass, savefile, blockinv, MappingArray
+from cosmopipe.plotting import PlottingStyle, suplabel, saveplot, _import_pyplot
 
 
 class CovarianceMatrix(DataVector):
@@ -49,8 +50,7 @@ class CovarianceMatrix(DataVector):
 
     def copy(self):
         new = super(CovarianceMatrix,self).copy()
-        for axis,x in enumerate(self._x):
-            new._x[axis] = x.copy()
+        new._x = [x.copy() for x in self._x]
         return new
 
     def view(self, **kwargs):
@@ -65,7 +65,7 @@ class CovarianceMatrix(DataVector):
         if not isinstance(mask,tuple):
             mask = (mask,)*self.ndim
         for ix,m in enumerate(mask):
-            self._x[ix] = self._x[ix][m]
+            new._x[ix] = self._x[ix][m]
         new._covariance = new._covariance[np.ix_(*mask)]
         return new
 
@@ -89,7 +89,8 @@ class CovarianceMatrix(DataVector):
         if block:
             indices = self.get_index(concat=False,**kwargs)
             cov = [[self._covariance[np.ix_(ind1,ind2)] for ind2 in indices[-1]] for ind1 in indices[0]]
-            return blockinv(cov,inv=inv)
+            # a custom inv (e.g. pseudo-inverse) takes precedence over Cholesky inversion
+            return blockinv(cov,inv=inv,cholesky=inv is np.linalg.inv)
         return inv(self.cov(**kwargs))
 
     def corr(self, **kwargs):
@@ -116,8 +117,26 @@ class CovarianceMatrix(DataVector):
         BaseClass.__setstate__(self,state)
         self._x = [DataVector.from_state(x) for x in self._x]
 
+    @savefile
+    def save_binary(self, filename):
+        """Save covariance matrix to binary container ``filename``, see :mod:`~cosmopipe.data.binary`; :attr:`attrs` must be json-serializable."""
+        arrays,meta = {'covariance':self._covariance},{'class':self.__class__.__name__,'attrs':self.attrs}
+        for axis,x in enumerate(self._x):
+            arrays_,meta_ = x._get_binary_arrays(prefix='x{:d}_'.format(axis))
+            arrays.update(arrays_)
+            meta.update(meta_)
+        binary.save(filename,arrays,meta=meta)
+
+    @classmethod
+    def load_binary(cls, filename):
+        """Load covariance matrix from binary container ``filename``; arrays are memory-mapped."""
+        arrays,meta = binary.load(filename)
+        state = {'_covariance':arrays['covariance'],'attrs':meta.get('attrs',{})}
+        state['_x'] = [DataVector._from_binary_arrays(arrays,meta,prefix='x{:d}_'.format(axis)).__getstate__() for axis in range(arrays['covariance'].ndim)]
+        return cls.from_state(state)
+
     @classmethod
-    def load_txt(cls, filename, data=None, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, **attrs):
+    def load_txt(cls, filename, data=None, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, chunksize=100000, **attrs):
         cls.logger.info('Loading {}.'.format(filename))
 
         with open(filename,'r') as file:
@@ -125,65 +144,60 @@ class CovarianceMatrix(DataVector):
 
         attrs = {**header,**attrs}
         col_proj = isinstance(attrs.get('proj',None),bool) and attrs['proj']
-        x,cov,mapping = [[],[]],[],[]
-        proj,projx = [[],[]],[[],[]]
-
-        def str_to_y(e):
-            return float(e)
-
-        if data is not None:
-
-            def str_to_x(row):
-                return [int(e) for e in row]
-
-        else:
-
-            def str_to_x(row):
-                return [float(e) for e in row]
-
-        with open(filename,'r') as file:
-            for iline,line in enumerate(file):
-                if iline < skip_rows: continue
-                if max_rows is not None and iline >= skip_rows + max_rows: break
-                if line.startswith(comments): continue
-                row = line.split()
-                if usecols is None:
-                    usecols = range(len(row))
-                ixl = 2 if col_proj else 0
-                if xdim is None:
-                    nx = len(usecols) - 1 - ixl
-                    if nx % 2 == 0:
-                        xdim = (nx//2,nx//2)
-                    else:
-                        raise ValueError('x vectors do not have the same dimensions; please provide xdim')
-                slx = (slice(ixl,ixl+xdim[0]),slice(ixl+xdim[0],ixl+xdim[0]+xdim[1]))
-                row = [row[icol] for icol in usecols]
-                mapping_ = []
-                if col_proj:
-                    for i in range(2):
-                        x_ = str_to_x(row[slx[i]])
-                        projx_ = tuple([row[i]] + x_)
-                        if projx_ not in projx[i]:
-                            projx[i].append(projx_)
-                            proj[i].append(row[i])
-                            x[i].append(x_)
-                        mapping_.append(projx[i].index(projx_))
+        ixl = 2 if col_proj else 0
+        dtype_x = 'i8' if data is not None else 'f8'
+        if xdim is not None and np.ndim(xdim) == 0:
+            xdim = (xdim,xdim)
+        keys,cov = [[],[]],[]
+        projs = [{},{}]
+
+        for lines in read_txt_chunks(filename,comments=comments,skip_rows=skip_rows,max_rows=max_rows,chunksize=chunksize):
+            if usecols is None:
+                usecols = range(len(lines[0].split()))
+            usecols = list(usecols)
+            if xdim is None:
+                nx = len(usecols) - 1 - ixl
+                if nx % 2 == 0:
+                    xdim = (nx//2,nx//2)
                 else:
-                    for i in range(2):
-                        x_ = str_to_x(row[slx[i]])
-                        if x_ not in x[i]:
-                            x[i].append(x_)
-                        mapping_.append(x[i].index(x_))
-                mapping.append(mapping_)
-                cov.append(str_to_y(row[-1]))
-
-        mapping = np.array(mapping).T
+                    raise ValueError('x vectors do not have the same dimensions; please provide xdim')
+            slx = (slice(ixl,ixl+xdim[0]),slice(ixl+xdim[0],ixl+xdim[0]+xdim[1]))
+            if col_proj:
+                rows = load_txt_columns(lines,usecols[:ixl],dtype=str)
+            for i in range(2):
+                key = load_txt_columns(lines,usecols[slx[i]],dtype=dtype_x)
+                if col_proj:
+                    # projections are coded by integers, in order of first appearance in the file
+                    uniques,index,inverse = np.unique(rows[:,i],return_index=True,return_inverse=True)
+                    for proj in uniques[np.argsort(index)]:
+                        projs[i].setdefault(proj,len(projs[i]))
+                    codes = np.array([projs[i][proj] for proj in uniques])[inverse.ravel()]
+                    key = np.column_stack([codes,key])
+                keys[i].append(key)
+            cov.append(load_txt_columns(lines,usecols[-1:])[:,0])
+
+        x,proj,mapping = [],[],[]
+        for i in range(2):
+            key = np.concatenate(keys[i],axis=0)
+            uniques,index,inverse = np.unique(key,axis=0,return_index=True,return_inverse=True)
+            # sort unique (proj, x) by first appearance in the file
+            order = np.argsort(index)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(order.size)
+            mapping.append(rank[inverse.ravel()])
+            first = key[index[order]]
+            if col_proj:
+                proj.append(np.array(list(projs[i].keys()))[first[:,0].astype(int)])
+                first = first[:,1:]
+            x.append(np.squeeze(first))
+
+        mapping = np.array(mapping)
         mcov = np.full(mapping.max(axis=-1)+1,np.nan)
-        mcov[tuple(mapping)] = cov
+        mcov[tuple(mapping)] = np.concatenate(cov)
 
-        x = tuple(np.squeeze(x_) for x_ in x)
+        x = tuple(x)
         if col_proj:
-            attrs['proj'] = tuple(np.array(p) for p in proj)
+            attrs['proj'] = tuple(proj)
 
         attrs.setdefault('filename',filename)
         if data is not None:
@@ -204,10 +218,12 @@ class CovarianceMatrix(DataVector):
                         file.write('{} {} {:{fmt}} {:{fmt}} {:{fmt}}\n'.format(self._x[0]._proj[ix1],self._x[1]._proj[ix2],x1,x2,\
                                                                                 self._covariance[ix1,ix2],fmt=fmt))
                     else:
-                        file.write('{:{fmt}} {:{fmt}} {:{fmt}}\n'.format(x1,x2,self._cov[ix1,ix2],fmt=fmt))
+                        file.write('{:{fmt}} {:{fmt}} {:{fmt}}\n'.format(x1,x2,self._covariance[ix1,ix2],fmt=fmt))
 
     @saveplot(giveax=False)
     def plot(self, corr=True, style=None, norm=None, barlabel=None, wspace=0.18, hspace=0.18, figsize=None, ticksize=13, **kwargs_style):
+        plt = _import_pyplot()
+        from matplotlib.colors import Normalize
 
         if not isinstance(style,tuple):
             style = (style,)*self.ndim
@@ -258,53 +274,178 @@ class CovarianceMatrix(DataVector):
         cbar.set_label(barlabel,fontsize=styles[0].labelsize,rotation=90)
 
 
+class CovarianceAccumulator(BaseClass):
+    """
+    Streaming estimator of the mean and covariance of data vectors.
+    Data vectors are accumulated by chunks, with batched outer-product updates; accumulators of disjoint sets of data vectors
+    can be merged (Chan et al. 1979), which allows parallel estimation.
+
+    >>> accumulator = CovarianceAccumulator()
+    >>> accumulator.update(list_data)
+    >>> accumulator.covariance()
+    """
+    logger = logging.getLogger('CovarianceAccumulator')
+
+    def __init__(self):
+        self.nobs = 0
+        self.x = self.mean = self.m2 = self.proj = None
+
+    def update(self, list_data):
+        """Add list of :class:`DataVector` to the accumulator."""
+        list_data = list(list_data)
+        if not list_data:
+            return
+        self.update_samples([data.y() for data in list_data],x=np.mean([data.x() for data in list_data],axis=0),proj=list_data[0]._proj)
+
+    def update_samples(self, samples, x=None, proj=None):
+        """Add ``samples``, array of shape (nsamples, size), to the accumulator; ``x`` and ``proj`` are those of the data vectors, if any."""
+        y = np.array(samples,dtype='f8')
+        if not len(y):
+            return
+        other = self.__class__()
+        other.nobs = len(y)
+        other.x = x
+        other.mean = np.mean(y,axis=0)
+        y -= other.mean
+        other.m2 = y.T.dot(y)
+        other.proj = proj
+        self.merge(other)
+
+    def merge(self, other):
+        """Merge accumulator ``other`` into ``self``."""
+        if not other.nobs:
+            return
+        if not self.nobs:
+            self.__dict__.update(other.__dict__)
+            return
+        nobs = self.nobs + other.nobs
+        diff = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + np.outer(diff,diff)*(self.nobs*other.nobs/nobs)
+        self.mean = self.mean + diff*(other.nobs/nobs)
+        if self.x is not None:
+            self.x = self.x + (other.x - self.x)*(other.nobs/nobs)
+        self.nobs = nobs
+
+    def covariance(self, ddof=1):
+        """Return covariance estimate, normalized by ``nobs - ddof``."""
+        return self.m2/(self.nobs - ddof)
+
+    def __getstate__(self):
+        state = {key:getattr(self,key) for key in ['nobs','x','mean','m2','proj']}
+        if self.proj is not None:
+            state['proj'] = self.proj.__getstate__()
+        return state
+
+    def __setstate__(self, state):
+        super(CovarianceAccumulator,self).__setstate__(state)
+        if self.proj is not None:
+            self.proj = MappingArray.from_state(self.proj)
+
+
+def _accumulate(list_data, chunksize=100):
+    accumulator = CovarianceAccumulator()
+    list_data = iter(list_data)
+    while True:
+        chunk = list(itertools.islice(list_data,chunksize))
+        if not chunk:
+            break
+        accumulator.update(chunk)
+    return accumulator
+
+
+def _accumulate_files(reader, filenames, chunksize=100, kwargs=None):
+    return _accumulate((reader(filename,**(kwargs or {})) for filename in filenames),chunksize=chunksize)
+
+
 class MockCovarianceMatrix(CovarianceMatrix):
 
     logger = logging.getLogger('MockCovarianceMatrix')
 
     @classmethod
-    def from_data(cls, list_data):
-        list_x,list_y = [],[]
-        for data in list_data:
-            list_x.append(data.x())
-            list_y.append(data.y())
-        x = np.mean(list_x,axis=0)
-        mean = np.mean(list_y,axis=0)
-        covariance = np.cov(np.array(list_y).T,ddof=1)
-        x = DataVector(x=x,y=mean,proj=data._proj)
-        return cls(covariance=covariance,x=x,mean=mean,nobs=len(list_y))
+    def from_accumulator(cls, accumulator):
+        """Return covariance matrix from :class:`CovarianceAccumulator` instance; ``nobs`` is saved in :attr:`attrs` (for Hartlap factor)."""
+        x = DataVector(x=accumulator.x,y=accumulator.mean,proj=accumulator.proj)
+        return cls(covariance=accumulator.covariance(),x=x,mean=accumulator.mean,nobs=accumulator.nobs)
+
+    @classmethod
+    def from_data(cls, list_data, chunksize=100):
+        """
+        Estimate covariance matrix from (iterable of) :class:`DataVector`.
+        Data vectors are consumed by chunks of size ``chunksize``, such that only one chunk is held in memory.
+        """
+        return cls.from_accumulator(_accumulate(list_data,chunksize=chunksize))
 
     @classmethod
-    def from_files(cls, reader, filenames, **kwargs):
-        filenames = filenames or []
-        list_data = (reader(filename, **kwargs) for filename in filenames)
-        return cls.from_data(list_data)
+    def from_files(cls, reader, filenames, chunksize=100, nprocs=1, **kwargs):
+        """
+        Estimate covariance matrix from data vectors read by ``reader(filename, **kwargs)``.
+        If ``nprocs > 1``, ``filenames`` are split in ``nprocs`` contiguous parts, accumulated in parallel processes then merged.
+        """
+        filenames = list(filenames or [])
+        nprocs = min(nprocs,len(filenames))
+        if nprocs <= 1:
+            return cls.from_data((reader(filename,**kwargs) for filename in filenames),chunksize=chunksize)
+        bounds = np.linspace(0,len(filenames),nprocs+1).astype(int)
+        args = [(reader,filenames[start:stop],chunksize,kwargs) for start,stop in zip(bounds[:-1],bounds[1:])]
+        with multiprocessing.get_context('fork').Pool(nprocs) as pool:
+            accumulators = pool.starmap(_accumulate_files,args)
+        accumulator = accumulators[0]
+        for other in accumulators[1:]:
+            accumulator.merge(other)
+        return cls.from_accumulator(accumulator)
 
 
 ### Pipeline stuff ###
 from cosmopipe.pipeline import SectionBlock, section_names
 
+# execute() does nothing, hence is safe with arrays of parameters
+batch = True
+
 def setup(name, config_block, data_block):
     options = SectionBlock(config_block,name)
-    if options.get_string('format','txt') == 'txt':
-        kwargs = {'xdim':options.get_int('xdim',None),'comments':options.get_string('comments','#'),'usecols':options.get_int_array_1d('usecols',None)}
-        kwargs.update({'skip_rows':options.get_int('skip_rows',0),'max_rows':options.get_int('max_rows',None)})
-        kwargs['mapping_header'] = options.get_json('mapping_header',None)
-        kwargs['mapping_proj'] = options.get_json('mapping_proj',None,catch=lambda s: s.split())
-        if options.has_value('data'):
-            from .data_vector import get_data_from_options
-            kwargs['data'] = get_data_from_options(SectionBlock(config_block,options.get_string('data')))
-        cov = CovarianceMatrix.load_txt(options.get_string('covariance_file'),**kwargs)
-    else:
-        cov = CovarianceMatrix.load(options.get_string('covariance_file'))
-
     projs = data_block[section_names.data,'projs']
     xlims = data_block[section_names.data,'xlims']
-    cov = cov.view(proj=projs,xlim=xlims)
 
-    data_block[section_names.covariance,'cov'] = cov.cov()
-    data_block[section_names.covariance,'invcov'] = cov.invcov()
-    data_block[section_names.covariance,'nobs'] = cov.attrs.get('nobs',0)
+    def load():
+        covariance_file = options.get_string('covariance_file')
+        if binary.is_binary(covariance_file):
+            cov = CovarianceMatrix.load_binary(covariance_file)
+        elif options.get_string('format','txt') == 'txt':
+            kwargs = {'xdim':options.get_int('xdim',None),'comments':options.get_string('comments','#'),'usecols':options.get_int_array_1d('usecols',None)}
+            kwargs.update({'skip_rows':options.get_int('skip_rows',0),'max_rows':options.get_int('max_rows',None)})
+            kwargs['mapping_header'] = options.get_json('mapping_header',None)
+            kwargs['mapping_proj'] = options.get_json('mapping_proj',None,catch=lambda s: s.split())
+            if options.has_value('data'):
+                from .data_vector import get_data_from_options
+                kwargs['data'] = get_data_from_options(SectionBlock(config_block,options.get_string('data')))
+            cov = CovarianceMatrix.load_txt(covariance_file,**kwargs)
+        else:
+            cov = CovarianceMatrix.load(covariance_file)
+
+        cov = cov.view(proj=projs,xlim=xlims)
+        toret = {'cov':cov.cov()}
+        if options.get_bool('invcov',True):
+            toret['invcov'] = cov.invcov()
+        toret['nobs'] = cov.attrs.get('nobs',0)
+        return toret
+
+    if options.get_bool('mpi_shared',False):
+        # covariance is read and inverted once per node, and shared by all ranks of the node
+        from cosmopipe.pipeline import mpi
+        values = mpi.share_arrays(load)
+    elif options.get_bool('shared_memory',False):
+        # covariance is read and inverted by the first process only, and shared with subsequent ones
+        from . import shared
+        filenames,extra = [options.get_string('covariance_file')],{'projs':projs.tolist(),'xlims':xlims.tolist()}
+        if options.has_value('data'):
+            data_options = SectionBlock(config_block,options.get_string('data'))
+            filenames.append(data_options.get_string('data_file'))
+            extra['data'] = dict(data_options.items())
+        values = shared.share_arrays(load,key=shared.get_key(options,filenames=filenames,extra=extra))
+    else:
+        values = load()
+    for key,value in values.items():
+        data_block[section_names.covariance,key] = value
     return 0
 
 def execute(name, config_block, data_block):
@@ -2,11 +2,35 @@ import re
 import logging
 import copy
 import json
+import itertools
 
 import numpy as np
 
 from cosmopipe.utils import BaseClass, savefile, MappingArray
 from cosmopipe.plotting import PlottingStyle, saveplot
+from . import binary
+
+
+def read_txt_chunks(filename, comments='#', skip_rows=0, max_rows=None, chunksize=100000):
+    """
+    Yield chunks of (at most ``chunksize``) lines of text file ``filename``, to be parsed with :func:`load_txt_columns`.
+    ``skip_rows`` and ``max_rows`` count all lines, including comments; lines starting with ``comments`` and empty lines are removed.
+    """
+    stop = None if max_rows is None else skip_rows + max_rows
+    with open(filename,'r') as file:
+        lines = itertools.islice(file,skip_rows,stop)
+        while True:
+            chunk = list(itertools.islice(lines,chunksize))
+            if not chunk:
+                break
+            chunk = [line for line in chunk if line.strip() and not line.startswith(comments)]
+            if chunk:
+                yield chunk
+
+
+def load_txt_columns(lines, usecols, dtype='f8'):
+    """Return 2D array of columns ``usecols`` of ``lines``; parsing is done by :func:`numpy.loadtxt`."""
+    return np.loadtxt(lines,dtype=dtype,usecols=list(usecols),comments=None,ndmin=2)
 
 
 class DataVector(BaseClass):
@@ -22,6 +46,7 @@ class DataVector(BaseClass):
 
         self.attrs = attrs
         self._index_view = None
+        self._index_cache = None
         if x is None:
             x = np.arange(len(y))
         if y is None:
@@ -54,6 +79,12 @@ class DataVector(BaseClass):
     def get_index(self, concat=True, **kwargs):
 
         def _get_one_index(xlim=None, proj=None):
+            if self._x.ndim == 1 and (proj is None or (self.has_proj() and proj in self._proj.keys)):
+                cache = self._get_index_cache()
+                rank,x = cache['groups'][None if proj is None else self._proj.keys.index(proj)]
+                if xlim is not None:
+                    rank = rank[np.searchsorted(x,xlim[0],side='left'):np.searchsorted(x,xlim[-1],side='right')]
+                return cache['base'][np.sort(rank)]
             mask = np.ones(self.size,dtype='?')
             if xlim is not None:
                 tmp = (self._x >= xlim[0]) & (self._x <= xlim[-1])
@@ -85,6 +116,31 @@ class DataVector(BaseClass):
             return np.concatenate(index)
         return index
 
+    def _get_index_cache(self):
+        """
+        Return index cache: ``base`` positions (:attr:`_index_view` or all), and for each projection code (``None`` for all)
+        the ranks in ``base`` of the corresponding points sorted by x, and sorted x.
+        The cache is rebuilt when :attr:`_x`, :attr:`_proj` or :attr:`_index_view` are replaced (not when modified in-place).
+        """
+        arrays = (self._x,self._proj.array if self.has_proj() else None,self._index_view)
+        if self._index_cache is not None and all(array is cached for array,cached in zip(arrays,self._index_cache[0])):
+            return self._index_cache[1]
+        base = self._index_view if self._index_view is not None else np.arange(self.size)
+        x = self._x[base]
+
+        def get_group(rank):
+            rank = rank[np.argsort(x[rank],kind='stable')]
+            return rank,x[rank]
+
+        groups = {None:get_group(np.arange(base.size))}
+        if self.has_proj():
+            codes = self._proj.array[base]
+            for code in range(len(self._proj.keys)):
+                groups[code] = get_group(np.flatnonzero(codes == code))
+        cache = {'base':base,'groups':groups}
+        self._index_cache = (arrays,cache)
+        return cache
+
     def projs(self):
         return self._proj.keys if self.has_proj() else None
 
@@ -99,6 +155,7 @@ class DataVector(BaseClass):
     def __getitem__(self, mask):
         new = self.copy()
         new.attrs = copy.deepcopy(self.attrs)
+        new._index_cache = None
         for key in ['_x','_y']:
             setattr(new,key,getattr(self,key)[mask])
         if self.has_proj(): new._proj = self._proj[mask]
@@ -174,7 +231,7 @@ class DataVector(BaseClass):
         return attrs
 
     @classmethod
-    def load_txt(cls, filename, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, **attrs):
+    def load_txt(cls, filename, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, chunksize=100000, **attrs):
 
         cls.logger.info('Loading {}.'.format(filename))
         with open(filename,'r') as file:
@@ -184,40 +241,30 @@ class DataVector(BaseClass):
         col_proj = isinstance(attrs.get('proj',None),bool) and attrs['proj']
         x,y,proj = [],[],[]
 
-        def str_to_y(e):
-            return float(e)
-
-        def str_to_x(row):
-            return [float(e) for e in row]
-
-        with open(filename,'r') as file:
-            for iline,line in enumerate(file):
-                if iline < skip_rows: continue
-                if max_rows is not None and iline >= skip_rows + max_rows: break
-                if line.startswith(comments): continue
-                row = line.split()
-                if usecols is None:
-                    usecols = range(len(row))
-                if xdim is None:
-                    if len(usecols) == 2:
-                        xdim = 1
-                    elif col_proj:
-                        xdim = len(usecols) - 2
-                    elif attrs.get('mapping_proj',None) is not None:
-                        xdim = len(usecols) - len(attrs['mapping_proj'])
-                    else:
-                        raise ValueError('You should provide xdim!')
-
-                row = [row[icol] for icol in usecols]
-                if col_proj:
-                    x.append(str_to_x(row[1:-1]))
-                    y.append(str_to_y(row[-1]))
-                    proj.append(row[0])
+        for lines in read_txt_chunks(filename,comments=comments,skip_rows=skip_rows,max_rows=max_rows,chunksize=chunksize):
+            if usecols is None:
+                usecols = range(len(lines[0].split()))
+            usecols = list(usecols)
+            if xdim is None:
+                if len(usecols) == 2:
+                    xdim = 1
+                elif col_proj:
+                    xdim = len(usecols) - 2
+                elif attrs.get('mapping_proj',None) is not None:
+                    xdim = len(usecols) - len(attrs['mapping_proj'])
                 else:
-                    x.append(str_to_x(row[:xdim]))
-                    y.append(str_to_x(row[xdim:]))
-
-        x,y = np.squeeze(x),np.squeeze(y).T
+                    raise ValueError('You should provide xdim!')
+            if col_proj:
+                proj += load_txt_columns(lines,usecols[:1],dtype=str)[:,0].tolist()
+                rows = load_txt_columns(lines,usecols[1:])
+                x.append(rows[:,:-1])
+                y.append(rows[:,-1])
+            else:
+                rows = load_txt_columns(lines,usecols)
+                x.append(rows[:,:xdim])
+                y.append(rows[:,xdim:])
+
+        x,y = np.squeeze(np.concatenate(x,axis=0)),np.squeeze(np.concatenate(y,axis=0)).T
         if col_proj:
             attrs['proj'] = proj
 
@@ -237,6 +284,37 @@ class DataVector(BaseClass):
                 else:
                     file.write('{:{fmt}} {:{fmt}}\n'.format(x,self._y[ix],fmt=fmt))
 
+    def _get_binary_arrays(self, prefix=''):
+        arrays = {'{}x'.format(prefix):self._x,'{}y'.format(prefix):self._y}
+        meta = {}
+        if self._index_view is not None:
+            arrays['{}index_view'.format(prefix)] = self._index_view
+        if self.has_proj():
+            arrays['{}proj'.format(prefix)] = self._proj.array
+            meta['{}proj_keys'.format(prefix)] = self._proj.keys
+        return arrays,meta
+
+    @classmethod
+    def _from_binary_arrays(cls, arrays, meta, prefix=''):
+        state = {'_x':arrays['{}x'.format(prefix)],'_y':arrays['{}y'.format(prefix)],'_index_view':arrays.get('{}index_view'.format(prefix),None),'_proj':None}
+        if '{}proj'.format(prefix) in arrays:
+            state['_proj'] = {'array':arrays['{}proj'.format(prefix)],'keys':meta['{}proj_keys'.format(prefix)]}
+        state['attrs'] = meta.get('attrs',{})
+        return cls.from_state(state)
+
+    @savefile
+    def save_binary(self, filename):
+        """Save data vector to binary container ``filename``, see :mod:`~cosmopipe.data.binary`; :attr:`attrs` must be json-serializable."""
+        arrays,meta = self._get_binary_arrays()
+        meta.update({'class':self.__class__.__name__,'attrs':self.attrs})
+        binary.save(filename,arrays,meta=meta)
+
+    @classmethod
+    def load_binary(cls, filename):
+        """Load data vector from binary container ``filename``; arrays are memory-mapped."""
+        arrays,meta = binary.load(filename)
+        return cls._from_binary_arrays(arrays,meta)
+
     def __getstate__(self):
         state = super(DataVector,self).__getstate__()
         for key in ['_x','_y','_index_view','_proj']:
@@ -247,6 +325,7 @@ class DataVector(BaseClass):
 
     def __setstate__(self, state):
         super(DataVector,self).__setstate__(state)
+        self._index_cache = None
         if self._proj is not None:
             self._proj = MappingArray.from_state(self._proj)
 
@@ -265,6 +344,9 @@ class DataVector(BaseClass):
 ### Pipeline stuff ###
 from cosmopipe.pipeline import SectionBlock, section_names
 
+# execute() does nothing, hence is safe with arrays of parameters
+batch = True
+
 def get_data_from_options(options):
     data_file = options.get_string('data_file')
     if data_file.split('.')[-1] == 'txt':
@@ -274,28 +356,40 @@ def get_data_from_options(options):
         kwargs['mapping_header'] = options.get_json('mapping_header',None)
         kwargs['mapping_proj'] = options.get_json('mapping_proj',None,catch=lambda s: s.split())
         data = DataVector.load_txt(data_file,**kwargs)
+    elif binary.is_binary(data_file):
+        data = DataVector.load_binary(data_file)
     else:
         data = DataVector.load(data_file)
     return data
 
 def setup(name, config_block, data_block):
     options = SectionBlock(config_block,name)
-    data = get_data_from_options(options)
-    projs = data.projs()
-    if options.has_value('xlim'):
-        xlims = options.get_json('xlim')
-        if not isinstance(xlims,list):
-            projs = list(xlims.keys())
-            xlims = [xlims[proj] for proj in projs]
+
+    def load():
+        data = get_data_from_options(options)
+        projs = data.projs()
+        if options.has_value('xlim'):
+            xlims = options.get_json('xlim')
+            if not isinstance(xlims,list):
+                projs = list(xlims.keys())
+                xlims = [xlims[proj] for proj in projs]
+        else:
+            xlims = [[-np.inf,np.inf] for proj in projs]
+        data = data.view(proj=projs,xlim=xlims)
+        return {'xlims':np.array(xlims),'projs':np.array(projs),'proj':data.proj(),'x':data.x(),'y':data.y()}
+
+    if options.get_bool('mpi_shared',False):
+        # data is read once per node, and shared by all ranks of the node
+        from cosmopipe.pipeline import mpi
+        values = mpi.share_arrays(load)
+    elif options.get_bool('shared_memory',False):
+        # data is read by the first process only, and shared with subsequent ones
+        from . import shared
+        values = shared.share_arrays(load,key=shared.get_key(options,filenames=[options.get_string('data_file')]))
     else:
-        xlims = [[-np.inf,np.inf] for proj in projs]
-    data = data.view(proj=projs,xlim=xlims)
-
-    data_block[section_names.data,'xlims'] = np.array(xlims)
-    data_block[section_names.data,'projs'] = np.array(projs)
-    data_block[section_names.data,'proj'] = data.proj()
-    data_block[section_names.data,'x'] = data.x()
-    data_block[section_names.data,'y'] = data.y()
+        values = load()
+    for key,value in values.items():
+        data_block[section_names.data,key] = value
     return 0
 
 def execute(name, config_block, data_block):
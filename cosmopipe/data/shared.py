@@ -0,0 +1,201 @@
+"""
+Read-only arrays shared by processes of a node through named :class:`multiprocessing.shared_memory.SharedMemory` segments.
+
+Segments are named after a hash of the input file contents and options (see :func:`get_key`), and laid out as binary containers
+(see :mod:`~cosmopipe.data.binary`). The first process to request a key loads the arrays and places them in a new segment;
+subsequent processes attach to it, without copy.
+Segments are created while holding a lock on a file named after the key in the temporary directory, which is released when the
+creating process exits, even if it crashes: a segment found incomplete by a process holding the lock is then removed and created again.
+Segments outlive the processes which create them (hence are reused by subsequent runs); remove them with :func:`unlink`.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import contextlib
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from cosmopipe import version
+from . import binary
+
+
+logger = logging.getLogger('SharedMemory')
+
+prefix = 'cosmopipe_'
+# segments must outlive the arrays pointing to them: they are kept open until the process exits
+_segments = {}
+_unlinked = []
+
+
+def file_hash(filename, chunksize=2**24):
+    """Return hexadecimal hash of the content of file ``filename``."""
+    hasher = hashlib.sha256()
+    with open(filename,'rb') as file:
+        for chunk in iter(lambda: file.read(chunksize),b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_key(options=None, filenames=None, extra=None):
+    """
+    Return segment name for module ``options`` (dictionary or :class:`SectionBlock`), content of files ``filenames``
+    and ``extra`` json-serializable information (e.g. inputs read from ``data_block``); code version is included.
+    """
+    hasher = hashlib.sha256()
+    state = {'version':version.__version__,'options':dict((options or {}).items()),'extra':extra,
+            'files':[file_hash(filename) for filename in filenames or []]}
+    hasher.update(json.dumps(state,sort_keys=True,default=str).encode('utf-8'))
+    # short names, as some systems limit them to 31 characters
+    return prefix + hasher.hexdigest()[:20]
+
+
+def _untrack(segment):
+    # otherwise, the resource tracker unlinks the segment when this process exits
+    try:
+        resource_tracker.unregister(segment._name,'shared_memory')
+    except Exception:
+        pass
+
+
+def _get_lock_filename(key):
+    return os.path.join(tempfile.gettempdir(),key + '.lock')
+
+
+@contextlib.contextmanager
+def _lock(key, timeout):
+    # exclusive lock on a file, released by the system when the process exits; waits at most timeout seconds
+    if fcntl is None:
+        yield
+        return
+    with open(_get_lock_filename(key),'a') as file:
+        t0 = time.time()
+        while True:
+            try:
+                fcntl.flock(file,fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.time() - t0 > timeout:
+                    raise TimeoutError('Could not acquire lock on shared memory {} after {:.0f} s.'.format(key,timeout))
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(file,fcntl.LOCK_UN)
+
+
+def _attach(key, timeout=0.):
+    segment = shared_memory.SharedMemory(name=key)
+    _untrack(segment)
+    t0 = time.time()
+    while True:
+        # the magic string is written last: without lock (see _lock), wait for the creating process to be done
+        try:
+            return segment,binary.read_buffer(segment.buf)
+        except binary.BinaryError:
+            if time.time() - t0 < timeout:
+                time.sleep(0.01)
+                continue
+        # out of the except clause, whose traceback holds views of the buffer
+        segment.close()
+        raise binary.BinaryError('Shared memory {} is incomplete.'.format(key))
+
+
+def _create(load, key):
+    values = load()
+    arrays = {name:value for name,value in values.items() if isinstance(value,np.ndarray)}
+    meta = {name:value.item() if isinstance(value,np.generic) else value for name,value in values.items() if name not in arrays}
+    header,offsets,size = binary.get_layout(arrays,meta=meta)
+    segment = shared_memory.SharedMemory(name=key,create=True,size=size)
+    _untrack(segment)
+    logger.info('Creating shared memory {} of {:d} bytes.'.format(key,size))
+    binary.write_buffer(segment.buf,arrays,meta=meta)
+    return segment,binary.read_buffer(segment.buf)
+
+
+def share_arrays(load, key, timeout=600.):
+    """
+    Return arrays from shared-memory segment ``key`` if it exists, else call ``load()`` and place its output in a new segment.
+
+    Parameters
+    ----------
+    load : callable
+        Function returning a dictionary of name: value; arrays are shared (read-only),
+        other values must be json-serializable.
+
+    key : string
+        Segment name, see :func:`get_key`.
+
+    timeout : float, default=600.
+        Maximum time (in seconds) to wait for another process to fill in the segment.
+
+    Returns
+    -------
+    toret : dict
+        Dictionary of name: value; arrays are read-only views of the shared-memory segment.
+    """
+    if key in _segments:
+        arrays,meta = binary.read_buffer(_segments[key].buf)
+    else:
+        try:
+            segment,(arrays,meta) = _attach(key)
+            logger.info('Attaching to shared memory {}.'.format(key))
+        except (FileNotFoundError,binary.BinaryError):
+            if fcntl is None:
+                try:
+                    segment,(arrays,meta) = _create(load,key)
+                except FileExistsError:
+                    # created by another process in the meantime
+                    segment,(arrays,meta) = _attach(key,timeout)
+            else:
+                with _lock(key,timeout):
+                    # segments are only created with the lock held: if incomplete, its creator died
+                    try:
+                        segment,(arrays,meta) = _attach(key)
+                        logger.info('Attaching to shared memory {}.'.format(key))
+                    except FileNotFoundError:
+                        segment,(arrays,meta) = _create(load,key)
+                    except binary.BinaryError:
+                        logger.warning('Removing shared memory {} left incomplete by a crashed process.'.format(key))
+                        stale = shared_memory.SharedMemory(name=key)
+                        stale.close()
+                        stale.unlink()
+                        segment,(arrays,meta) = _create(load,key)
+        _segments[key] = segment
+    toret = {}
+    for name,array in arrays.items():
+        array.flags.writeable = False
+        toret[name] = array
+    toret.update(meta)
+    return toret
+
+
+def unlink(keys=None):
+    """
+    Remove shared-memory segments ``keys`` (defaults to all segments created by cosmopipe, if listed in ``/dev/shm``).
+    Memory is actually released once all processes attached to the segments have exited.
+    """
+    if keys is None:
+        keys = [key for key in os.listdir('/dev/shm') if key.startswith(prefix)] if os.path.isdir('/dev/shm') else []
+    for key in keys:
+        if key in _segments:
+            # arrays of this process may still point to the segment: keep it open
+            _unlinked.append(_segments.pop(key))
+        try:
+            segment = shared_memory.SharedMemory(name=key)
+        except FileNotFoundError:
+            continue
+        segment.close()
+        segment.unlink()
+        try:
+            os.remove(_get_lock_filename(key))
+        except OSError:
+            pass
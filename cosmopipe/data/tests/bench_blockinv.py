@@ -0,0 +1,60 @@
+"""
+Benchmark of :func:`~cosmopipe.utils.blockinv` against the legacy (recursive) implementation and :func:`numpy.linalg.inv`.
+
+Run from this directory with ``python bench_blockinv.py [block size] [stack size]``.
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+from cosmopipe.utils import blockinv
+
+
+def legacy_blockinv(blocks, inv=np.linalg.inv):
+    A = blocks[0][0]
+    if (len(blocks),len(blocks[0])) == (1,1):
+        return inv(A)
+    B = np.bmat(blocks[0][1:]).A
+    C = np.bmat([b[0].T for b in blocks[1:]]).A.T
+    invD = legacy_blockinv([b[1:] for b in blocks[1:]],inv=inv)
+
+    def dot(*args):
+        return np.linalg.multi_dot(args)
+
+    invShur = inv(A - dot(B,invD,C))
+    return np.bmat([[invShur,-dot(invShur,B,invD)],[-dot(invD,C,invShur), invD + dot(invD,C,invShur,B,invD)]]).A
+
+
+def make_covariance(size, stack=(), seed=42):
+    rng = np.random.RandomState(seed=seed)
+    a = rng.normal(size=stack + (size,2*size))
+    return np.matmul(a,np.swapaxes(a,-2,-1))
+
+
+def get_blocks(matrix, nblocks):
+    edges = np.linspace(0,matrix.shape[-1],nblocks+1).astype(int)
+    return [[matrix[...,edges[i]:edges[i+1],edges[j]:edges[j+1]] for j in range(nblocks)] for i in range(nblocks)]
+
+
+def timing(func, number=10):
+    return min(timeit.repeat(func,number=number,repeat=3))/number
+
+
+if __name__ == '__main__':
+
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    stack_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for nblocks in [3,5,10]:
+        cov = make_covariance(nblocks*block_size)
+        blocks = get_blocks(cov,nblocks)
+        ref = np.linalg.inv(cov)
+        assert np.allclose(blockinv(blocks),ref) and np.allclose(legacy_blockinv(blocks),ref)
+        times = [timing(lambda: legacy_blockinv(blocks)),timing(lambda: np.linalg.inv(cov)),timing(lambda: blockinv(blocks))]
+        print('{:d} blocks of size {:d}: legacy {:.4g} s, np.linalg.inv {:.4g} s, blockinv {:.4g} s'.format(nblocks,block_size,*times))
+        covs = make_covariance(nblocks*block_size,stack=(stack_size,))
+        blocks = get_blocks(covs,nblocks)
+        assert np.allclose(blockinv(blocks),np.linalg.inv(covs))
+        times = [timing(lambda: [legacy_blockinv(get_blocks(cov,nblocks)) for cov in covs],number=1),timing(lambda: np.linalg.inv(covs),number=1),timing(lambda: blockinv(blocks),number=1)]
+        print('{:d} blocks of size {:d}, stack of {:d}: legacy {:.4g} s, np.linalg.inv {:.4g} s, blockinv {:.4g} s'.format(nblocks,block_size,stack_size,*times))
@@ -0,0 +1,164 @@
+"""
+Benchmark of text readers :meth:`DataVector.load_txt` and :meth:`CovarianceMatrix.load_txt` against the legacy line-by-line implementations.
+
+Run from this directory with ``python bench_txt.py [nx]``, with ``nx`` the number of x-bins per projection.
+"""
+
+import sys
+import logging
+import time
+
+import numpy as np
+
+from cosmopipe.data import DataVector, CovarianceMatrix
+from cosmopipe.utils import setup_logging
+from test_data import make_data_covariance, data_fn, covariance_fn
+
+
+def legacy_data_load_txt(filename, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, **attrs):
+
+    with open(filename,'r') as file:
+        header = DataVector.read_header_txt(file,mapping_header=mapping_header,comments=comments)
+
+    attrs = {**header,**attrs}
+    col_proj = isinstance(attrs.get('proj',None),bool) and attrs['proj']
+    x,y,proj = [],[],[]
+
+    with open(filename,'r') as file:
+        for iline,line in enumerate(file):
+            if iline < skip_rows: continue
+            if max_rows is not None and iline >= skip_rows + max_rows: break
+            if line.startswith(comments): continue
+            row = line.split()
+            if usecols is None:
+                usecols = range(len(row))
+            if xdim is None:
+                if len(usecols) == 2:
+                    xdim = 1
+                elif col_proj:
+                    xdim = len(usecols) - 2
+                elif attrs.get('mapping_proj',None) is not None:
+                    xdim = len(usecols) - len(attrs['mapping_proj'])
+                else:
+                    raise ValueError('You should provide xdim!')
+
+            row = [row[icol] for icol in usecols]
+            if col_proj:
+                x.append([float(e) for e in row[1:-1]])
+                y.append(float(row[-1]))
+                proj.append(row[0])
+            else:
+                x.append([float(e) for e in row[:xdim]])
+                y.append([float(e) for e in row[xdim:]])
+
+    x,y = np.squeeze(x),np.squeeze(y).T
+    if col_proj:
+        attrs['proj'] = proj
+
+    attrs.setdefault('filename',filename)
+    return DataVector(x=x,y=y,**attrs)
+
+
+def legacy_covariance_load_txt(filename, data=None, mapping_header=None, xdim=None, comments='#', usecols=None, skip_rows=0, max_rows=None, **attrs):
+
+    with open(filename,'r') as file:
+        header = CovarianceMatrix.read_header_txt(file,mapping_header=mapping_header,comments=comments)
+
+    attrs = {**header,**attrs}
+    col_proj = isinstance(attrs.get('proj',None),bool) and attrs['proj']
+    x,cov,mapping = [[],[]],[],[]
+    proj,projx = [[],[]],[[],[]]
+
+    if data is not None:
+
+        def str_to_x(row):
+            return [int(e) for e in row]
+
+    else:
+
+        def str_to_x(row):
+            return [float(e) for e in row]
+
+    with open(filename,'r') as file:
+        for iline,line in enumerate(file):
+            if iline < skip_rows: continue
+            if max_rows is not None and iline >= skip_rows + max_rows: break
+            if line.startswith(comments): continue
+            row = line.split()
+            if usecols is None:
+                usecols = range(len(row))
+            ixl = 2 if col_proj else 0
+            if xdim is None:
+                nx = len(usecols) - 1 - ixl
+                xdim = (nx//2,nx//2)
+            slx = (slice(ixl,ixl+xdim[0]),slice(ixl+xdim[0],ixl+xdim[0]+xdim[1]))
+            row = [row[icol] for icol in usecols]
+            mapping_ = []
+            if col_proj:
+                for i in range(2):
+                    x_ = str_to_x(row[slx[i]])
+                    projx_ = tuple([row[i]] + x_)
+                    if projx_ not in projx[i]:
+                        projx[i].append(projx_)
+                        proj[i].append(row[i])
+                        x[i].append(x_)
+                    mapping_.append(projx[i].index(projx_))
+            else:
+                for i in range(2):
+                    x_ = str_to_x(row[slx[i]])
+                    if x_ not in x[i]:
+                        x[i].append(x_)
+                    mapping_.append(x[i].index(x_))
+            mapping.append(mapping_)
+            cov.append(float(row[-1]))
+
+    mapping = np.array(mapping).T
+    mcov = np.full(mapping.max(axis=-1)+1,np.nan)
+    mcov[tuple(mapping)] = cov
+
+    x = tuple(np.squeeze(x_) for x_ in x)
+    if col_proj:
+        attrs['proj'] = tuple(np.array(p) for p in proj)
+
+    attrs.setdefault('filename',filename)
+    if data is not None:
+        x = tuple(data[ix] for ix in x)
+
+    return CovarianceMatrix(mcov,x=x,**attrs)
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    toret = func(*args,**kwargs)
+    return toret,time.time() - t0
+
+
+def bench(nx=100):
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(ndata=2,nx=nx,mapping_proj=mapping_proj)
+
+    legacy,tlegacy = timeit(legacy_data_load_txt,data_fn.format(0),mapping_proj=mapping_proj)
+    new,tnew = timeit(DataVector.load_txt,data_fn.format(0),mapping_proj=mapping_proj)
+    assert np.all(new.x() == legacy.x()) and np.all(new.y() == legacy.y()) and np.all(new.proj() == legacy.proj())
+    print('DataVector ({:d} points): legacy {:.4f} s, new {:.4f} s.'.format(new.size,tlegacy,tnew))
+
+    for label,kwargs in [('x',{}),('index',{'data':new})]:
+        legacy,tlegacy = timeit(legacy_covariance_load_txt,covariance_fn,**kwargs)
+        cov,tnew = timeit(CovarianceMatrix.load_txt,covariance_fn,**kwargs)
+        assert np.all(cov.cov() == legacy.cov())
+        assert all(np.all(x.x() == xl.x()) for x,xl in zip(cov._x,legacy._x))
+        print('CovarianceMatrix {} ({:d} x {:d}): legacy {:.4f} s, new {:.4f} s.'.format(label,*cov.shape,tlegacy,tnew))
+
+    # with data, save_txt writes projection columns
+    cov.save_txt(covariance_fn)
+    legacy,tlegacy = timeit(legacy_covariance_load_txt,covariance_fn)
+    new,tnew = timeit(CovarianceMatrix.load_txt,covariance_fn)
+    assert np.all(new.cov() == legacy.cov())
+    assert all(np.all(x.x() == xl.x()) and np.all(x.proj() == xl.proj()) for x,xl in zip(new._x,legacy._x))
+    print('CovarianceMatrix proj ({:d} x {:d}): legacy {:.4f} s, new {:.4f} s.'.format(*new.shape,tlegacy,tnew))
+
+
+if __name__ == '__main__':
+
+    setup_logging(logging.WARNING)
+    bench(nx=int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -1,8 +1,10 @@
 import os
+import sys
+import subprocess
 
 import numpy as np
 
-from cosmopipe.data import DataVector,CovarianceMatrix,MockCovarianceMatrix
+from cosmopipe.data import DataVector,CovarianceMatrix,MockCovarianceMatrix,CovarianceAccumulator
 from cosmopipe import utils
 from cosmopipe.utils import setup_logging
 
@@ -12,10 +14,10 @@ data_dir = os.path.join(base_dir,'_data')
 data_fn = os.path.join(data_dir,'_data_{:d}.txt')
 covariance_fn = os.path.join(data_dir,'covariance.txt')
 
-def make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=None,ndata=30,seed=42):
+def make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=None,ndata=30,nx=4,seed=42):
     utils.mkdir(os.path.dirname(data_fn))
     utils.mkdir(os.path.dirname(covariance_fn))
-    x = np.linspace(0.,1.,4)
+    x = np.linspace(0.,1.,nx)
     rng = np.random.RandomState(seed=seed)
     list_data = []
     for i in range(ndata):
@@ -110,8 +112,188 @@ def test_covariance():
     cov.plot(filename=filename,style='pk')
 
 
+def test_binary():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    list_data,cov_ref = make_data_covariance(ndata=10,mapping_proj=mapping_proj)
+    data = DataVector.load_txt(data_fn.format(0),mapping_header={'shotnoise':'.*?Estimated shot noise: (.*)'},mapping_proj=mapping_proj)
+    filename = os.path.join(data_dir,'data.cpb')
+    data.save_binary(filename)
+    data2 = DataVector.load_binary(filename)
+    assert not data2._x.flags.writeable
+    assert data2.attrs['shotnoise'] == 3000.
+    assert data2.projs() == mapping_proj
+    assert np.all(data2.x() == data.x()) and np.all(data2.y() == data.y())
+    kwargs = {'proj':['ell_0','ell_4'],'xlim':[[0.,0.5],[0.2,1.]]}
+    assert np.all(data2.view(**kwargs).y() == data.view(**kwargs).y())
+    assert np.all(data2.view(**kwargs).proj() == data.view(**kwargs).proj())
+
+    cov = CovarianceMatrix.load_txt(covariance_fn,data=data,mapping_header={'nobs':'.*?Nobs: (.*)'})
+    filename = os.path.join(data_dir,'covariance.cpb')
+    cov.view(proj=['ell_0','ell_2']).save_binary(filename)
+    cov2 = CovarianceMatrix.load_binary(filename)
+    assert cov2.attrs['nobs'] == 10
+    assert np.all(cov2.cov() == cov.cov(proj=['ell_0','ell_2']))
+    assert np.all(cov2.view(proj=['ell_2'],xlim=[[0.,0.5]]).cov() == cov.cov(proj=['ell_2'],xlim=[[0.,0.5]]))
+    assert np.allclose(cov2.invcov(),cov.invcov(proj=['ell_0','ell_2']))
+
+
+def test_load_txt_chunks():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    list_data,cov_ref = make_data_covariance(ndata=10,nx=10,mapping_proj=mapping_proj)
+    data = DataVector.load_txt(data_fn.format(0),mapping_proj=mapping_proj)
+    data2 = DataVector.load_txt(data_fn.format(0),mapping_proj=mapping_proj,chunksize=3)
+    assert np.all(data2.x() == data.x()) and np.all(data2.y() == data.y()) and np.all(data2.proj() == data.proj())
+    # skip_rows and max_rows count the header line
+    data2 = DataVector.load_txt(data_fn.format(0),mapping_proj=mapping_proj,skip_rows=3,max_rows=4,chunksize=3)
+    assert np.all(data2.x(proj='ell_0') == data.x(proj='ell_0')[2:6])
+    filename = os.path.join(data_dir,'data.txt')
+    data.save_txt(filename)
+    data2 = DataVector.load_txt(filename,chunksize=7)
+    assert np.all(data2.x() == data.x()) and np.all(data2.proj() == data.proj())
+
+    cov = CovarianceMatrix.load_txt(covariance_fn,data=data)
+    cov2 = CovarianceMatrix.load_txt(covariance_fn,data=data,chunksize=17)
+    assert np.all(cov2.cov() == cov.cov()) and np.all(cov2.cov() == cov_ref.cov())
+    filename = os.path.join(data_dir,'covariance.txt')
+    cov.save_txt(filename)
+    cov2 = CovarianceMatrix.load_txt(filename,chunksize=17)
+    assert np.all(cov2._x[0].proj() == cov._x[0].proj())
+    assert np.all(cov2.cov() == cov.cov())
+    assert np.all(cov2.x()[0] == cov.x()[0])
+
+
+def test_mock_covariance():
+
+    mapping_proj = ['ell_0','ell_2']
+    list_data = make_data_covariance(ndata=20,mapping_proj=mapping_proj)[0]
+    ref = np.cov(np.array([data.y() for data in list_data]).T,ddof=1)
+    cov = MockCovarianceMatrix.from_data(iter(list_data),chunksize=7)
+    assert cov.attrs['nobs'] == 20
+    assert np.allclose(cov.cov(),ref)
+    assert np.allclose(cov._x[0].y(),np.mean([data.y() for data in list_data],axis=0))
+    assert np.all(cov._x[0].proj() == list_data[0].proj())
+    accumulator = CovarianceAccumulator()
+    accumulator.update(list_data[:3])
+    other = CovarianceAccumulator.from_state(_accumulate_state(list_data[3:]))
+    accumulator.merge(other)
+    assert np.allclose(accumulator.covariance(),ref)
+    # samples, e.g. chain of parameters, added by chunks
+    samples = np.array([data.y() for data in list_data])
+    accumulator = CovarianceAccumulator()
+    for start in range(0,len(samples),7):
+        accumulator.update_samples(samples[start:start+7])
+    assert accumulator.nobs == len(samples) and np.allclose(accumulator.covariance(),ref)
+    filenames = [data_fn.format(i) for i in range(20)]
+    for nprocs in [1,3]:
+        cov = MockCovarianceMatrix.from_files(DataVector.load_txt,filenames,chunksize=4,nprocs=nprocs,mapping_proj=mapping_proj)
+        assert cov.attrs['nobs'] == 20
+        assert np.allclose(cov.cov(),ref)
+
+
+def _accumulate_state(list_data):
+    accumulator = CovarianceAccumulator()
+    accumulator.update(list_data)
+    return accumulator.__getstate__()
+
+
+def test_index_cache():
+
+    rng = np.random.RandomState(seed=42)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    x = rng.uniform(0.,1.,size=20)
+    data = DataVector(x=x,y=[rng.uniform(size=x.size) for proj in mapping_proj],mapping_proj=mapping_proj)
+
+    def get_index(data, xlim=None, proj=None):
+        mask = np.ones(data.size,dtype='?')
+        if xlim is not None: mask &= (data._x >= xlim[0]) & (data._x <= xlim[-1])
+        if proj is not None: mask &= data._proj == proj
+        index = np.flatnonzero(mask)
+        if data._index_view is not None: index = data._index_view[np.isin(data._index_view,index)]
+        return index
+
+    view = data.view(proj=['ell_4','ell_0'],xlim=[[0.2,0.8],[0.,0.5]])
+    for d in [data,view,data[::2],view[:30]]:
+        for kwargs in [{},{'proj':'ell_2'},{'proj':'ell_4','xlim':(0.1,0.6)},{'xlim':(0.3,0.3)},{'xlim':(0.5,0.4)},{'proj':'ell_6'}]:
+            assert np.all(d.get_index(**kwargs) == get_index(d,**kwargs))
+        assert d._index_cache is not None
+    assert np.all(view.x(proj='ell_4') == data.x(proj='ell_4',xlim=(0.2,0.8)))
+    assert np.all(view.proj() == np.array(['ell_4']*len(view.x(proj='ell_4')) + ['ell_0']*len(view.x(proj='ell_0'))))
+
+    list_data,cov_ref = make_data_covariance(ndata=10,mapping_proj=mapping_proj)
+    data = DataVector.load_txt(data_fn.format(0),mapping_proj=mapping_proj)
+    cov = CovarianceMatrix.load_txt(covariance_fn,data=data)
+    data.x()
+    cov2 = cov.view(proj=['ell_2'],xlim=[[0.,0.5]])
+    assert np.all(cov2.cov() == cov.cov()[np.ix_(*cov.get_index(proj=['ell_2'],xlim=[[0.,0.5]]))])
+
+
+def test_shared_memory():
+
+    from cosmopipe.data import shared
+    key = shared.get_key({'name':'test'},extra=os.getpid())
+    shared.unlink([key])
+    values = shared.share_arrays(lambda: {'a':np.arange(10.),'b':np.array(['x','y']),'nobs':np.int64(3)},key=key)
+    assert np.all(values['a'] == np.arange(10.)) and np.all(values['b'] == ['x','y']) and values['nobs'] == 3
+    assert not values['a'].flags.writeable
+    # another process attaches to the segment, hence does not call load
+    script = 'from cosmopipe.data import shared; values = shared.share_arrays(None,key="{}"); print(values["a"].sum())'.format(key)
+    env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.join(base_dir,'..','..','..')] + sys.path))
+    output = subprocess.run([sys.executable,'-c',script],env=env,capture_output=True,check=True).stdout
+    assert float(output) == 45.
+    shared.unlink([key])
+    # segment is removed: load is called again
+    values = shared.share_arrays(lambda: {'a':np.arange(4.)},key=key)
+    assert np.all(values['a'] == np.arange(4.))
+    shared.unlink([key])
+    # creating process crashes before filling in the segment: it is created again, without waiting for the timeout
+    script = 'import os; from multiprocessing import shared_memory; from cosmopipe.data import shared\n'\
+             'with shared._lock("{0}",1.): shared._untrack(shared_memory.SharedMemory(name="{0}",create=True,size=100)); os._exit(1)'.format(key)
+    assert subprocess.run([sys.executable,'-c',script],env=env).returncode == 1
+    values = shared.share_arrays(lambda: {'a':np.arange(5.)},key=key,timeout=5.)
+    assert np.all(values['a'] == np.arange(5.))
+    shared.unlink([key])
+
+
+def test_blockinv():
+
+    rng = np.random.RandomState(seed=42)
+    a = rng.normal(size=(5,30,60))
+    covs = np.matmul(a,np.swapaxes(a,-2,-1))
+    edges = [0,5,12,30]
+
+    def get_blocks(matrix):
+        return [[matrix[...,edges[i]:edges[i+1],edges[j]:edges[j+1]] for j in range(len(edges)-1)] for i in range(len(edges)-1)]
+
+    cov = covs[0]
+    assert np.allclose(utils.blockinv(get_blocks(cov)),np.linalg.inv(cov))
+    assert np.allclose(utils.blockinv([[cov]]),np.linalg.inv(cov))
+    # stack of matrices
+    assert np.allclose(utils.blockinv(get_blocks(covs)),np.linalg.inv(covs))
+    # in-place Cholesky inversion
+    tmp = cov.copy()
+    inv = utils.cholinv(tmp,overwrite=True)
+    assert np.allclose(inv,np.linalg.inv(cov)) and np.allclose(inv,inv.T)
+    # not positive definite: falls back to inv
+    cov = np.diag([1.,-2.,3.])
+    assert np.allclose(utils.blockinv([[cov]]),np.linalg.inv(cov))
+    try:
+        utils.cholinv(cov)
+    except np.linalg.LinAlgError:
+        pass
+    else:
+        raise AssertionError('cholinv should raise LinAlgError')
+
+
 if __name__ == '__main__':
 
     setup_logging()
     test_data_vector()
     test_covariance()
+    test_binary()
+    test_load_txt_chunks()
+    test_mock_covariance()
+    test_index_cache()
+    test_shared_memory()
+    test_blockinv()
@@ -1,8 +1,12 @@
+import time
 import logging
+import multiprocessing
 
 import numpy as np
 
 from cosmopipe.pipeline import BasePipeline, section_names
+from cosmopipe.pipeline.block import register_output
+from cosmopipe.pipeline.module import ModuleError
 
 
 class BaseLikelihood(BasePipeline):
@@ -38,40 +42,192 @@ class GaussianLikelihood(BaseLikelihood):
         self.set_covariance()
 
     def set_covariance(self):
-        self.invcovariance = self.pipe_block[section_names.covariance,'invcov']
         self.nobs = self.pipe_block.get(section_names.covariance,'nobs',None)
         if self.nobs is None:
             self.logger.info('The number of observations used to estimate the covariance matrix is not provided,\
                             hence no Hartlap factor is applied to inverse covariance.')
-            self.precision = self.invcovariance
+            self.hartlap = 1.
         else:
             self.hartlap = (self.nobs - self.data.size - 2.)/(self.nobs - 1.)
             self.logger.info('Covariance matrix with {:d} points built from {:d} observations.'.format(self.data.size,self.nobs))
             self.logger.info('...resulting in Hartlap factor of {:.4f}.'.format(self.hartlap))
+        self.solver = self.options.get_string('solver','inv')
+        if self.solver == 'cholesky':
+            from scipy import linalg
+            self._solve_triangular = linalg.solve_triangular
+            # precision = hartlap * invcov, i.e. effective covariance is cov/hartlap = L L^T
+            self.cholesky = linalg.cholesky(self.pipe_block[section_names.covariance,'cov']/self.hartlap,lower=True)
+            self.logdet = 2.*np.sum(np.log(np.diag(self.cholesky)))
+            self.whitened_data = self.whiten(self.data)
+        elif self.solver == 'inv':
+            self.invcovariance = self.pipe_block[section_names.covariance,'invcov']
             self.precision = self.invcovariance * self.hartlap
+        else:
+            raise ValueError('Unknown solver {}; it should be one of [\'inv\',\'cholesky\']'.format(self.solver))
+
+    def whiten(self, vector):
+        """Return ``L^{-1} vector``, with ``L`` the Cholesky factor of the covariance; ``vector`` may be of shape (npoints,ndata) in batch mode."""
+        return self._solve_triangular(self.cholesky,vector.T,lower=True,check_finite=False).T
 
     def loglkl(self):
+        if self.solver == 'cholesky':
+            diff = self.whiten(self.model) - self.whitened_data
+            return -0.5*np.sum(diff**2,axis=-1)
         diff = self.model - self.data
-        return -0.5*diff.T.dot(self.precision).dot(diff)
+        # diff may be of shape (npoints,ndata) in batch mode
+        return -0.5*np.sum(diff.dot(self.precision)*diff,axis=-1)
 
 
 class SumLikelihood(BaseLikelihood):
+    """
+    Sum of independent likelihoods.
 
+    If option ``nprocs`` is larger than 1, sub-likelihoods are executed concurrently in a persistent pool of (forked) processes,
+    each holding its own set-up copy of the sub-likelihoods it is assigned to.
+    Only the parameter section is sent to the workers, and only ``loglkl`` is sent back; hence other products of the sub-likelihoods
+    are not available in ``data_block`` in this case. If a sub-likelihood fails, replies of all workers are read before
+    :class:`~cosmopipe.pipeline.module.ModuleError` is raised, such that the pool can be used again.
+
+    If option ``mpi`` is ``True`` and several MPI processes are running, sub-likelihoods are rather distributed over the MPI ranks:
+    each rank sets up and executes its subset of sub-likelihoods, and ``loglkl`` is summed over the ranks.
+    Each sub-likelihood is set up by a single rank, hence with ``MPI.COMM_SELF`` as default communicator (see :func:`~cosmopipe.pipeline.mpi.use_comm`):
+    e.g. option ``mpi_shared`` of data and covariance modules then does not share arrays between ranks.
+    Hence all ranks must execute the pipeline for the same parameters (see :class:`~cosmopipe.pipeline.mpi.MPIEvaluator`).
+    """
     logger = logging.getLogger('SumLikelihood')
+    mpi_comm = None
 
     def setup(self):
-        BasePipeline.setup(self)
+        self.mpi_comm = None
+        if self.options.get_bool('mpi',False):
+            from cosmopipe.pipeline import mpi
+            comm = mpi.get_comm()
+            if comm.size > 1:
+                self.mpi_comm = comm
+        if self.mpi_comm is None:
+            BasePipeline.setup(self)
+        else:
+            self.clear_incremental()
+            self._mpi_indices = list(range(self.mpi_comm.rank,len(self.modules),self.mpi_comm.size))
+            # collective calls (e.g. mpi.share_arrays) in the setup of sub-likelihoods must only involve the ranks which set them up
+            with mpi.use_comm(mpi.get_mpi().COMM_SELF):
+                for index in self._mpi_indices:
+                    self.modules[index].setup()
+        self.timings = {module.name:[0,0.] for module in self}
+        self._workers = []
+        nprocs = min(self.options.get_int('nprocs',1),len(self.modules))
+        if nprocs > 1:
+            if self.mpi_comm is not None:
+                raise ValueError('Options nprocs and mpi cannot be used together.')
+            self.start_workers(nprocs)
+
+    def start_workers(self, nprocs):
+        context = multiprocessing.get_context('fork')
+        self.logger.info('Starting {:d} processes for {:d} likelihoods.'.format(nprocs,len(self.modules)))
+        for iproc in range(nprocs):
+            indices = list(range(iproc,len(self.modules),nprocs))
+            connection,child_connection = context.Pipe()
+            process = context.Process(target=self._run_worker,args=(indices,child_connection),daemon=True)
+            process.start()
+            child_connection.close()
+            self._workers.append((indices,connection,process))
+
+    def _run_worker(self, indices, connection):
+        modules = [self.modules[index] for index in indices]
+        parameters = self.pipe_block[section_names.parameters]
+        while True:
+            params = connection.recv()
+            if params is None:
+                break
+            name = self.name
+            try:
+                parameters.update(params)
+                toret = []
+                for module in modules:
+                    name = module.name
+                    t0 = time.time()
+                    module.execute()
+                    toret.append((self.pipe_block[section_names.likelihood,'loglkl'],time.time()-t0))
+            except Exception as exc:
+                # name of the failing module, and exception
+                toret = (name,exc)
+            connection.send(toret)
+        connection.close()
+
+    def stop_workers(self):
+        for indices,connection,process in getattr(self,'_workers',[]):
+            connection.send(None)
+            connection.close()
+            process.join()
+        self._workers = []
 
     def execute(self):
+        if self.mpi_comm is not None:
+            loglkl = 0
+            for index in self._mpi_indices:
+                t0 = time.time()
+                self.modules[index].execute()
+                loglkl += self.pipe_block[section_names.likelihood,'loglkl']
+                self._add_timing(self.modules[index],time.time()-t0)
+            self.data_block[section_names.likelihood,'loglkl'] = self.mpi_comm.allreduce(loglkl)
+            return
+        loglkls = [None]*len(self.modules)
+        if self._workers:
+            params = dict(self.data_block[section_names.parameters])
+            for indices,connection,process in self._workers:
+                connection.send(params)
+            errors = []
+            # read all replies, such that none is left in the pipes for the next call
+            for indices,connection,process in self._workers:
+                toret = connection.recv()
+                if isinstance(toret,tuple):
+                    errors.append(toret)
+                    continue
+                for index,(loglkl,dt) in zip(indices,toret):
+                    loglkls[index] = loglkl
+                    self._add_timing(self.modules[index],dt)
+            if errors:
+                name,exc = errors[0]
+                raise ModuleError('Likelihood [{}] failed in worker process: {!r}'.format(name,exc)) from exc
+        else:
+            t0 = [time.time()]
+
+            def callback(index, executed):
+                loglkls[index] = self.pipe_block[section_names.likelihood,'loglkl']
+                if executed: self._add_timing(self.modules[index],time.time()-t0[0])
+                t0[0] = time.time()
+
+            self.execute_modules(self.modules,callback=callback)
         loglkl = 0
-        for module in self:
-            module.execute()
-            loglkl += self.pipe_block[section_names.likelihood,'loglkl']
+        for value in loglkls:
+            loglkl += value
         self.data_block[section_names.likelihood,'loglkl'] = loglkl
 
+    def _add_timing(self, module, dt):
+        timing = self.timings[module.name]
+        timing[0] += 1
+        timing[1] += dt
+        if self._workers and module.profiler is not None:
+            # module is executed in another process
+            module.profiler.add('execute',dt)
+
+    def cleanup(self):
+        self.stop_workers()
+        for name,(ncalls,total) in getattr(self,'timings',{}).items():
+            if ncalls: self.logger.info('Likelihood [{}] executed {:d} times in {:.4f} s on average.'.format(name,ncalls,total/ncalls))
+        super(SumLikelihood,self).cleanup()
+
 
 class JointGaussianLikelihood(GaussianLikelihood):
+    """
+    Gaussian likelihood of the concatenation of the data vectors of the ``join`` modules.
 
+    Each ``join`` module has its own data block, sharing only the parameters and common sections with ``pipe_block``;
+    hence ``join`` modules are independent, and can be executed concurrently (see option ``max_workers`` of :class:`BasePipeline`).
+    Models of the ``join`` modules are gathered into preallocated arrays: a view of its segment is set in the block of each ``join`` module,
+    which it can fill in place (see :meth:`DataBlock.get_output`); else its model is copied into the segment.
+    Hence the model in ``data_block`` is updated in place at each call.
+    """
     logger = logging.getLogger('JointGaussianLikelihood')
 
     def __init__(self, *args, join=None, modules=None, **kwargs):
@@ -81,31 +237,72 @@ class JointGaussianLikelihood(GaussianLikelihood):
         self.join = join + self._get_modules_from_library(self.options.get_string('join',default='').split())
         self.after = [module for module in self.modules if module not in self.join]
         self.modules = self.join + self.after
+        self.set_join_blocks()
+
+    def module_groups(self):
+        return {'join':self.join,'after':self.after}
+
+    def set_data_block(self, data_block=None):
+        super(JointGaussianLikelihood,self).set_data_block(data_block=data_block)
+        if hasattr(self,'join'):
+            self.set_join_blocks()
+
+    def set_join_blocks(self):
+        self._join_blocks = []
+        for module in self.join:
+            block = self.pipe_block.datacopy()
+            block.data = {section:self.pipe_block.data[section] for section in section_names.nocopy}
+            # loglkl of join modules is not used: private likelihood section, such that join modules do not conflict
+            block.data[section_names.likelihood] = {}
+            module.set_data_block(block)
+            self._join_blocks.append(block)
 
     def setup(self):
+        self.clear_incremental()
         join = {}
-        for module in self.join:
+        for module,block in zip(self.join,self._join_blocks):
             module.setup()
-            for key in self.pipe_block.keys(section=section_names.data):
+            for key in block.keys(section=section_names.data):
                 if key not in join: join[key] = []
-                join[key].append(self.pipe_block[key])
+                join[key].append(block[key])
         for key in join:
             self.data_block[key] = self.pipe_block[key] = np.concatenate(join[key])
+        # model of join module i goes into [...,self._model_slices[i]] of preallocated arrays
+        offsets = np.cumsum([0] + [data.shape[-1] for data in join[section_names.data,'y']])
+        self._model_slices = [slice(start,stop) for start,stop in zip(offsets[:-1],offsets[1:])]
+        self._model_buffers,self._model_views,self._model_segments = {},{},{}
         for module in self.after:
             module.setup()
         self.set_data()
         self.set_covariance()
 
     def execute(self):
-        join = {}
-        for module in self.join:
-            module.execute()
-            for key in self.pipe_block.keys(section=section_names.model):
-                if key not in join: join[key] = []
-                join[key].append(self.pipe_block[key])
-        for key in join:
-            self.data_block[key] = self.pipe_block[key] = np.concatenate(join[key])
-        for module in self.after:
-            module.execute()
+        reallocate = set()
+        for index,block in enumerate(self._join_blocks):
+            for key,views in self._model_views.items():
+                block[key] = views[index]
+
+        def callback(index, executed):
+            # with incremental execution, only models of re-executed join modules are collected
+            if not executed: return
+            block = self._join_blocks[index]
+            for key in block.keys(section=section_names.model):
+                value = block[key]
+                self._model_segments.setdefault(key,[None]*len(self.join))[index] = value
+                views = self._model_views.get(key,None)
+                if views is None or views[index].shape != np.shape(value):
+                    reallocate.add(key)
+                elif value is not views[index]:
+                    views[index][...] = value
+
+        self.execute_modules(self.join,callback=callback)
+        for key in reallocate:
+            self._model_buffers[key] = np.concatenate(self._model_segments[key],axis=-1)
+            # filled in place through views at the next calls
+            register_output(self._model_buffers[key])
+            self._model_views[key] = [self._model_buffers[key][...,sl] for sl in self._model_slices]
+        for key,buffer in self._model_buffers.items():
+            self.data_block[key] = self.pipe_block[key] = buffer
+        self.execute_modules(self.after)
         self.set_model()
         self.data_block[section_names.likelihood,'loglkl'] = self.loglkl()
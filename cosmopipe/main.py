@@ -1,9 +1,13 @@
 from .pipeline import BasePipeline
 
-def main(config=None,pipe_graph_fn=None):
+def main(config=None,pipe_graph_fn=None,profile=False):
     pipeline = BasePipeline(config_block=config)
     if pipe_graph_fn is not None:
         pipeline.plot_pipeline_graph(filename=pipe_graph_fn)
+    if profile:
+        pipeline.set_profiler()
     pipeline.setup()
     pipeline.execute()
     pipeline.cleanup()
+    if profile:
+        pipeline.log_profile_report()
@@ -2,7 +2,9 @@
 
 import re
 import json
+import weakref
 import logging
+import builtins
 
 import numpy as np
 
@@ -14,11 +16,39 @@ class MappingError(Exception):
     pass
 
 
+_missing = object()
+_empty = {}
+# base arrays of outputs filled in place (see DataBlock.get_output), whose content may change while they stay in data_block
+_outputs = weakref.WeakValueDictionary()
+
+
+def _get_base(array):
+    while isinstance(array.base,np.ndarray):
+        array = array.base
+    return array
+
+
+def register_output(array):
+    """Register ``array`` (and all arrays sharing its base) as an output filled in place, see :func:`is_output`."""
+    base = _get_base(array)
+    _outputs[id(base)] = base
+
+
+def is_output(value):
+    """Return whether ``value`` is an array filled in place (see :meth:`DataBlock.get_output`), hence may change without being set again."""
+    if not isinstance(value,np.ndarray):
+        return False
+    base = _get_base(value)
+    return _outputs.get(id(base),None) is base
+
+
 class Mapping(BaseClass):
 
+    __slots__ = ('data','invdata')
+
     def __init__(self, data=None):
         if isinstance(data,Mapping):
-            self.__dict__.update(data.__dict__)
+            self.data,self.invdata = data.data,data.invdata
             return
         self.data = data or {}
         if isinstance(data,str):
@@ -53,7 +83,7 @@ class Mapping(BaseClass):
         return self.invdata.get(args,args)
 
     def copy(self):
-        new = super(Mapping,self).copy()
+        new = object.__new__(self.__class__)
         new.data = self.data.copy()
         new._set_invdata()
         return new
@@ -68,10 +98,128 @@ class Mapping(BaseClass):
     def __getstate__(self):
         return {'data':self.data,'invdata':self.invdata}
 
+    def __setstate__(self, state):
+        self.data,self.invdata = state['data'],state['invdata']
+
     def __str__(self):
         return str(self.data)
 
 
+class BlockRecorder(object):
+    """
+    Record entries read and written through :class:`DataBlock` instances.
+
+    Entries are identified by the section dictionary they live in (hence entries of shared sections,
+    accessed through different :class:`DataBlock` instances, are identified) and their name;
+    ``name`` is ``None`` when a whole section is written.
+    Entries written before being read are considered internal, hence are not recorded as reads.
+    If ``parent`` is provided, reads and writes are forwarded to it.
+    """
+    def __init__(self, parent=None):
+        self.reads = {}
+        self.writes = {}
+        self.parent = parent
+
+    @staticmethod
+    def _get_id(block, section, name):
+        sec = block.data.get(section,None)
+        if sec is None or name is None:
+            return (id(block.data),section,name)
+        return (id(sec),name)
+
+    def read(self, block, section, name):
+        ident = self._get_id(block,section,name)
+        if ident not in self.writes and ident not in self.reads:
+            self.reads[ident] = (block,section,name)
+        if self.parent is not None:
+            self.parent.read(block,section,name)
+
+    def write(self, block, section, name):
+        ident = self._get_id(block,section,name)
+        if ident not in self.writes:
+            self.writes[ident] = (block,section,name)
+        if self.parent is not None:
+            self.parent.write(block,section,name)
+
+
+class BlockHandle(object):
+    """
+    Handle to an entry of a :class:`DataBlock`, with ``section``, ``name`` resolved (mapped) once at creation,
+    for fast repeated access to the entry (e.g. in :meth:`BaseModule.execute`).
+
+    >>> data_block = DataBlock()
+    >>> handle = data_block.get_handle('parameters','a')
+    >>> handle.set(1.)
+    >>> handle.get()
+    1.0
+    """
+    __slots__ = ('block','section','name')
+
+    def __init__(self, block, section, name):
+        key = (section,name)
+        self.block = block
+        self.section,self.name = block.mapping.data.get(key,key)
+
+    def get(self, *args):
+        """Return value, or ``args[0]`` if provided and entry does not exist."""
+        block = self.block
+        if block.recorder is not None:
+            block.recorder.read(block,self.section,self.name)
+        try:
+            return block.data[self.section][self.name]
+        except KeyError:
+            if args: return args[0]
+            raise BlockError('get_notfound',self.section,self.name)
+
+    def set(self, value):
+        block = self.block
+        try:
+            block.data[self.section][self.name] = value
+        except KeyError:
+            block.data[self.section] = {self.name:value}
+        if block.recorder is not None:
+            block.recorder.write(block,self.section,self.name)
+
+
+class BlockVectorHandle(object):
+    """
+    Handle to several entries of a :class:`DataBlock`, with ``section``, ``names`` resolved (mapped) once at creation;
+    (scalar) values are read into / set from a float64 array.
+    """
+    __slots__ = ('block','keys','size')
+
+    def __init__(self, block, section, names):
+        self.block = block
+        self.keys = [block.mapping.data.get((section,name),(section,name)) for name in names]
+        self.size = len(self.keys)
+
+    def get(self):
+        """Return values, as a float64 array."""
+        block = self.block
+        if block.recorder is not None:
+            for key in self.keys: block.recorder.read(block,*key)
+        data = block.data
+        try:
+            return np.fromiter((data[section][name] for section,name in self.keys),dtype='f8',count=self.size)
+        except KeyError as exc:
+            section,name = next(key for key in self.keys if key[1] not in data.get(key[0],_empty))
+            raise BlockError('get_notfound',section,name) from exc
+
+    def set(self, values):
+        """Set values, given as a sequence (e.g. 1D array) of same size as ``names``."""
+        if isinstance(values,np.ndarray) and values.ndim == 1:
+            values = values.tolist()
+        block = self.block
+        data = block.data
+        for (section,name),value in zip(self.keys,values):
+            try:
+                data[section][name] = value
+            except KeyError:
+                data[section] = {name:value}
+        if block.recorder is not None:
+            for key in self.keys: block.recorder.write(block,*key)
+
+
 class BlockError(Exception):
 
     _messages = {'put_exists': 'Tried to overwrite "{name}" in section [{section}]. Use the replace function to over-write.',
@@ -87,7 +235,60 @@ class BlockError(Exception):
         self.type_ = type_
 
     def __str__(self):
-        return self._messages[self.status].format(name=self.name,section=self.section,type_=type_)
+        return self._messages[self.status].format(name=self.name,section=self.section,type_=self.type_)
+
+
+_type_checkers = {}
+
+def get_type_checker(type_):
+    """
+    Return function ``checker(value)`` returning whether ``value`` is of type ``type_``.
+    ``type_`` is either a type, or a string: 'bool', 'int', 'float' ('double'), 'str' ('string'), or '[type]_array_[ndim]d'
+    (list of [type] or numpy array of [type] with [ndim] dimensions).
+    Checkers are cached, such that the type string is parsed only once.
+    """
+    try:
+        return _type_checkers[type_]
+    except KeyError:
+        pass
+
+    def get_type_from_str(type_):
+        type_ = getattr(builtins,type_,None)
+        return type_ if isinstance(type_,type) else None
+
+    def get_nptype_from_str(type_):
+        return {'bool':np.bool_,'int':np.integer,'float':np.floating,'str':np.character}.get(type_,None)
+
+    def checker(value):
+        return False
+
+    convert = {'double':'float','string':'str'}
+    if isinstance(type_,str):
+        type_str = convert.get(type_,type_)
+        type_py = get_type_from_str(type_str)
+        if type_py is not None:
+
+            def checker(value):
+                return isinstance(value,type_py)
+
+        else:
+            match = re.match('(.*)_array_(.*)d',type_str)
+            if match is not None:
+                ndim,type_str = int(match.group(2)),convert.get(match.group(1),match.group(1))
+                type_py,type_np = get_type_from_str(type_str),get_nptype_from_str(type_str)
+
+                def checker(value):
+                    if isinstance(value,list):
+                        return type_py is not None and (not value or isinstance(value[0],type_py))
+                    return type_np is not None and isinstance(value,np.ndarray) and np.issubdtype(value.dtype,type_np) and value.ndim == ndim
+
+    else:
+
+        def checker(value):
+            return isinstance(value,type_)
+
+    _type_checkers[type_] = checker
+    return checker
 
 
 class DataBlock(BaseClass):
@@ -108,6 +309,7 @@ class DataBlock(BaseClass):
     cosmopipe.pipeline.block.BlockError: Wrong type for "name1" in section [section1].
     """
     logger = logging.getLogger('DataBlock')
+    recorder = None
 
     def __init__(self, data=None, mapping=None):
         """
@@ -128,6 +330,7 @@ class DataBlock(BaseClass):
         if isinstance(data,DataBlock):
             self.__dict__.update(data.__dict__)
             self.mapping.update(mapping)
+            self.recorder = None
             return
         self.data = data or {}
         for section in section_names.nocopy:
@@ -135,41 +338,11 @@ class DataBlock(BaseClass):
         self.mapping = mapping
 
     def get_type(self, section, name, type_, *args, **kwargs):
-
-        if not self.has_value(section,name):
+        value = self.get(section,name,_missing)
+        if value is _missing:
             return self.get(section,name,*args,**kwargs)
-
-        value = self.get(section,name)
-        convert = {'double':'float','string':'str'}
-
-        def get_type_from_str(type_):
-            return __builtins__.get(type_,None)
-
-        def get_nptype_from_str(type_):
-            return {'bool':np.bool_,'int':np.integer,'float':np.floating,'str':np.string_}.get(type_,None)
-
-        error = BlockError('wrong_type',section,name,type_=str(type_))
-        if isinstance(type_,str):
-            type_ = convert.get(type_,type_)
-            type_py = get_type_from_str(type_)
-            if type_py is not None:
-                if not isinstance(value,type_py):
-                    raise error
-            else:
-                match = re.match('(.*)_array_(.*)d',type_)
-                if match is None:
-                    raise error
-                ndim,type_ = int(match.group(2)),match.group(1)
-                if isinstance(value,list):
-                    type_py = get_type_from_str(type_)
-                    if type_py is None or not isinstance(value[0],type_py):
-                        raise error
-                else:
-                    type_np = get_nptype_from_str(type_)
-                    if type_np is None or not np.issubdtype(value.dtype,type_np) or not value.ndim == ndim:
-                        raise error
-        elif not isinstance(value,type_):
-            raise error
+        if not get_type_checker(type_)(value):
+            raise BlockError('wrong_type',section,name,type_=str(type_))
         return value
 
     def get_json(self, section, name, *args, catch=True, **kwargs):
@@ -193,15 +366,44 @@ class DataBlock(BaseClass):
         return value
 
     def get(self, section, name, *args, **kwargs):
-        if self.has_value(section,name):
-            section,name = self.mapping.get(section,name)
-            return self.data[section][name]
+        key = (section,name)
+        key = self.mapping.data.get(key,key)
+        if self.recorder is not None:
+            self.recorder.read(self,*key)
+        value = self.data.get(key[0],_empty).get(key[1],_missing)
+        if value is not _missing:
+            return value
         if 'default' in kwargs:
             return kwargs['default']
         if len(args):
             return args[0]
         raise BlockError('get_notfound',section,name)
 
+    def get_handle(self, section, name):
+        """Return :class:`BlockHandle` to entry ``section``, ``name``."""
+        return BlockHandle(self,section,name)
+
+    def get_vector_handle(self, section, names):
+        """Return :class:`BlockVectorHandle` to entries ``names`` of ``section``."""
+        return BlockVectorHandle(self,section,names)
+
+    def get_output(self, section, name, shape, dtype='f8'):
+        """
+        Return writable array of ``shape`` and ``dtype`` for entry ``section``, ``name``, to be filled in place:
+        the array already in this entry if compatible (e.g. from a previous call, or a view provided by the calling pipeline),
+        else a new (uninitialized) array, which is set in this entry.
+        The array is registered as an output (see :func:`register_output`), such that it is compared by value, not identity,
+        to detect changes (see :class:`~cosmopipe.pipeline.cache.DependencyTracker`).
+        """
+        key = (section,name)
+        section,name = self.mapping.data.get(key,key)
+        value = self.data.get(section,_empty).get(name,None)
+        if not (isinstance(value,np.ndarray) and value.shape == tuple(shape) and value.dtype == dtype and value.flags.writeable):
+            value = np.empty(shape,dtype=dtype)
+        register_output(value)
+        self.set(section,name,value)
+        return value
+
     def put(self, section, name, value):
         if self.has_value(section, name):
             raise BlockError('put_exists',section,name)
@@ -210,17 +412,22 @@ class DataBlock(BaseClass):
     def replace(self, section, name, value):
         if not self.has_value(section,name):
             raise BlockError('replace_notfound',section,name)
-        self.data[section][name] = value
+        self.set(section,name,value)
 
     def set(self, section, name, value):
-        section,name = self.mapping.get(section,name)
-        if section not in self.sections():
-            self.data[section] = {}
-        self.data[section][name] = value
+        key = (section,name)
+        section,name = self.mapping.data.get(key,key)
+        try:
+            self.data[section][name] = value
+        except KeyError:
+            self.data[section] = {name:value}
+        if self.recorder is not None:
+            self.recorder.write(self,section,name)
 
     def has_value(self, section, name):
-        section,name = self.mapping.get(section,name)
-        return section in self.data and name in self.data[section]
+        key = (section,name)
+        section,name = self.mapping.data.get(key,key)
+        return name in self.data.get(section,_empty)
 
     def has_section(self, section):
         return section in self.sections()
@@ -260,7 +467,11 @@ class DataBlock(BaseClass):
     def __setitem__(self, section_name, value):
         if isinstance(section_name,tuple):
             self.set(*section_name,value)
-        self.data[self.mapping.get(section_name)] = value
+            return
+        section = self.mapping.get(section_name)
+        self.data[section] = value
+        if self.recorder is not None:
+            self.recorder.write(self,section,None)
 
     def __delitem__(self, section_name):
         if isinstance(section_name,tuple):
@@ -283,7 +494,7 @@ class DataBlock(BaseClass):
 
     def __setstate__(self, state):
         super(DataBlock,self).__setstate__(state)
-        self.mapping = Mapping.from_state(state)
+        self.mapping = Mapping.from_state(state['mapping'])
 
     def update(self, other):
         if isinstance(other, dict):
@@ -298,13 +509,21 @@ class DataBlock(BaseClass):
         for section in nocopy:
             new.data[section] = self.data[section]
         new.mapping = self.mapping.copy()
+        new.recorder = None
         return new
 
 
 def _make_getter(type_):
 
+    checker = get_type_checker(type_)
+
     def getter(self, section, name, *args, **kwargs):
-        return self.get_type(section,name,type_,*args,**kwargs)
+        value = self.get(section,name,_missing)
+        if value is _missing:
+            return self.get(section,name,*args,**kwargs)
+        if not checker(value):
+            raise BlockError('wrong_type',section,name,type_=type_)
+        return value
 
     return getter
 
@@ -315,6 +534,8 @@ for type_ in ['bool','int','float','string','double','int_array_1d']:
 
 class SectionBlock(object):
 
+    __slots__ = ('block','section')
+
     def __init__(self, block, section):
         self.block = block
         self.section = section
@@ -0,0 +1,422 @@
+"""Caching of module products."""
+
+import os
+import sys
+import json
+import hashlib
+import inspect
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from .. import utils
+from .block import BlockRecorder, is_output
+
+
+_missing = object()
+_identity = object()
+
+
+def _freeze(value):
+    # Return hashable representation of value, None if not possible
+    if isinstance(value,np.ndarray):
+        return (value.dtype.str,value.shape,hash(value.tobytes()))
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
+
+
+def _copy(value):
+    if isinstance(value,np.ndarray):
+        return value.copy()
+    if isinstance(value,dict):
+        return value.copy()
+    return value
+
+
+def _get_value(locator):
+    block,section,name = locator
+    if name is None:
+        return block.data.get(section,_missing)
+    return block.data.get(section,{}).get(name,_missing)
+
+
+def _set_value(locator, value):
+    block,section,name = locator
+    if name is None:
+        block.data[section] = value
+    else:
+        block.data.setdefault(section,{})[name] = value
+
+
+class ExecuteCache(object):
+    """
+    Least-recently-used cache of :meth:`BaseModule.execute` products.
+
+    Products are keyed by the values of the ``data_block`` entries the module depends on.
+    These are either declared (``depends``) or inferred, by recording the entries read by the module
+    (and, for a pipeline, all its submodules) when it is actually executed.
+    Products are the ``data_block`` entries written by the module; they are restored (copied) into ``data_block``
+    when the cache is hit.
+
+    Attributes
+    ----------
+    hits : int
+        Number of calls for which products were restored from the cache.
+
+    misses : int
+        Number of calls for which the module was executed.
+    """
+    logger = logging.getLogger('ExecuteCache')
+
+    def __init__(self, size=1, depends=None):
+        """
+        Initialise :class:`ExecuteCache`.
+
+        Parameters
+        ----------
+        size : int, default=1
+            Maximum number of products to keep in the cache.
+
+        depends : list, default=None
+            List of ``(data_block, section, name)`` the module depends on.
+            If ``None``, inferred at execution time.
+        """
+        self.size = size
+        self.declared = depends is not None
+        self.depends = {BlockRecorder._get_id(*locator):locator for locator in depends or []}
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_key(self):
+        if not self.declared and not self.misses:
+            return None
+        key = []
+        for locator in self.depends.values():
+            value = _freeze(_get_value(locator))
+            if value is None:
+                return None
+            key.append(value)
+        return tuple(key)
+
+    def __call__(self, module, run, *args, **kwargs):
+        """Restore products of ``module`` if its dependencies are unchanged since a previous call, else call ``run(*args, **kwargs)``."""
+        blocks = list(module.data_blocks())
+        parent = blocks[0].recorder
+        key = self.get_key()
+        if key is not None and key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            toret,products = self.entries[key]
+            for locator,value in products:
+                _set_value(locator,_copy(value))
+                if parent is not None: parent.write(*locator)
+            if parent is not None:
+                for locator in self.depends.values(): parent.read(*locator)
+            return toret
+        self.misses += 1
+        recorder = BlockRecorder(parent=parent)
+        for block in blocks: block.recorder = recorder
+        try:
+            toret = run(*args,**kwargs)
+        finally:
+            for block in blocks: block.recorder = parent
+        if not self.declared and not all(ident in self.depends for ident in recorder.reads):
+            self.logger.debug('Updating dependencies of module {}.'.format(module))
+            self.depends.update(recorder.reads)
+            self.clear()
+            return toret
+        if key is not None:
+            self.entries[key] = (toret,[(locator,_copy(_get_value(locator))) for locator in recorder.writes.values()])
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return toret
+
+
+class DependencyTracker(object):
+    """
+    Incremental execution of a sequence of modules.
+
+    When a module is executed, the ``data_block`` entries it reads (declared with option ``depends``, or recorded)
+    and writes (recorded) are saved, which defines a dependency graph between modules:
+    entries written by a previous module of the sequence are internal, other entries are external inputs.
+    On subsequent calls, a module is executed again only if one of its internal inputs was written by a module executed in this call,
+    or if one of its external inputs changed; otherwise, its previous products are set back in ``data_block``
+    (without copy: modules should not modify their inputs in place).
+    External input arrays are compared by identity, which avoids hashing e.g. data vectors and covariance matrices at each call,
+    except outputs filled in place (see :meth:`DataBlock.get_output`), which are compared by value; other inputs are compared by value.
+
+    Attributes
+    ----------
+    ncalls : list
+        Number of executions of each module.
+
+    nskips : list
+        Number of calls for which each module was not executed.
+    """
+    logger = logging.getLogger('DependencyTracker')
+
+    def __init__(self, modules):
+        self.modules = list(modules)
+        self.nodes = [None]*len(self.modules)
+        self.ncalls = [0]*len(self.modules)
+        self.nskips = [0]*len(self.modules)
+
+    def clear(self):
+        self.nodes = [None]*len(self.modules)
+
+    @staticmethod
+    def _get_state(value):
+        # arrays not filled in place are compared by identity only
+        if isinstance(value,np.ndarray) and not is_output(value):
+            return (value,_identity)
+        return (value,_freeze(value))
+
+    @staticmethod
+    def _is_dirty(node, changed):
+        if any(ident in changed for ident in node['internal']):
+            return True
+        for locator,(reference,value) in node['external'].values():
+            current = _get_value(locator)
+            if value is _identity:
+                if current is not reference:
+                    return True
+            elif value is None or _freeze(current) != value:
+                return True
+        return False
+
+    def execute(self, callback=None):
+        """
+        Execute modules whose inputs changed.
+        If provided, ``callback(index, executed)`` is called after each module, with ``executed`` ``False`` if the module was skipped.
+        """
+        changed = set()
+        upstream = set()
+        for index,module in enumerate(self.modules):
+            blocks = list(module.data_blocks())
+            parent = blocks[0].recorder
+            node = self.nodes[index]
+            executed = node is None or self._is_dirty(node,changed)
+            if executed:
+                recorder = BlockRecorder(parent=parent)
+                for block in blocks: block.recorder = recorder
+                try:
+                    module.execute()
+                finally:
+                    for block in blocks: block.recorder = parent
+                depends = module.get_depends()
+                reads = recorder.reads if depends is None else {BlockRecorder._get_id(*locator):locator for locator in depends}
+                node = self.nodes[index] = {'reads':reads,'internal':[ident for ident in reads if ident in upstream],
+                                            'external':{ident:(locator,self._get_state(_get_value(locator))) for ident,locator in reads.items() if ident not in upstream},
+                                            'products':{ident:(locator,_get_value(locator)) for ident,locator in recorder.writes.items()}}
+                changed |= node['products'].keys()
+                self.ncalls[index] += 1
+            else:
+                self.logger.debug('Skipping execution of module {}.'.format(module))
+                for locator,value in node['products'].values():
+                    if value is not _missing: _set_value(locator,value)
+                    if parent is not None: parent.write(*locator)
+                if parent is not None:
+                    for locator in node['reads'].values(): parent.read(*locator)
+                self.nskips[index] += 1
+            upstream |= node['products'].keys()
+            if callback is not None:
+                callback(index,executed)
+
+
+def _digest(value):
+    # Return hexadecimal digest of value, stable across processes (contrary to hash())
+    hasher = hashlib.sha256()
+    if isinstance(value,np.ndarray) and not value.dtype.hasobject:
+        hasher.update(json.dumps([value.dtype.str,value.shape]).encode('utf-8'))
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    else:
+        hasher.update(json.dumps(value,sort_keys=True,default=repr).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class SetupCache(object):
+    """
+    Persistent, on-disk cache of :meth:`BaseModule.setup` products, i.e. the ``data_block`` entries written by the module during setup.
+
+    Entries are keyed by:
+
+      - the signature of the module: class, options, content of the files given as options,
+        options of the configuration sections given as options (e.g. ``data = data1``), and code version;
+      - the values of the ``data_block`` entries read by the module during setup (recorded when the module is actually set up).
+
+    Products (arrays, or json-serializable values) are saved as binary containers (see :mod:`~cosmopipe.data.binary`),
+    and restored as memory-mapped, read-only arrays. The least recently used entries are removed when the total size of the
+    cache directory exceeds ``max_size``.
+    Since only ``data_block`` entries are restored, this only applies to modules whose setup has no other side effect
+    (function-based library modules, or modules with :attr:`BaseModule.setup_cacheable` set to ``True``; not pipelines).
+    Only the file defining the module and the version of cosmopipe and of the package the module belongs to (if it defines ``__version__``)
+    enter the signature: changes to other source files the module imports are not detected; clear the cache after such edits.
+    Inspect or clear the cache with ``python -m cosmopipe.pipeline.setup_cache``.
+
+    Attributes
+    ----------
+    hits : int
+        Number of calls for which products were restored from the cache.
+
+    misses : int
+        Number of calls for which the module was set up.
+    """
+    logger = logging.getLogger('SetupCache')
+    extension = '.cpb'
+
+    def __init__(self, directory, max_size=1e10):
+        """
+        Initialise :class:`SetupCache`.
+
+        Parameters
+        ----------
+        directory : string
+            Cache directory, possibly shared by several modules.
+
+        max_size : float, default=1e10
+            Maximum total size (in bytes) of the cache directory.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = self.misses = 0
+
+    def get_signature(self, module):
+        from ..data.shared import file_hash
+        from ..version import __version__
+
+        def get_options(options):
+            options = {name:value for name,value in options.items() if not name.startswith('setup_cache')}
+            files = {name:file_hash(value) for name,value in options.items() if isinstance(value,str) and os.path.isfile(value)}
+            return {'options':options,'files':files}
+
+        state = {'class':module.__class__.__name__,'version':__version__,'module':get_options(module.options)}
+        library = getattr(module,'get_library',None)
+        library = library().__name__ if library is not None else module.__class__.__module__
+        package = sys.modules.get(library.split('.')[0],None)
+        state['package_version'] = getattr(package,'__version__',None)
+        code = getattr(module,'library_file',None) or inspect.getfile(module.__class__)
+        if code is not None and os.path.isfile(code):
+            state['code'] = file_hash(code)
+        sections = {}
+        for value in dict(module.options.items()).values():
+            if isinstance(value,str) and value != module.name and value in module.config_block:
+                sections[value] = get_options(module.config_block[value])
+        state['sections'] = sections
+        return _digest(state)[:32]
+
+    @staticmethod
+    def get_key(signature, block, reads):
+        return '{}_{}'.format(signature,_digest([_digest(_get_value((block,section,name))) for section,name in reads])[:32])
+
+    def _get_filename(self, name):
+        return os.path.join(self.directory,name)
+
+    def __call__(self, module, run, *args, **kwargs):
+        """Restore setup products of ``module`` if found in the cache, else call ``run(*args, **kwargs)`` and save its products."""
+        from ..data import binary
+        signature = self.get_signature(module)
+        index_fn = self._get_filename(signature + '.json')
+        block = module.data_block
+        if os.path.isfile(index_fn):
+            with open(index_fn,'r') as file:
+                reads = json.load(file)['reads']
+            key = self.get_key(signature,block,reads)
+            entry_fn = self._get_filename(key + self.extension)
+            if os.path.isfile(entry_fn):
+                try:
+                    arrays,meta = binary.load(entry_fn)
+                except (binary.BinaryError,ValueError,OSError) as exc:
+                    self.logger.warning('Could not read setup cache entry {}: {}.'.format(entry_fn,exc))
+                else:
+                    os.utime(entry_fn)
+                    self.hits += 1
+                    self.logger.info('Restoring setup products of module {} from {}.'.format(module,entry_fn))
+                    parent = block.recorder
+                    for index,(section,name,value) in enumerate(meta['products']):
+                        _set_value((block,section,name),arrays.get(str(index),value))
+                        if parent is not None: parent.write(block,section,name)
+                    return meta['toret']
+        self.misses += 1
+        blocks = list(module.data_blocks())
+        parent = blocks[0].recorder
+        recorder = BlockRecorder(parent=parent)
+        for block_ in blocks: block_.recorder = recorder
+        try:
+            toret = run(*args,**kwargs)
+        finally:
+            for block_ in blocks: block_.recorder = parent
+        reads = [[section,name] for block_,section,name in recorder.reads.values() if name is not None]
+        arrays,products = {},[]
+        for block_,section,name in recorder.writes.values():
+            value = _get_value((block_,section,name))
+            if name is None or value is _missing:
+                continue
+            if isinstance(value,np.ndarray) and not value.dtype.hasobject:
+                # arrays are saved in the binary container, under the index of the product
+                arrays[str(len(products))] = value
+                value = None
+            elif isinstance(value,np.generic):
+                value = value.item()
+            products.append([section,name,value])
+        meta = {'module':module.name,'class':module.__class__.__name__,'reads':reads,'products':products,'toret':toret}
+        try:
+            json.dumps(meta)
+        except TypeError:
+            self.logger.warning('Setup products of module {} cannot be saved to the setup cache.'.format(module))
+            return toret
+        key = self.get_key(signature,block,reads)
+        utils.mkdir(self.directory)
+        binary.save(self._get_filename(key + self.extension),arrays,meta=meta)
+        with open(index_fn,'w') as file:
+            json.dump({'module':module.name,'reads':reads},file)
+        self.evict()
+        return toret
+
+    def evict(self):
+        """Remove least recently used entries until the total size of the cache directory is below :attr:`max_size`."""
+        evict(self.directory,max_size=self.max_size)
+
+
+def list_entries(directory):
+    """Return list of setup cache entries in ``directory``, as dictionaries, from the least to the most recently used."""
+    from ..data import binary
+    entries = []
+    if not os.path.isdir(directory):
+        return entries
+    for basename in os.listdir(directory):
+        filename = os.path.join(directory,basename)
+        if not basename.endswith(SetupCache.extension):
+            continue
+        stat = os.stat(filename)
+        entry = {'filename':filename,'size':stat.st_size,'accessed':stat.st_mtime}
+        try:
+            meta = binary.read_buffer(np.memmap(filename,dtype='u1',mode='r'))[1]
+            entry.update({'module':meta['module'],'class':meta['class'],'products':['{}.{}'.format(*product[:2]) for product in meta['products']]})
+        except (binary.BinaryError,ValueError,KeyError,OSError):
+            pass
+        entries.append(entry)
+    return sorted(entries,key=lambda entry: entry['accessed'])
+
+
+def evict(directory, max_size=0):
+    """Remove least recently used setup cache entries in ``directory`` until their total size is below ``max_size`` (0 to clear the cache)."""
+    entries = list_entries(directory)
+    size = sum(entry['size'] for entry in entries)
+    for entry in entries:
+        if size <= max_size:
+            break
+        SetupCache.logger.info('Removing setup cache entry {}.'.format(entry['filename']))
+        os.remove(entry['filename'])
+        size -= entry['size']
+    if max_size <= 0:
+        for basename in os.listdir(directory) if os.path.isdir(directory) else []:
+            if basename.endswith('.json'):
+                os.remove(os.path.join(directory,basename))
+
@@ -1,13 +1,22 @@
 import os
+import ast
+import time
+import json
 import logging
 import importlib
+import importlib.machinery
+
+import numpy as np
 
 from .. import utils
 from ..utils import BaseClass
-from .block import Mapping, DataBlock, SectionBlock
+from .block import Mapping, DataBlock, SectionBlock, BlockRecorder, BlockError
 from . import section_names
 from .config import ConfigBlock
 from .param import ParamBlock
+from .cache import ExecuteCache, DependencyTracker, SetupCache
+from .scheduler import ThreadScheduler
+from .profiler import Profiler, format_report
 
 
 class ModuleError(Exception):
@@ -22,9 +31,46 @@ def _import_pygraphviz():
     return pgv
 
 
+def _find_source(module_name):
+    # Return source file of module module_name, without importing it nor its parent packages; None if not found
+    path,spec = None,None
+    for name in module_name.split('.'):
+        spec = importlib.machinery.PathFinder.find_spec(name,path)
+        if spec is None:
+            return None
+        path = spec.submodule_search_locations
+    return spec.origin
+
+
+def _may_define(filename, name):
+    # Return whether source file filename may define name (e.g. a class), without importing it; True if unsure
+    if filename is None or not filename.endswith('.py'):
+        return True
+    try:
+        with open(filename,'r') as file:
+            tree = ast.parse(file.read(),filename=filename)
+    except (OSError,SyntaxError,ValueError):
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node,ast.ClassDef) and node.name == name:
+            return True
+        if isinstance(node,ast.Name) and node.id == name and isinstance(node.ctx,ast.Store):
+            return True
+        if isinstance(node,(ast.Import,ast.ImportFrom)) and any(alias.name == '*' or (alias.asname or alias.name).split('.')[0] == name for alias in node.names):
+            return True
+    return False
+
+
 class BaseModule(BaseClass):
 
     logger = logging.getLogger('BaseModule')
+    # whether execute() accepts arrays of parameter values (one per point) in section_names.parameters
+    batch = False
+    execute_cache = None
+    setup_cache = None
+    # whether setup() only writes to data_block, such that its products can be restored from a setup cache
+    setup_cacheable = False
+    profiler = None
 
     def __init__(self, name, options=None, config_block=None, data_block=None):
         self.name = name
@@ -32,6 +78,8 @@ class BaseModule(BaseClass):
         self.set_config_block(options=options,config_block=config_block)
         self.set_parameters()
         self.set_data_block(data_block=data_block)
+        self.set_execute_cache()
+        self.set_setup_cache()
 
     def set_config_block(self, options=None, config_block=None):
         self.config_block = ConfigBlock(config_block)
@@ -47,6 +95,7 @@ class BaseModule(BaseClass):
         for param in specific:
             param.add_suffix(self.name)
             mapping[section_names.parameters,param] = (section_names.parameters,param.name)
+        specific.reindex()
         self.parameters.update(specific)
         self._mapping = Mapping(self.options.get_string('mapping',''))
         self._mapping.update(mapping)
@@ -57,6 +106,48 @@ class BaseModule(BaseClass):
         for param in self.parameters:
             self.data_block[section_names.parameters,param.name] = param.value
 
+    def data_blocks(self):
+        """Yield all :class:`DataBlock` instances the module reads from and writes to."""
+        yield self.data_block
+
+    def set_execute_cache(self):
+        """
+        Set up cache of :meth:`execute` products, if option ``cache_size`` is provided.
+        Entries the module depends on can be specified with option ``depends``, e.g.::
+
+            depends = parameters.a parameters.b
+
+        Else, they are inferred from the entries actually read by the module.
+        """
+        size = self.options.get_int('cache_size',0)
+        if size <= 0:
+            self.execute_cache = None
+            return
+        self.execute_cache = ExecuteCache(size=size,depends=self.get_depends())
+
+    def set_setup_cache(self):
+        """
+        Set up persistent cache of :meth:`setup` products, if option ``setup_cache_dir`` (cache directory) is provided,
+        see :class:`SetupCache`. Option ``setup_cache_size`` is the maximum size (in bytes) of the cache directory.
+        Only available for modules whose :meth:`setup` has no side effect beyond ``data_block`` (:attr:`setup_cacheable`),
+        e.g. :class:`LibraryModule`; other module classes may opt in by setting :attr:`setup_cacheable` to ``True``.
+        """
+        directory = self.options.get_string('setup_cache_dir',None)
+        if directory is None:
+            self.setup_cache = None
+            return
+        if not self.setup_cacheable:
+            # e.g. attributes set in setup() would be missing when setup products are restored from the cache
+            raise ModuleError('Setup cache is not available for module {}, whose setup may set attributes beyond data_block.'.format(self))
+        self.setup_cache = SetupCache(directory,max_size=self.options.get_float('setup_cache_size',1e10))
+
+    def get_depends(self):
+        """Return list of ``(data_block, section, name)`` declared with option ``depends``, ``None`` if not provided."""
+        depends = self.options.get_string('depends',None)
+        if depends is not None:
+            depends = [(self.data_block,) + self.data_block.mapping.get(*key.split('.')) for key in depends.split()]
+        return depends
+
     def setup(self):
         raise NotImplementedError
 
@@ -76,15 +167,64 @@ class BaseModule(BaseClass):
                     self.data_block[keyg] = self.data_block[keyl]
                 return toret
 
+            cache = self.execute_cache if name == 'execute' else self.setup_cache
+            if cache is not None:
+                run = wrapper
+
+                def wrapper(*args,**kwargs):
+                    return cache(self,run,*args,**kwargs)
+
+            profiler = self.profiler
+            if profiler is not None:
+                unprofiled = wrapper
+
+                def wrapper(*args,**kwargs):
+                    start = profiler.start()
+                    toret = unprofiled(*args,**kwargs)
+                    profiler.stop(name,start)
+                    return toret
+
             return wrapper
         return super(BaseModule,self).__getattribute__(name)
 
+    def set_profiler(self, profile=True, memory=False):
+        """Enable (``profile = True``) or disable profiling of :meth:`setup` and :meth:`execute`, see :class:`Profiler`."""
+        self.profiler = Profiler(memory=memory) if profile else None
+
+    def profile_report(self):
+        """Return profiling report, as a dictionary."""
+        report = {'name':self.name,'class':self.__class__.__name__,'steps':{}}
+        if self.profiler is not None:
+            report['steps'] = self.profiler.report()
+        if self.execute_cache is not None:
+            report['cache'] = {'hits':self.execute_cache.hits,'misses':self.execute_cache.misses}
+        if self.setup_cache is not None:
+            report['setup_cache'] = {'hits':self.setup_cache.hits,'misses':self.setup_cache.misses}
+        return report
+
+    def log_profile_report(self):
+        for line in format_report(self.profile_report()):
+            self.logger.info(line)
+
+    @utils.savefile
+    def save_profile_report(self, filename):
+        """Save profiling report to ``filename`` (json format)."""
+        with open(filename,'w') as file:
+            json.dump(self.profile_report(),file,indent=2)
+
     def __str__(self):
         return '{} [{}]'.format(self.__class__.__name__,self.name)
 
     @classmethod
     def from_library(cls, name, options=None, config_block=None, data_block=None):
-
+        """
+        Return module ``name`` from library given by option ``module_file`` or ``module_name``.
+
+        If the library defines a :class:`BaseModule` subclass named as option ``module_class`` (default ``Module``), an instance is returned.
+        Else, a :class:`LibraryModule` is returned, which calls functions ``setup``, ``execute``, ``cleanup`` of the library.
+        The library is imported at once only if option ``module_class`` is provided, or if its source may define ``Module``;
+        else, it is imported when first needed, typically in :meth:`setup`.
+        """
         options = options or {}
         base_dir = options.get('base_dir',utils.get_base_dir())
         module_file = options.get('module_file',None)
@@ -95,40 +235,37 @@ class BaseModule(BaseClass):
         if module_file is not None:
             if module_name is not None:
                 raise ModuleError('Failed importing module [{}]. Both module file and module name are provided!'.format(name))
-            filename = os.path.join(base_dir,module_file)
-            cls.logger.info('Importing library {} for module [{}].'.format(filename,name))
-            basename = os.path.basename(filename)
-            impname = os.path.splitext(basename)[0]
-            spec = importlib.util.spec_from_file_location(impname,filename)
-            library = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(library)
-        else:
-            cls.logger.info('Importing module {} for module [{}].'.format(module_name,name))
-            library = importlib.import_module(module_name)
-            impname = module_name.split('.')[-1]
-
-        module_class = options.get('module_class','Module')
-        if hasattr(library,module_class):
-            lib_cls = getattr(library,module_class)
-            if issubclass(lib_cls,BaseModule):
-                return lib_cls(name,options=options,config_block=config_block,data_block=data_block)
-
-        clsname = utils.snake_to_pascal_case(impname)
-        lib_cls = type(clsname,(BaseModule,),{'__init__':BaseModule.__init__, '__doc__':BaseModule.__doc__})
-
-        steps = ['setup','execute','cleanup']
-
-        def _make_func(library,step):
-            f = getattr(library,options.get('{}_function'.format(step),step))
-
-            def func(self):
-                return f(name=self.name,config_block=self.config_block,data_block=self.data_block)
+            filename = source = os.path.join(base_dir,module_file)
+            impname = os.path.splitext(os.path.basename(filename))[0]
 
-            return func
-
-        for step in steps:
-            setattr(lib_cls,step,_make_func(library,step))
+            def load_library():
+                cls.logger.info('Importing library {} for module [{}].'.format(filename,name))
+                spec = importlib.util.spec_from_file_location(impname,filename)
+                library = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(library)
+                return library
 
+        else:
+            impname = module_name.split('.')[-1]
+            source = _find_source(module_name)
+
+            def load_library():
+                cls.logger.info('Importing module {} for module [{}].'.format(module_name,name))
+                return importlib.import_module(module_name)
+
+        clsdict = {'__doc__':LibraryModule.__doc__,'load_library':staticmethod(load_library)}
+        module_class = options.get('module_class',None)
+        if module_class is None and _may_define(source,'Module'):
+            module_class = 'Module'
+        if module_class is not None:
+            library = load_library()
+            if hasattr(library,module_class):
+                lib_cls = getattr(library,module_class)
+                if issubclass(lib_cls,BaseModule):
+                    return lib_cls(name,options=options,config_block=config_block,data_block=data_block)
+            clsdict['_library'] = library
+
+        lib_cls = type(utils.snake_to_pascal_case(impname),(LibraryModule,),clsdict)
         return lib_cls(name,options=options,config_block=config_block,data_block=data_block)
 
     @classmethod
@@ -157,14 +294,73 @@ class BaseModule(BaseClass):
         graph.draw(filename)
 
 
+class LibraryModule(BaseModule):
+    """
+    Module calling functions ``setup``, ``execute`` and ``cleanup`` (or as given by options ``setup_function``, ``execute_function``, ``cleanup_function``)
+    of a library, which is imported when first needed (typically in :meth:`setup`), see :meth:`BaseModule.from_library`.
+    """
+    logger = logging.getLogger('LibraryModule')
+    setup_cacheable = True
+    _library = None
+    _steps = None
+
+    @staticmethod
+    def load_library():
+        raise NotImplementedError
+
+    @classmethod
+    def get_library(cls):
+        """Return library, imported at first call."""
+        if cls._library is None:
+            library = cls.load_library()
+            lib_cls = getattr(library,'Module',None)
+            if isinstance(lib_cls,type) and issubclass(lib_cls,BaseModule):
+                # Module was not found by inspecting the library source in from_library()
+                raise ModuleError('Library {} defines module class Module dynamically; set option module_class = Module.'.format(library.__name__))
+            cls._library = library
+        return cls._library
+
+    @property
+    def batch(self):
+        return getattr(self.get_library(),'batch',False)
+
+    @property
+    def library_file(self):
+        return getattr(self.get_library(),'__file__',None)
+
+    def _set_steps(self):
+        library = self.get_library()
+        self._steps = {step:getattr(library,self.options.get('{}_function'.format(step),step)) for step in ['setup','execute','cleanup']}
+        return self._steps
+
+    def setup(self):
+        return self._set_steps()['setup'](name=self.name,config_block=self.config_block,data_block=self.data_block)
+
+    def execute(self):
+        return (self._steps or self._set_steps())['execute'](name=self.name,config_block=self.config_block,data_block=self.data_block)
+
+    def cleanup(self):
+        return (self._steps or self._set_steps())['cleanup'](name=self.name,config_block=self.config_block,data_block=self.data_block)
+
+
 class BasePipeline(BaseModule):
 
     logger = logging.getLogger('BasePipeline')
+    incremental = False
+    max_workers = 1
+    check_prior = True
 
     def __init__(self, name='main', options=None, config_block=None, data_block=None, modules=None):
         self.modules = modules or []
         super(BasePipeline,self).__init__(name,options=options,config_block=config_block,data_block=data_block)
         self.modules += self._get_modules_from_library(self.options.get_string('modules',default='').split())
+        if self.options.get_bool('profile',False):
+            self.set_profiler(memory=self.options.get_bool('profile_memory',False))
+        if self.options.get_bool('incremental',False):
+            self.set_incremental()
+        self.set_max_workers(self.options.get_int('max_workers',1))
+        self.check_prior = self.options.get_bool('check_prior',True)
+        self.prior_skipped = 0
 
     def set_config_block(self, options=None, config_block=None):
         super(BasePipeline,self).set_config_block(options=options,config_block=config_block)
@@ -178,13 +374,27 @@ class BasePipeline(BaseModule):
         super(BasePipeline,self).set_parameters()
         for module in self:
             self.parameters.update(module.parameters)
+        self._parameter_limits = {}
+
+    def set_setup_cache(self):
+        # pipeline setup has side effects beyond data_block (e.g. attributes of submodules), which cannot be restored from the cache
+        if self.options.has_value('setup_cache_dir'):
+            raise ModuleError('Setup cache is not available for pipeline [{}]; set it for its modules instead.'.format(self.name))
+        self.setup_cache = None
 
     def set_data_block(self, data_block=None):
         super(BasePipeline,self).set_data_block(data_block=data_block)
+        self._parameter_handles = {}
         self.pipe_block = self.data_block.datacopy() # shallow copy
         for module in self:
             module.set_data_block(self.pipe_block)
 
+    def data_blocks(self):
+        yield self.data_block
+        yield self.pipe_block
+        for module in self:
+            yield from module.data_blocks()
+
     def _get_modules_from_library(self, names):
         modules = []
         for name in names:
@@ -195,23 +405,301 @@ class BasePipeline(BaseModule):
     def __iter__(self):
         yield from self.modules
 
+    @property
+    def batch(self):
+        return all(module.batch for module in self)
+
     def setup(self):
+        self.clear_incremental()
         for module in self:
             module.setup()
 
     def execute(self):
+        self.execute_modules(self.modules)
+
+    def set_incremental(self, incremental=True):
+        """
+        Enable (``incremental = True``) or disable incremental execution of this pipeline and all its sub-pipelines:
+        modules are executed only if their inputs changed since the previous call, see :class:`DependencyTracker`.
+        """
+        self.incremental = incremental
+        self._trackers = {}
         for module in self:
+            if isinstance(module,BasePipeline):
+                module.set_incremental(incremental=incremental)
+
+    def set_max_workers(self, max_workers=1):
+        """
+        Set maximum number of threads to execute independent modules of this pipeline concurrently, see :class:`ThreadScheduler`.
+        Incremental execution (:attr:`incremental`) takes precedence.
+        """
+        self.close_schedulers()
+        self.max_workers = max_workers
+
+    def close_schedulers(self):
+        for scheduler in getattr(self,'_schedulers',{}).values():
+            scheduler.close()
+        self._schedulers = {}
+
+    def clear_incremental(self):
+        """Forget products saved for incremental execution and dependencies recorded for concurrent execution, e.g. when modules are set up again."""
+        for tracker in getattr(self,'_trackers',{}).values():
+            tracker.clear()
+        for scheduler in getattr(self,'_schedulers',{}).values():
+            scheduler.clear()
+
+    def execute_modules(self, modules, callback=None):
+        """
+        Execute ``modules`` in turn; if :attr:`incremental`, only those whose inputs changed since the previous call;
+        else if :attr:`max_workers` is larger than 1, independent modules concurrently.
+        If provided, ``callback(index, executed)`` is called after each module, with ``executed`` ``False`` if the module was skipped.
+        """
+        key = tuple(id(module) for module in modules)
+        if self.incremental:
+            if key not in self._trackers:
+                self._trackers[key] = DependencyTracker(modules)
+            self._trackers[key].execute(callback=callback)
+            return
+        if self.max_workers > 1:
+            if key not in self._schedulers:
+                self._schedulers[key] = ThreadScheduler(modules,max_workers=self.max_workers)
+            self._schedulers[key].execute(callback=callback)
+            return
+        for index,module in enumerate(modules):
             module.execute()
+            if callback is not None: callback(index,True)
+
+    def get_parameter_handle(self, names):
+        """Return (cached) :class:`BlockVectorHandle` to set parameters ``names`` of :attr:`data_block` at once."""
+        names = tuple(names)
+        if names not in self._parameter_handles:
+            self._parameter_handles[names] = self.data_block.get_vector_handle(section_names.parameters,names)
+        return self._parameter_handles[names]
+
+    def get_parameter_limits(self, names):
+        """Return (cached) array of prior limits of parameters ``names``, of shape (len(names), 2); infinite for undeclared parameters."""
+        names = tuple(names)
+        if names not in self._parameter_limits:
+            limits = [self.parameters[name].prior.limit if name in self.parameters else (-np.inf,np.inf) for name in names]
+            self._parameter_limits[names] = np.array(limits,dtype='f8').reshape(-1,2)
+        return self._parameter_limits[names]
+
+    def in_prior(self, names, values):
+        """
+        Return whether parameter ``values`` (array of shape (len(names), ...)) lie within the prior limits of parameters ``names``;
+        always ``True`` if :attr:`check_prior` is ``False``.
+        """
+        values = np.asarray(values,dtype='f8')
+        if not self.check_prior:
+            return np.ones(values.shape[1:],dtype='?')[()]
+        limits = self.get_parameter_limits(names).reshape((-1,2) + (1,)*(values.ndim - 1))
+        return np.all((values > limits[:,0]) & (values < limits[:,1]),axis=0)[()]
+
+    def _skip_execute(self, size=1):
+        # point out of prior limits: pipeline is not executed
+        self.prior_skipped += size
+        self.data_block[section_names.likelihood,'loglkl'] = -np.inf
 
     def execute_parameter_values(self, **kwargs):
-        for name,value in kwargs.items():
-            self.data_block[section_names.parameters,name] = value
+        """
+        Execute pipeline for parameter values ``kwargs``.
+        If :attr:`check_prior` and values lie out of the prior limits, the pipeline is not executed and log-likelihood is set to ``-np.inf``.
+        """
+        values = list(kwargs.values())
+        if not self.in_prior(kwargs.keys(),values):
+            self._skip_execute()
+            return
+        self.get_parameter_handle(kwargs.keys()).set(values)
+        self.execute()
+
+    def execute_parameter_vector(self, values, names=None):
+        """
+        Execute pipeline for parameter ``values`` (array), corresponding to parameter ``names`` (defaults to varied parameters).
+        Values are written at once in the parameter section through a pre-resolved handle, see :meth:`get_parameter_handle`.
+        """
+        if names is None:
+            names = self.varied_parameter_names()
+        values = np.asarray(values,dtype='f8')
+        if not self.in_prior(names,values):
+            self._skip_execute()
+            return
+        self.get_parameter_handle(names).set(values)
         self.execute()
 
+    def varied_parameter_names(self):
+        """Return tuple of varied (not fixed) parameter names."""
+        return self.parameters.varied_names
+
+    def execute_batch(self, params):
+        """
+        Execute pipeline for several parameter points at once.
+
+        If all modules are batch-aware (:attr:`batch`), parameter arrays are set in ``data_block`` and the pipeline is executed once.
+        Else, the pipeline is executed for each point in turn.
+        If :attr:`check_prior`, points out of the prior limits are not evaluated; their log-likelihood is ``-np.inf``.
+        Previous (scalar) values of parameters ``params`` are restored in ``data_block`` afterwards.
+
+        Parameters
+        ----------
+        params : dict
+            Dictionary of parameter name: array of values, all of the same size.
+
+        Returns
+        -------
+        loglkl : array
+            Log-likelihood for each point, also set in ``data_block[section_names.likelihood,'loglkl']``.
+        """
+        params = {name:np.asarray(value,dtype='f8') for name,value in params.items()}
+        sizes = [value.size for value in params.values()]
+        if not all(size == sizes[0] for size in sizes):
+            raise ValueError('Input parameters {} have different sizes.'.format(list(params.keys())))
+        size = sizes[0] if sizes else 1
+        handle = self.get_parameter_handle(params.keys())
+        values = np.array([value.ravel() for value in params.values()]).reshape(len(params),size)
+        mask = np.broadcast_to(self.in_prior(params.keys(),values),(size,))
+        loglkl = np.full(size,-np.inf,dtype='f8')
+        self.prior_skipped += size - mask.sum()
+        try:
+            previous = handle.get()
+        except BlockError:
+            previous = None
+        try:
+            if self.batch:
+                if mask.any():
+                    handle.set(list(values[:,mask]))
+                    self.execute()
+                    loglkl[mask] = np.broadcast_to(self.data_block[section_names.likelihood,'loglkl'],(mask.sum(),))
+            else:
+                for ipoint in np.flatnonzero(mask):
+                    handle.set(values[:,ipoint])
+                    self.execute()
+                    loglkl[ipoint] = self.data_block[section_names.likelihood,'loglkl']
+        finally:
+            # such that parameters not passed to a subsequent call are not arrays
+            if previous is not None:
+                handle.set(previous)
+        self.data_block[section_names.likelihood,'loglkl'] = loglkl
+        return loglkl
+
     def cleanup(self):
         for module in self:
             module.cleanup()
+        self.close_schedulers()
         del self.pipe_block
+        if self.profiler is not None and self.options.has_value('profile_fn'):
+            self.save_profile_report(self.options.get_string('profile_fn'))
+
+    def set_profiler(self, profile=True, memory=False):
+        """Enable (``profile = True``) or disable profiling of this pipeline and all its modules."""
+        super(BasePipeline,self).set_profiler(profile=profile,memory=memory)
+        for module in self:
+            module.set_profiler(profile=profile,memory=memory)
+
+    def module_groups(self):
+        """Return dictionary of group name: list of modules, used in :meth:`profile_report`."""
+        return {'modules':self.modules}
+
+    def profile_report(self):
+        report = super(BasePipeline,self).profile_report()
+        if self.check_prior:
+            report['prior'] = {'skipped':int(self.prior_skipped)}
+        report['groups'] = {group:[module.profile_report() for module in modules] for group,modules in self.module_groups().items()}
+        return report
+
+    def leaves(self):
+        """Yield all (non-pipeline) modules of the pipeline tree, depth-first."""
+        for module in self:
+            if isinstance(module,BasePipeline):
+                yield from module.leaves()
+            else:
+                yield module
+
+    def get_leaf_dependencies(self, niterations=1):
+        """
+        Return, for each (non-pipeline) module of the pipeline tree (see :meth:`leaves`), its execution time and the parameters it depends on.
+        Execution time is measured by executing each module ``niterations`` times at the current parameter values (the pipeline modules are executed beforehand).
+        Parameters are those read by the modules, or declared in their ``common_parameters`` or ``specific_parameters``.
+
+        Returns
+        -------
+        modules : list
+            List of modules.
+
+        costs : list
+            Execution time of each module.
+
+        depends : list
+            For each module, set of names of parameters it depends on.
+        """
+        # not self.execute(), which may do more than executing modules (e.g. sampling)
+        self.execute_modules(self.modules)
+        modules,costs,depends = [],[],[]
+        for module in self.leaves():
+            recorder = BlockRecorder()
+            blocks = list(module.data_blocks())
+            cache = module.execute_cache
+            module.execute_cache = None
+            for block in blocks: block.recorder = recorder
+            try:
+                t0 = time.time()
+                for iteration in range(niterations):
+                    module.execute()
+                costs.append((time.time() - t0)/niterations)
+            finally:
+                for block in blocks: block.recorder = None
+                module.execute_cache = cache
+            modules.append(module)
+            depends.append({name for block,section,name in recorder.reads.values() if section == section_names.parameters})
+            depends[-1] |= set(module.parameters.keys())
+        return modules,costs,depends
+
+    def get_parameter_blocks(self, names=None, niterations=1, oversample_power=0.4, dependencies=None):
+        """
+        Group parameters into blocks for fast/slow sampling.
+
+        Parameters read by the same (non-pipeline) modules are grouped together.
+        The cost of a block is the total execution time of these modules, see :meth:`get_leaf_dependencies`.
+
+        Parameters
+        ----------
+        names : list, default=None
+            Parameter names to group. Defaults to varied parameters.
+
+        niterations : int, default=1
+            Number of executions of each module to measure its execution time.
+
+        oversample_power : float, default=0.4
+            Blocks are oversampled by a factor (slowest cost / block cost)**oversample_power, rounded.
+
+        dependencies : tuple, default=None
+            Output of :meth:`get_leaf_dependencies`, if already computed; else, computed with ``niterations``.
+
+        Returns
+        -------
+        blocks : list
+            List of [oversampling factor, list of parameter names], from the slowest to the fastest block.
+        """
+        if names is None:
+            names = list(self.varied_parameter_names())
+        if dependencies is None:
+            dependencies = self.get_leaf_dependencies(niterations=niterations)
+        modules,costs,depends = dependencies
+        groups = {}
+        for name in names:
+            key = frozenset(imodule for imodule,params in enumerate(depends) if name in params)
+            groups.setdefault(key,[]).append(name)
+        blocks = [[sum(costs[imodule] for imodule in key),params] for key,params in groups.items() if key]
+        blocks = sorted(blocks,key=lambda block: block[0],reverse=True)
+        if frozenset() in groups:
+            self.logger.warning('Parameters {} are not read by any module; they are put in the slowest block.'.format(groups[frozenset()]))
+            if blocks: blocks[0][1] += groups[frozenset()]
+            else: blocks = [[0.,groups[frozenset()]]]
+        slowest = blocks[0][0] if blocks else 0.
+        for block in blocks:
+            cost = block[0]
+            block[0] = max(int(round((slowest/cost)**oversample_power)),1) if cost > 0. else 1
+            self.logger.info('Parameters {} take {:.3g} s, oversampled by a factor {:d}.'.format(block[1],cost,block[0]))
+        return blocks
 
     def plot_pipeline_graph(self, filename):
         pgv = _import_pygraphviz()
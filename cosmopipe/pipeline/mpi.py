@@ -0,0 +1,194 @@
+"""
+MPI utilities: evaluation of a pipeline distributed over MPI ranks, and read-only arrays shared by the ranks of a node.
+
+:mod:`mpi4py` is imported only when needed.
+"""
+
+import logging
+import contextlib
+
+import numpy as np
+
+from ..utils import BaseClass
+from . import section_names
+
+# shared-memory windows must outlive the arrays pointing to them
+_windows = []
+# default communicator, see use_comm
+_comm = None
+
+
+def get_mpi():
+    """Return :mod:`mpi4py.MPI`."""
+    try:
+        from mpi4py import MPI
+    except ImportError as e:
+        raise ImportError('Please install mpi4py: see https://mpi4py.readthedocs.io/en/stable/install.html') from e
+    return MPI
+
+
+def get_comm(comm=None):
+    """Return ``comm``, defaulting to the communicator set by :func:`use_comm`, else ``MPI.COMM_WORLD``."""
+    if comm is None:
+        comm = _comm if _comm is not None else get_mpi().COMM_WORLD
+    return comm
+
+
+@contextlib.contextmanager
+def use_comm(comm):
+    """
+    Within this context, :func:`get_comm` (hence e.g. :func:`share_arrays`) defaults to ``comm``,
+    e.g. the communicator of the ranks which actually set up a module.
+    """
+    global _comm
+    previous,_comm = _comm,comm
+    try:
+        yield comm
+    finally:
+        _comm = previous
+
+
+def get_node_comm(comm=None):
+    """Return communicator of the ranks of ``comm`` which live on the same node (hence can share memory)."""
+    MPI = get_mpi()
+    return get_comm(comm).Split_type(MPI.COMM_TYPE_SHARED)
+
+
+def split_range(size, nranks, rank):
+    """Return start, stop indices of the slice of ``range(size)`` attributed to ``rank``, out of ``nranks`` (balanced)."""
+    start = rank*size//nranks
+    stop = (rank + 1)*size//nranks
+    return start,stop
+
+
+def share_arrays(load, comm=None):
+    """
+    Call ``load()`` on the first rank of each node only, and share the arrays it returns with the other ranks of the node
+    through MPI shared-memory windows; must be called by all ranks of ``comm``.
+
+    Parameters
+    ----------
+    load : callable
+        Function returning a dictionary of name: value; (non-object) arrays are shared (read-only), other values are broadcast.
+
+    comm : MPI communicator, default=None
+        Communicator, defaults to that of :func:`get_comm`.
+
+    Returns
+    -------
+    toret : dict
+        Dictionary of name: value; arrays are read-only views of node-shared memory.
+    """
+    MPI = get_mpi()
+    node_comm = get_node_comm(comm)
+    values = load() if node_comm.rank == 0 else None
+    meta,arrays = None,None
+    if node_comm.rank == 0:
+        arrays = {name for name,value in values.items() if isinstance(value,np.ndarray) and not value.dtype.hasobject}
+        meta = {name:(value.dtype.str,value.shape) if name in arrays else value for name,value in values.items()}
+    meta,arrays = node_comm.bcast((meta,arrays),root=0)
+    toret = {}
+    for name,desc in meta.items():
+        if name not in arrays:
+            toret[name] = desc
+            continue
+        dtype,shape = np.dtype(desc[0]),desc[1]
+        nbytes = int(np.prod(shape,dtype='i8'))*dtype.itemsize
+        win = MPI.Win.Allocate_shared(nbytes if node_comm.rank == 0 else 0,dtype.itemsize,comm=node_comm)
+        _windows.append(win)
+        buffer,itemsize = win.Shared_query(0)
+        array = np.ndarray(shape,dtype=dtype,buffer=buffer)
+        if node_comm.rank == 0:
+            array[...] = values[name]
+        node_comm.Barrier()
+        array.flags.writeable = False
+        toret[name] = array
+    return toret
+
+
+def free_windows():
+    """Free all shared-memory windows; arrays returned by :func:`share_arrays` must not be used anymore."""
+    for win in _windows:
+        win.Free()
+    _windows.clear()
+
+
+def _walk(module):
+    yield module
+    for submodule in getattr(module,'modules',[]):
+        yield from _walk(submodule)
+
+
+class MPIEvaluator(BaseClass):
+    """
+    Evaluation of a pipeline (set up on all ranks) for parameter points broadcast by the root rank.
+
+    Points are split over the ranks, each rank evaluates its slice (with :meth:`BasePipeline.execute_batch`), and log-likelihoods are gathered.
+    If the pipeline itself distributes its work over the ranks (e.g. :class:`SumLikelihood` with option ``mpi``),
+    all ranks rather evaluate each point in turn.
+    Typical usage::
+
+        evaluator = MPIEvaluator(pipeline)
+        if evaluator.is_root:
+            loglkl = evaluator.evaluate({'a':a,'b':b}) # e.g. called by the sampler
+            evaluator.stop()
+        else:
+            evaluator.serve()
+    """
+    logger = logging.getLogger('MPIEvaluator')
+
+    def __init__(self, pipeline, comm=None, root=0):
+        """
+        Initialise :class:`MPIEvaluator`.
+
+        Parameters
+        ----------
+        pipeline : BasePipeline
+            Pipeline, set up on all ranks.
+
+        comm : MPI communicator, default=None
+            Communicator, defaults to ``MPI.COMM_WORLD``.
+
+        root : int, default=0
+            Rank which provides parameter points.
+        """
+        self.pipeline = pipeline
+        self.comm = get_comm(comm)
+        self.root = root
+        self.distribute_points = not any(getattr(module,'mpi_comm',None) is not None for module in _walk(pipeline))
+
+    @property
+    def is_root(self):
+        return self.comm.rank == self.root
+
+    def evaluate(self, params=None):
+        """
+        Return log-likelihood of parameter points ``params`` (dictionary of name: array, provided on the root rank); must be called by all ranks.
+        Returns ``None`` (on all ranks) if ``params`` is ``None`` on the root rank, see :meth:`stop`.
+        """
+        params = self.comm.bcast(params if self.is_root else None,root=self.root)
+        if params is None:
+            return None
+        params = {name:np.ravel(value) for name,value in params.items()}
+        size = len(next(iter(params.values()))) if params else 1
+        if not self.distribute_points:
+            loglkl = np.empty(size,dtype='f8')
+            names = list(params.keys())
+            for ipoint in range(size):
+                self.pipeline.execute_parameter_vector([value[ipoint] for value in params.values()],names=names)
+                loglkl[ipoint] = self.pipeline.data_block[section_names.likelihood,'loglkl']
+            return loglkl
+        start,stop = split_range(size,self.comm.size,self.comm.rank)
+        loglkl = np.empty(0,dtype='f8')
+        if stop > start:
+            loglkl = self.pipeline.execute_batch({name:value[start:stop] for name,value in params.items()})
+        return np.concatenate(self.comm.allgather(loglkl))
+
+    def serve(self):
+        """Evaluate points broadcast by the root rank, until it calls :meth:`stop`; to be called on non-root ranks."""
+        while self.evaluate() is not None:
+            pass
+
+    def stop(self):
+        """Stop :meth:`serve` on non-root ranks; to be called on the root rank."""
+        self.comm.bcast(None,root=self.root)
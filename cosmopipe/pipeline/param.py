@@ -14,8 +14,55 @@ class ParamError(Exception):
     pass
 
 
+def get_rngs(seed=None, size=None):
+    """
+    Return random generator seeded by ``seed``, or list of ``size`` independent generators (e.g. one per worker),
+    spawned from ``seed``; streams are reproducible for a given ``seed``.
+    """
+    seeds = np.random.SeedSequence(seed)
+    if size is None:
+        return np.random.default_rng(seeds)
+    return [np.random.default_rng(seed) for seed in seeds.spawn(size)]
+
+
+def _get_ndtr():
+    try:
+        from scipy.special import ndtr, ndtri
+    except ImportError:
+        return None
+    return ndtr,ndtri
+
+
+def _sample_normal(rng, loc, scale, limit, size):
+    # sample normal distributions (loc, scale) truncated to limit = (low, high), broadcast against size
+    loc,scale = np.asarray(loc,dtype='f8'),np.asarray(scale,dtype='f8')
+    a,b = [(np.asarray(lim,dtype='f8') - loc)/scale for lim in limit]
+    funcs = _get_ndtr()
+    if funcs is None:
+        # no scipy: rejection sampling, by batches
+        toret = rng.normal(size=size)
+        mask = (toret <= a) | (toret >= b)
+        while mask.any():
+            toret[mask] = rng.normal(size=mask.sum())
+            mask = (toret <= a) | (toret >= b)
+        return loc + scale*toret
+    ndtr,ndtri = funcs
+    # inverse cdf; sample the left side of the distribution, where ndtr is accurate
+    flip = a > 0
+    a,b = np.where(flip,-b,a),np.where(flip,-a,b)
+    toret = ndtri(rng.uniform(ndtr(a),ndtr(b),size=size))
+    toret = np.clip(toret,a,b)
+    return loc + scale*np.where(flip,-toret,toret)
+
+
 class BaseParamBlock(UserList):
+    """
+    List of :class:`Param`, which can also be indexed by parameter name.
 
+    Names are mapped to list indices by an (insertion-ordered) dictionary, kept up-to-date when parameters are added or removed;
+    call :meth:`reindex` if parameters are modified in place (e.g. renamed, fixed or released).
+    Setting a parameter at an index with the name of another parameter raises :class:`ParamError`.
+    """
     logger = logging.getLogger('BaseParamBlock')
 
     def __init__(self, filename=None, string='', parse=None):
@@ -28,6 +75,12 @@ class BaseParamBlock(UserList):
         self.data = []
         for name,conf in data.items():
             self.data.append(Param(name=name,**conf))
+        self.reindex()
+
+    def reindex(self):
+        """Rebuild name: index mapping, and clear cached arrays (see :meth:`varied_values`)."""
+        self._index = {param.name:index for index,param in enumerate(self.data)}
+        self._cache = {}
 
     def __getitem__(self, name):
         if isinstance(name,str):
@@ -43,22 +96,203 @@ class BaseParamBlock(UserList):
             except ValueError:
                 self.append(item)
                 return
+        if isinstance(name,slice):
+            self.data[name] = item
+            self.reindex()
+            return
+        name = range(len(self.data))[name]
+        old = self.data[name].name
+        if item.name != old and item.name in self._index:
+            raise ParamError('Parameter {} already exists, at index {:d}'.format(item.name,self._index[item.name]))
         self.data[name] = item
+        self._cache = {}
+        if item.name != old:
+            # only the two entries of the renamed parameter change
+            if self._index.get(old,None) == name:
+                del self._index[old]
+            self._index[item.name] = name
+
+    def append(self, item):
+        self._index[item.name] = len(self.data)
+        self.data.append(item)
+        self._cache = {}
+
+    def extend(self, other):
+        for item in other:
+            self.append(item)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __delitem__(self, name):
+        if isinstance(name,str):
+            name = self._get_index(name)
+        del self.data[name]
+        self.reindex()
+
+    def _reindexed(method):
+        # wrap list methods which change indices of parameters
+
+        def wrapper(self, *args, **kwargs):
+            toret = method(self,*args,**kwargs)
+            self.reindex()
+            return toret
+
+        return wrapper
+
+    insert = _reindexed(UserList.insert)
+    pop = _reindexed(UserList.pop)
+    remove = _reindexed(UserList.remove)
+    clear = _reindexed(UserList.clear)
+    sort = _reindexed(UserList.sort)
+    reverse = _reindexed(UserList.reverse)
+    del _reindexed
 
     def keys(self):
         return (item.name for item in self.data)
 
     def _get_index(self, name):
-        return list(self.keys()).index(name)
+        try:
+            return self._index[name]
+        except KeyError:
+            raise ValueError('Parameter {} is not in {}'.format(name,self.__class__.__name__))
 
     def __contains__(self, name):
         if isinstance(name,str):
-            return name in self.keys()
+            return name in self._index
         return name in self.data
 
     def update(self, other):
-        for name in other.keys():
-            self[name] = other[name]
+        for param in other:
+            self[param.name] = param
+
+    def _get_cached(self, name):
+        if name not in self._cache:
+            varied = [param for param in self.data if not param.fixed]
+            self._cache['varied'] = varied
+            self._cache['varied_names'] = tuple(param.name for param in varied)
+            self._cache['varied_values'] = np.array([param.value for param in varied],dtype='f8')
+            self._cache['varied_limits'] = np.array([param.prior.limit for param in varied],dtype='f8').reshape(-1,2)
+            self._cache['fixed'] = np.array([param.fixed for param in self.data],dtype='?')
+        return self._cache[name]
+
+    @property
+    def fixed(self):
+        """Boolean array, ``True`` for fixed parameters (cached)."""
+        return self._get_cached('fixed')
+
+    @property
+    def varied_names(self):
+        """Tuple of varied (not fixed) parameter names (cached)."""
+        return self._get_cached('varied_names')
+
+    @property
+    def varied_values(self):
+        """Array of initial values of varied parameters (cached)."""
+        return self._get_cached('varied_values')
+
+    @property
+    def varied_limits(self):
+        """Array of prior limits of varied parameters, of shape (len(varied_names), 2) (cached)."""
+        return self._get_cached('varied_limits')
+
+    def _get_params(self, names=None):
+        if names is None:
+            return self._get_cached('varied')
+        return [self[name] for name in names]
+
+    def logprior(self, values, names=None):
+        """
+        Return log-prior of parameter points ``values``, array of shape (..., len(names)).
+
+        Parameters
+        ----------
+        values : array
+            Parameter values, last dimension corresponding to ``names``.
+
+        names : list, default=None
+            Parameter names, defaults to varied (not fixed) parameters.
+
+        Returns
+        -------
+        logprior : array
+            Log-prior, of shape ``values.shape[:-1]``; ``-np.inf`` out of limits.
+        """
+        params = self._get_params(names)
+        values = np.asarray(values,dtype='f8')
+        if values.shape[-1:] != (len(params),):
+            raise ParamError('Last dimension of values {} should match number of parameters {:d}'.format(values.shape,len(params)))
+        if names is None:
+            limits = self.varied_limits
+        else:
+            limits = np.array([param.prior.limit for param in params],dtype='f8').reshape(-1,2)
+        isin = np.all((values > limits[:,0]) & (values < limits[:,1]),axis=-1)
+        toret = np.zeros(values.shape[:-1],dtype='f8')
+        # uniform and normal priors as matrix operations; other priors column by column
+        loc,invscale = np.zeros(len(params),dtype='f8'),np.zeros(len(params),dtype='f8')
+        for iparam,param in enumerate(params):
+            prior = param.prior
+            if type(prior) is UniformPrior:
+                toret += prior.norm
+            elif type(prior) is NormalPrior:
+                loc[iparam],invscale[iparam] = prior.loc,1./prior.scale
+                toret -= prior.norm
+            else:
+                toret += np.where(isin,prior(np.where(isin,values[...,iparam],np.mean(prior.limit))),0.)
+        toret -= 0.5*np.sum(((np.where(isin[...,None],values,0.) - loc)*invscale)**2,axis=-1)
+        toret[~isin] = -np.inf
+        return toret[()]
+
+    def sample(self, size=None, names=None, seed=None, rng=None, ref=False):
+        """
+        Sample parameter points from priors.
+
+        Parameters
+        ----------
+        size : int, default=None
+            Number of points; if ``None``, return a single point.
+
+        names : list, default=None
+            Parameter names, defaults to varied (not fixed) parameters.
+
+        seed : int, default=None
+            Random seed, used if ``rng`` is not provided.
+
+        rng : np.random.Generator, np.random.RandomState, default=None
+            Random generator, e.g. one of :func:`get_rngs` (one for each worker).
+
+        ref : bool, default=False
+            If ``True``, sample from reference distributions (e.g. to initialise samplers) rather than priors.
+
+        Returns
+        -------
+        samples : array
+            Array of shape (size, len(names)), or (len(names),) if ``size`` is ``None``.
+        """
+        params = self._get_params(names)
+        if rng is None: rng = get_rngs(seed=seed)
+        priors = [param.ref if ref else param.prior for param in params]
+        nsamples = 1 if size is None else size
+        toret = np.empty((nsamples,len(params)),dtype='f8')
+        for prior in priors:
+            if not prior.proper():
+                raise PriorError('Cannot sample from improper prior')
+        uniform = [iparam for iparam,prior in enumerate(priors) if type(prior) is UniformPrior]
+        normal = [iparam for iparam,prior in enumerate(priors) if type(prior) is NormalPrior]
+        if uniform:
+            limits = np.array([priors[iparam].limit for iparam in uniform],dtype='f8')
+            toret[:,uniform] = rng.uniform(limits[:,0],limits[:,1],size=(nsamples,len(uniform)))
+        if normal:
+            loc,scale = np.array([(priors[iparam].loc,priors[iparam].scale) for iparam in normal],dtype='f8').T
+            limits = np.array([priors[iparam].limit for iparam in normal],dtype='f8').T
+            toret[:,normal] = _sample_normal(rng,loc,scale,limits,size=(nsamples,len(normal)))
+        for iparam,prior in enumerate(priors):
+            if iparam not in uniform and iparam not in normal:
+                toret[:,iparam] = prior.sample(size=nsamples,rng=rng)
+        if size is None:
+            return toret[0]
+        return toret
 
 
 def ParamBlock(filename=None):
@@ -134,7 +368,7 @@ def Prior(prior,limit=None):
         return prior
 
     if prior is None:
-        return UniformPrior()
+        return UniformPrior(*(limit or ()))
 
     args = prior.split()
     cls = args[0].strip()
@@ -183,7 +417,8 @@ class BasePrior(BaseClass):
         return 0
 
     def isin(self, x):
-        return  self.limit[0] < x < self.limit[1]
+        x = np.asarray(x)
+        return ((self.limit[0] < x) & (x < self.limit[1]))[()]
 
     def __call__(self, x):
         raise NotImplementedError
@@ -216,15 +451,13 @@ class UniformPrior(BasePrior):
             self.norm = -np.log(limit[1] - limit[0])
 
     def __call__(self, x):
-        if not self.isin(x):
-            return -np.inf
-        return self.norm
+        return np.where(self.isin(x),self.norm,-np.inf)[()]
 
     def sample(self, size=None, seed=None, rng=None):
         if not self.proper():
             raise PriorError('Cannot sample from improper prior')
-        self.rng = rng or np.random.RandomState(seed=seed)
-        return self.rng.uniform(*self.limit,size=size)
+        if rng is None: rng = get_rngs(seed=seed)
+        return rng.uniform(*self.limit,size=size)
 
     def proper(self):
         return not np.isinf(self.limit).any()
@@ -249,25 +482,18 @@ class NormalPrior(BasePrior):
         def cdf(x):
             return 0.5*(math.erf(x/math.sqrt(2.)) + 1)
 
-        a,b = [(x-self.loc)/self.scale for x in limit]
+        a,b = [(x-self.loc)/self.scale for x in self.limit]
         self.norm = np.log(cdf(b) - cdf(a)) + 0.5*np.log(2*np.pi*self.scale**2)
 
     def __call__(self, x):
-        if not self.isin(x):
-            return -np.inf
-        return -0.5 * ((x-self.loc) / self.scale)**2 - self.norm
+        isin = self.isin(x)
+        x = np.where(isin,x,self.loc)
+        return np.where(isin,-0.5 * ((x-self.loc) / self.scale)**2 - self.norm,-np.inf)[()]
 
     def sample(self, size=None, seed=None, rng=None):
-        self.rng = rng or np.random.RandomState(seed=seed)
-        if self.limit == (-np.inf,np.inf):
-            return self.rng.normal(loc=self.loc,scale=self.scale,size=size)
-        samples = []
-        isscalar = size is None
-        if isscalar: size = 1
-        while len(samples) < size:
-            x = self.rng.normal(loc=self.loc,scale=self.scale)
-            if self.isin(x):
-                samples.append(x)
-        if isscalar:
-            return samples[0]
-        return np.array(samples)
+        """Sample from (truncated) normal distribution, through the inverse cumulative distribution function."""
+        if rng is None: rng = get_rngs(seed=seed)
+        if np.isinf(self.limit).all():
+            return rng.normal(loc=self.loc,scale=self.scale,size=size)
+        toret = _sample_normal(rng,self.loc,self.scale,self.limit,size=size)
+        return toret[()]
@@ -0,0 +1,94 @@
+"""Profiling of module steps."""
+
+import time
+import logging
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+
+class Profiler(object):
+    """
+    Record number of calls, wall time and optionally memory delta of module steps (``setup``, ``execute``).
+
+    >>> profiler = Profiler()
+    >>> start = profiler.start()
+    >>> profiler.stop('execute',start)
+    >>> profiler.report()['execute']['ncalls']
+    1
+    """
+    logger = logging.getLogger('Profiler')
+    percentiles = [50,90,99]
+
+    def __init__(self, memory=False, maxsize=100000):
+        """
+        Initialise :class:`Profiler`.
+
+        Parameters
+        ----------
+        memory : bool, default=False
+            If ``True``, also record memory allocated during each step, with :mod:`tracemalloc`.
+
+        maxsize : int, default=100000
+            Maximum number of wall times kept (the most recent ones) to compute percentiles.
+        """
+        self.memory = memory
+        self.maxsize = maxsize
+        self.steps = {}
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self):
+        memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        return (time.time(),memory)
+
+    def stop(self, step, start):
+        dt = time.time() - start[0]
+        memory = tracemalloc.get_traced_memory()[0] - start[1] if self.memory else None
+        self.add(step,dt,memory=memory)
+
+    def add(self, step, dt, memory=None):
+        """Add call of ``step`` which took ``dt`` seconds and allocated ``memory`` bytes."""
+        stats = self.steps.get(step,None)
+        if stats is None:
+            stats = self.steps[step] = {'ncalls':0,'total':0.,'times':deque(maxlen=self.maxsize),'memory':0}
+        stats['ncalls'] += 1
+        stats['total'] += dt
+        stats['times'].append(dt)
+        if memory is not None:
+            stats['memory'] += memory
+
+    def report(self):
+        """Return dictionary of step: statistics."""
+        toret = {}
+        for step,stats in self.steps.items():
+            times = np.array(stats['times'])
+            toret[step] = report = {'ncalls':stats['ncalls'],'total':stats['total'],'mean':stats['total']/stats['ncalls']}
+            for percentile,value in zip(self.percentiles,np.percentile(times,self.percentiles)):
+                report['p{:d}'.format(percentile)] = value
+            if self.memory:
+                report['memory'] = stats['memory']/stats['ncalls']
+        return toret
+
+
+def format_report(report, indent=0):
+    """Return list of lines describing ``report``, as returned by :meth:`BaseModule.profile_report`."""
+    lines = ['{}{} [{}]'.format(' '*indent,report['class'],report['name'])]
+    for step,stats in report['steps'].items():
+        line = '{}{}: {:d} calls, total {:.4g} s, mean {:.4g} s'.format(' '*(indent+2),step,stats['ncalls'],stats['total'],stats['mean'])
+        line += ', ' + ', '.join('{} {:.4g} s'.format(key,stats[key]) for key in ['p{:d}'.format(p) for p in Profiler.percentiles])
+        if 'memory' in stats:
+            line += ', memory {:.4g} MB'.format(stats['memory']/1e6)
+        lines.append(line)
+    if 'cache' in report:
+        lines.append('{}cache: {:d} hits, {:d} misses'.format(' '*(indent+2),report['cache']['hits'],report['cache']['misses']))
+    if 'setup_cache' in report:
+        lines.append('{}setup cache: {:d} hits, {:d} misses'.format(' '*(indent+2),report['setup_cache']['hits'],report['setup_cache']['misses']))
+    if 'prior' in report:
+        lines.append('{}prior: {:d} evaluations skipped'.format(' '*(indent+2),report['prior']['skipped']))
+    for group in report.get('groups',{}):
+        lines.append('{}{}:'.format(' '*(indent+2),group))
+        for module in report['groups'][group]:
+            lines += format_report(module,indent=indent+4)
+    return lines
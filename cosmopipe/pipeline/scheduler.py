@@ -0,0 +1,127 @@
+"""Concurrent execution of independent modules."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .block import BlockRecorder
+
+
+class ThreadScheduler(object):
+    """
+    Execution of a sequence of modules in a thread pool, following their dependency graph.
+
+    At the first call, modules are executed in turn, and the ``data_block`` entries they read and write are recorded.
+    Module ``j`` then depends on a previous module ``i`` if:
+
+      - ``j`` reads or writes an entry written by ``i``, or writes an entry read by ``i``;
+      - ``i`` or ``j`` writes a whole section (e.g. ``model``), which conflicts with any other module;
+      - ``i`` and ``j`` share a :class:`DataBlock` instance (their recorders would clash).
+
+    On subsequent calls, modules are submitted to the thread pool as soon as all the modules they depend on are executed.
+    Modules are assumed to access the same entries at each call; call :meth:`clear` to record them again.
+    Threads only help if modules release the GIL (e.g. numpy operations on large arrays, compiled codes, I/O).
+
+    Attributes
+    ----------
+    depends : list
+        For each module, set of indices of the previous modules it depends on; ``None`` before the first call.
+    """
+    logger = logging.getLogger('ThreadScheduler')
+
+    def __init__(self, modules, max_workers=1):
+        """
+        Initialise :class:`ThreadScheduler`.
+
+        Parameters
+        ----------
+        modules : list
+            List of modules, in the (valid) serial execution order.
+
+        max_workers : int, default=1
+            Maximum number of threads.
+        """
+        self.modules = list(modules)
+        self.max_workers = max_workers
+        self.executor = None
+        self.clear()
+
+    def clear(self):
+        self.depends = None
+
+    def close(self):
+        """Shut down thread pool."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def record(self, callback=None):
+        """Execute modules in turn, recording entries they read and write to build :attr:`depends`."""
+        reads,writes,blocks,barriers = [],[],[],[]
+        for index,module in enumerate(self.modules):
+            mblocks = list(module.data_blocks())
+            parent = mblocks[0].recorder
+            recorder = BlockRecorder(parent=parent)
+            for block in mblocks: block.recorder = recorder
+            try:
+                module.execute()
+            finally:
+                for block in mblocks: block.recorder = parent
+            # identifiers are computed again, as sections may have been created in the meantime
+            reads.append({BlockRecorder._get_id(*locator) for locator in recorder.reads.values()})
+            writes.append({BlockRecorder._get_id(*locator) for locator in recorder.writes.values()})
+            barriers.append(any(name is None for block,section,name in recorder.writes.values()))
+            blocks.append({id(block) for block in mblocks})
+            if callback is not None:
+                callback(index,True)
+        self.depends = []
+        for jindex in range(len(self.modules)):
+            depends = set()
+            for index in range(jindex):
+                if barriers[index] or barriers[jindex] or blocks[index] & blocks[jindex]\
+                    or writes[index] & (reads[jindex] | writes[jindex]) or reads[index] & writes[jindex]:
+                    depends.add(index)
+            self.depends.append(depends)
+        self.logger.debug('Module dependencies: {}.'.format(self.depends))
+
+    def execute(self, callback=None):
+        """
+        Execute modules, concurrently when independent.
+        If provided, ``callback(index, True)`` is called (in the calling thread) after each module, before modules depending on it are executed.
+        Modules are executed in turn if a recorder is set on their :class:`DataBlock` (e.g. when the calling pipeline is cached).
+        """
+        if not self.modules:
+            return
+        if self.depends is None:
+            self.record(callback=callback)
+            return
+        if self.max_workers <= 1 or any(block.recorder is not None for module in self.modules for block in module.data_blocks()):
+            for index,module in enumerate(self.modules):
+                module.execute()
+                if callback is not None: callback(index,True)
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        remaining = [set(depends) for depends in self.depends]
+        dependents = [[jindex for jindex,depends in enumerate(self.depends) if index in depends] for index in range(len(self.modules))]
+        futures = {}
+
+        def submit(index):
+            futures[self.executor.submit(self.modules[index].execute)] = index
+
+        for index,depends in enumerate(remaining):
+            if not depends: submit(index)
+        try:
+            while futures:
+                done = wait(futures,return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    index = futures.pop(future)
+                    future.result()
+                    if callback is not None: callback(index,True)
+                    for jindex in dependents[index]:
+                        remaining[jindex].discard(index)
+                        if not remaining[jindex]: submit(jindex)
+        except BaseException:
+            # let running modules finish before raising
+            for future in futures: future.cancel()
+            wait(futures)
+            raise
@@ -4,4 +4,5 @@ covariance = 'covariance'
 likelihood = 'likelihood'
 common = 'common'
 parameters = 'parameters'
+samples = 'samples'
 nocopy = ['parameters','likelihood','common']
@@ -0,0 +1,41 @@
+"""
+Command line interface to inspect or clear the setup cache (see :class:`~cosmopipe.pipeline.cache.SetupCache`), e.g.::
+
+    python -m cosmopipe.pipeline.setup_cache list path/to/cache
+    python -m cosmopipe.pipeline.setup_cache clear path/to/cache
+"""
+
+import time
+import argparse
+
+from cosmopipe.utils import setup_logging
+from cosmopipe.pipeline import cache
+
+
+def main(args=None):
+    """Inspect or clear setup cache."""
+    parser = argparse.ArgumentParser(description=main.__doc__,formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('action', type=str, choices=['list','clear','evict'],
+                        help='List entries, remove all entries, or remove least recently used entries beyond --max-size')
+    parser.add_argument('directory', type=str,
+                        help='Setup cache directory')
+    parser.add_argument('--max-size', type=float, default=1e10,
+                        help='Maximum total size (in bytes) of the cache directory, for action evict')
+    opt = parser.parse_args(args=args)
+    if opt.action == 'list':
+        entries = cache.list_entries(opt.directory)
+        for entry in entries:
+            print('{} [{}] {:.4g} MB, last used {}: {}'.format(entry.get('class',''),entry.get('module',''),entry['size']/1e6,
+                                                            time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(entry['accessed'])),
+                                                            ' '.join(entry.get('products',[]))))
+        print('{:d} entries, {:.4g} MB in total.'.format(len(entries),sum(entry['size'] for entry in entries)/1e6))
+    elif opt.action == 'clear':
+        cache.evict(opt.directory,max_size=0)
+    else:
+        cache.evict(opt.directory,max_size=opt.max_size)
+
+
+if __name__ == '__main__':
+
+    setup_logging()
+    main()
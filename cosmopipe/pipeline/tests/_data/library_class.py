@@ -0,0 +1,7 @@
+from cosmopipe.pipeline import BaseModule
+
+
+class Module(BaseModule):
+
+    def setup(self):
+        self.data_block["test","value"] = 1
@@ -0,0 +1,5 @@
+def setup(name, config_block, data_block):
+    data_block["test","value"] = 2
+
+
+execute = cleanup = setup
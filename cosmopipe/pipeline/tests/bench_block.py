@@ -0,0 +1,108 @@
+"""
+Microbenchmark of :class:`DataBlock` accessors against the legacy implementation.
+
+Run from this directory with ``python bench_block.py [ncalls]``.
+"""
+
+import re
+import sys
+import timeit
+
+import numpy as np
+
+from cosmopipe.pipeline import DataBlock, section_names
+from cosmopipe.pipeline.block import BlockError
+
+
+class LegacyDataBlock(DataBlock):
+
+    def get_type(self, section, name, type_, *args, **kwargs):
+
+        if not self.has_value(section,name):
+            return self.get(section,name,*args,**kwargs)
+
+        value = self.get(section,name)
+        convert = {'double':'float','string':'str'}
+
+        def get_type_from_str(type_):
+            return __builtins__.get(type_,None) if isinstance(__builtins__,dict) else getattr(__builtins__,type_,None)
+
+        def get_nptype_from_str(type_):
+            return {'bool':np.bool_,'int':np.integer,'float':np.floating,'str':np.character}.get(type_,None)
+
+        error = BlockError('wrong_type',section,name,type_=str(type_))
+        if isinstance(type_,str):
+            type_ = convert.get(type_,type_)
+            type_py = get_type_from_str(type_)
+            if type_py is not None:
+                if not isinstance(value,type_py):
+                    raise error
+            else:
+                match = re.match('(.*)_array_(.*)d',type_)
+                if match is None:
+                    raise error
+                ndim,type_ = int(match.group(2)),match.group(1)
+                if isinstance(value,list):
+                    type_py = get_type_from_str(type_)
+                    if type_py is None or not isinstance(value[0],type_py):
+                        raise error
+                else:
+                    type_np = get_nptype_from_str(type_)
+                    if type_np is None or not np.issubdtype(value.dtype,type_np) or not value.ndim == ndim:
+                        raise error
+        elif not isinstance(value,type_):
+            raise error
+        return value
+
+    def get(self, section, name, *args, **kwargs):
+        if self.recorder is not None:
+            self.recorder.read(self,*self.mapping.get(section,name))
+        if self.has_value(section,name):
+            section,name = self.mapping.get(section,name)
+            return self.data[section][name]
+        if 'default' in kwargs:
+            return kwargs['default']
+        if len(args):
+            return args[0]
+        raise BlockError('get_notfound',section,name)
+
+    def set(self, section, name, value):
+        section,name = self.mapping.get(section,name)
+        if section not in self.sections():
+            self.data[section] = {}
+        self.data[section][name] = value
+        if self.recorder is not None:
+            self.recorder.write(self,section,name)
+
+    def has_value(self, section, name):
+        section,name = self.mapping.get(section,name)
+        return section in self.data and name in self.data[section]
+
+    def get_float(self, section, name, *args, **kwargs):
+        return self.get_type(section,name,'float',*args,**kwargs)
+
+    def get_int_array_1d(self, section, name, *args, **kwargs):
+        return self.get_type(section,name,'int_array_1d',*args,**kwargs)
+
+
+def bench(ncalls=100000):
+    data = {(section_names.parameters,'a'):1.,(section_names.data,'index'):np.arange(10)}
+    mapping = {(section_names.parameters,'b'):(section_names.parameters,'a')}
+    statements = {'get':"block.get(section_names.parameters,'a')",
+                  'get (mapped)':"block.get(section_names.parameters,'b')",
+                  'get (default)':"block.get(section_names.parameters,'c',None)",
+                  'get_float':"block.get_float(section_names.parameters,'a')",
+                  'get_int_array_1d':"block.get_int_array_1d(section_names.data,'index')",
+                  'set':"block.set(section_names.parameters,'a',2.)"}
+    for label,statement in statements.items():
+        times = []
+        for cls in [LegacyDataBlock,DataBlock]:
+            block = cls(mapping=mapping)
+            for key,value in data.items(): block[key] = value
+            times.append(min(timeit.repeat(statement,globals={'block':block,'section_names':section_names},number=ncalls,repeat=5))/ncalls)
+        print('{:<20} legacy {:.3g} us, new {:.3g} us (x{:.1f}).'.format(label,times[0]*1e6,times[1]*1e6,times[0]/times[1]))
+
+
+if __name__ == '__main__':
+
+    bench(ncalls=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,56 @@
+"""
+Benchmark of the import time of cosmopipe and of the construction of a pipeline (before setup), each in a fresh interpreter.
+
+Run from this directory with ``python bench_import.py [nrepeats]``.
+"""
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+
+scripts = {}
+scripts['import'] = '''
+import time
+t0 = time.time()
+import cosmopipe.pipeline, cosmopipe.data, cosmopipe.likelihood, cosmopipe.theory
+print(time.time() - t0)
+'''
+scripts['import (numpy only)'] = '''
+import time
+t0 = time.time()
+import numpy
+print(time.time() - t0)
+'''
+scripts['import + matplotlib'] = '''
+import time
+t0 = time.time()
+import cosmopipe.pipeline, cosmopipe.data, cosmopipe.likelihood, cosmopipe.theory
+from matplotlib import pyplot
+print(time.time() - t0)
+'''
+scripts['pipeline'] = '''
+import os, time
+t0 = time.time()
+from cosmopipe.pipeline import BasePipeline
+os.chdir({!r})
+pipeline = BasePipeline(config_block=os.path.join('demos','demo2.ini'))
+print(time.time() - t0)
+'''.format(base_dir)
+
+
+def run(script, nrepeats=5):
+    env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.join(base_dir,'..','..','..')] + sys.path))
+    times = [float(subprocess.run([sys.executable,'-c',script],env=env,capture_output=True,check=True).stdout.split()[-1]) for i in range(nrepeats)]
+    return np.min(times),np.median(times)
+
+
+if __name__ == '__main__':
+
+    nrepeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name,script in scripts.items():
+        print('{:<25} min {:.4f} s, median {:.4f} s'.format(name,*run(script,nrepeats=nrepeats)))
@@ -0,0 +1,64 @@
+"""
+Benchmark of vectorized :meth:`BaseParamBlock.logprior` and :meth:`BaseParamBlock.sample` against per-point, per-parameter loops.
+
+Run from this directory with ``python bench_prior.py [npoints]``.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from cosmopipe.pipeline.param import BaseParamBlock, Param
+
+
+def get_parameters(nparams=10):
+    parameters = BaseParamBlock()
+    for iparam in range(nparams):
+        name = 'p{:d}'.format(iparam)
+        if iparam % 2:
+            parameters[name] = Param(name=name,value=0.,prior='normal 0. 1.',limit=[-0.5,2.])
+        else:
+            parameters[name] = Param(name=name,prior='uniform -1. 1.')
+    return parameters
+
+
+def legacy_sample(parameters, size, seed=42):
+    rng = np.random.RandomState(seed=seed)
+    toret = []
+    for param in parameters:
+        prior = param.prior
+        if hasattr(prior,'loc'):
+            samples = []
+            while len(samples) < size:
+                x = rng.normal(loc=prior.loc,scale=prior.scale)
+                if prior.limit[0] < x < prior.limit[1]:
+                    samples.append(x)
+            toret.append(samples)
+        else:
+            toret.append(rng.uniform(*prior.limit,size=size))
+    return np.array(toret).T
+
+
+def legacy_logprior(parameters, values):
+    return np.array([sum(float(param.prior(value)) for param,value in zip(parameters,point)) for point in values])
+
+
+if __name__ == '__main__':
+
+    npoints = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    parameters = get_parameters()
+    t0 = time.time()
+    samples = legacy_sample(parameters,npoints)
+    t1 = time.time()
+    samples = parameters.sample(npoints,seed=42)
+    t2 = time.time()
+    print('sample {:d} points: legacy {:.4g} s, vectorized {:.4g} s'.format(npoints,t1-t0,t2-t1))
+    nlegacy = min(npoints,10000)
+    t0 = time.time()
+    ref = legacy_logprior(parameters,samples[:nlegacy])
+    t1 = time.time()
+    logprior = parameters.logprior(samples)
+    t2 = time.time()
+    assert np.allclose(logprior[:nlegacy],ref)
+    print('logprior of {:d} points: legacy {:.4g} s (extrapolated from {:d} points), vectorized {:.4g} s'.format(npoints,(t1-t0)*npoints/nlegacy,nlegacy,t2-t1))
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from cosmopipe.pipeline import BasePipeline, ConfigBlock
+from cosmopipe.pipeline import mpi
+from cosmopipe.utils import setup_logging
+
+from cosmopipe.data.tests.test_data import make_data_covariance
+
+MPI = pytest.importorskip('mpi4py.MPI')
+
+# run with e.g.: mpiexec -np 3 python test_mpi.py
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.join(base_dir,'_data')
+demo_dir = os.path.join(base_dir,'demos')
+data_fn = os.path.join(data_dir,'data_{:d}.txt')
+covariance_fn = os.path.join(data_dir,'covariance.txt')
+
+
+def make_data(comm):
+    if comm.rank == 0:
+        mapping_proj = ['ell_0','ell_2','ell_4']
+        make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    comm.Barrier()
+
+
+def test_share_arrays():
+
+    comm = MPI.COMM_WORLD
+    arrays = mpi.share_arrays(lambda: {'a':np.arange(10.),'b':np.array(['x','y']),'c':2},comm=comm)
+    assert np.all(arrays['a'] == np.arange(10.)) and np.all(arrays['b'] == ['x','y']) and arrays['c'] == 2
+    assert not arrays['a'].flags.writeable
+    mpi.free_windows()
+
+
+def test_evaluator():
+
+    os.chdir(base_dir)
+    comm = MPI.COMM_WORLD
+    make_data(comm)
+    values = np.linspace(-1.,4.,7)
+    config_fn = os.path.join(demo_dir,'demo2.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    ref = pipeline.execute_batch({'a':values})
+    pipeline.cleanup()
+
+    shared = {('data1','mpi_shared'):True,('cov1','mpi_shared'):True}
+    # with option mpi, like1 and like2 are set up on different ranks, and only like1 shares its arrays
+    for options in [{},{('like','mpi'):True},shared,{('like','mpi'):True,**shared}]:
+        config_block = ConfigBlock(config_fn)
+        for key,value in options.items():
+            config_block[key] = value
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        evaluator = mpi.MPIEvaluator(pipeline,comm=comm)
+        assert evaluator.distribute_points == (('like','mpi') not in options or comm.size == 1)
+        if evaluator.is_root:
+            assert np.allclose(evaluator.evaluate({'a':values}),ref)
+            assert np.allclose(evaluator.evaluate({'a':values[:1]}),ref[:1])
+            evaluator.stop()
+        else:
+            evaluator.serve()
+        pipeline.cleanup()
+    mpi.free_windows()
+
+
+if __name__ == '__main__':
+
+    setup_logging()
+    test_share_arrays()
+    test_evaluator()
@@ -1,11 +1,23 @@
 import os
+import sys
+import json
+import subprocess
 import yaml
+import pickle
 
-from cosmopipe.pipeline import BaseModule, BasePipeline, ConfigBlock, SectionBlock, BlockError, section_names
+import numpy as np
+
+from cosmopipe.pipeline import BaseModule, BasePipeline, ConfigBlock, DataBlock, SectionBlock, BlockError, section_names
+from cosmopipe.pipeline.module import ModuleError, LibraryModule
+from cosmopipe.pipeline.block import is_output
+from cosmopipe.pipeline.param import ParamBlock, Param, ParamError, NormalPrior, get_rngs
 from cosmopipe.theory import FlatModel
-from cosmopipe.likelihood import BaseLikelihood, JointGaussianLikelihood
+from cosmopipe.likelihood import BaseLikelihood, GaussianLikelihood, JointGaussianLikelihood
+from cosmopipe import utils
 from cosmopipe.utils import setup_logging
+from cosmopipe.main import main
 
+from cosmopipe.data import DataVector, CovarianceMatrix
 from cosmopipe.data.tests.test_data import make_data_covariance
 
 
@@ -143,6 +155,648 @@ def test_demo4():
     pipeline.cleanup()
 
 
+def test_batch():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    values = np.linspace(-1.,4.,5)
+
+    for demo in ['demo1','demo2','demo3']:
+        config_fn = os.path.join(demo_dir,'{}.ini'.format(demo))
+        pipeline = BasePipeline(config_block=config_fn)
+        assert pipeline.batch
+        pipeline.setup()
+        pipeline.execute_parameter_values(a=values[0])
+        loglkl = pipeline.execute_batch({'a':values})
+        assert loglkl.shape == values.shape
+        # previous scalar value of a is restored
+        pipeline.execute_parameter_values()
+        assert np.ndim(pipeline.data_block[section_names.likelihood,'loglkl']) == 0
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],loglkl[0])
+        for value,ref in zip(values,loglkl):
+            pipeline.execute_parameter_values(a=value)
+            assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+        pipeline.cleanup()
+
+    class LoopFlatModel(FlatModel):
+
+        batch = False
+
+    config_block = ConfigBlock(os.path.join(demo_dir,'demo1.ini'))
+    data = BaseModule.from_library(name='data',options=SectionBlock(config_block,'data'))
+    cov = BaseModule.from_library(name='cov',options=SectionBlock(config_block,'cov'))
+    like = GaussianLikelihood(name='like',modules=[data,LoopFlatModel(name='model'),cov])
+    pipeline = BasePipeline(modules=[like])
+    assert not pipeline.batch
+    pipeline.setup()
+    loglkl = pipeline.execute_batch({'a':values})
+    for value,ref in zip(values,loglkl):
+        pipeline.execute_parameter_values(a=value)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+    pipeline.cleanup()
+
+
+def test_cholesky():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    values = np.linspace(-1.,4.,5)
+
+    for demo in ['demo1','demo3']:
+        config_fn = os.path.join(demo_dir,'{}.ini'.format(demo))
+        pipeline = BasePipeline(config_block=config_fn)
+        pipeline.setup()
+        ref = pipeline.execute_batch({'a':values})
+        pipeline.cleanup()
+        config_block = ConfigBlock(config_fn)
+        config_block['like','solver'] = 'cholesky'
+        config_block['cov','invcov'] = False
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        assert (section_names.covariance,'invcov') not in pipeline.modules[0].pipe_block
+        assert np.isfinite(pipeline.modules[0].logdet)
+        assert np.allclose(pipeline.execute_batch({'a':values}),ref)
+        pipeline.execute_parameter_values(a=values[0])
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref[0])
+        pipeline.cleanup()
+
+
+class PositiveFlatModel(FlatModel):
+
+    def execute(self):
+        if np.any(np.asarray(self.handle_a.get()) < 0.):
+            raise ValueError('a should be positive')
+        super(PositiveFlatModel,self).execute()
+
+
+def test_sum_nprocs():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    values = np.linspace(-1.,4.,5)
+
+    config_fn = os.path.join(demo_dir,'demo2.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    ref = pipeline.execute_batch({'a':values})
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    config_block['like','nprocs'] = 2
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    assert np.allclose(pipeline.execute_batch({'a':values}),ref)
+    for value,loglkl in zip(values,ref):
+        pipeline.execute_parameter_values(a=value)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],loglkl)
+    assert all(timing[0] == len(values) + 1 for timing in pipeline.modules[0].timings.values())
+    pipeline.cleanup()
+
+    # model1 fails for negative a: the reply of the other worker must not be read at the next call
+    config_block['model1','module_name'] = 'cosmopipe.pipeline.tests.test_pipeline'
+    config_block['model1','module_class'] = 'PositiveFlatModel'
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    for value,loglkl in zip(values,ref):
+        if value < 0.:
+            try:
+                pipeline.execute_parameter_values(a=value)
+            except ModuleError as exc:
+                assert 'like1' in str(exc)
+            else:
+                raise AssertionError('ModuleError should be raised for a = {}'.format(value))
+        else:
+            pipeline.execute_parameter_values(a=value)
+            assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],loglkl)
+    pipeline.cleanup()
+
+
+def test_execute_cache():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    points = [(0.,1.),(0.,2.),(1.,2.),(0.,1.),(0.,2.)]
+
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    refs = []
+    for a,b in points:
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        refs.append(pipeline.data_block[section_names.likelihood,'loglkl'])
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    for name in ['model1','model2','like']:
+        config_block[name,'cache_size'] = 4
+    config_block['model2','depends'] = 'parameters.a'
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    for (a,b),ref in zip(points,refs):
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+    like = pipeline.modules[0]
+    model1,model2 = [module.modules[1] for module in like.join]
+    # first point is used to infer dependencies of model1 and like
+    assert (model1.execute_cache.hits,model1.execute_cache.misses) == (0,4)
+    assert (model2.execute_cache.hits,model2.execute_cache.misses) == (2,2)
+    assert (like.execute_cache.hits,like.execute_cache.misses) == (1,4)
+    pipeline.cleanup()
+
+
+def test_parameter_blocks():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    blocks = pipeline.get_parameter_blocks(names=['a','b_model1'],niterations=2)
+    assert [block[1] for block in blocks] == [['a'],['b_model1']]
+    assert blocks[0][0] == 1 and blocks[1][0] >= 1
+    pipeline.cleanup()
+
+
+def test_profile():
+
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_block = ConfigBlock(os.path.join(demo_dir,'demo3.ini'))
+    profile_fn = os.path.join(data_dir,'profile.json')
+    config_block['main','profile'] = True
+    config_block['main','profile_memory'] = True
+    config_block['main','profile_fn'] = profile_fn
+    config_block['model1','cache_size'] = 2
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    for a in [0.,1.,1.]:
+        pipeline.execute_parameter_values(a=a)
+    report = pipeline.profile_report()
+    like = report['groups']['modules'][0]
+    assert like['steps']['execute']['ncalls'] == 3
+    assert like['steps']['setup']['ncalls'] == 1
+    assert [module['name'] for module in like['groups']['join']] == ['like1','like2']
+    assert [module['name'] for module in like['groups']['after']] == ['cov']
+    model1 = like['groups']['join'][0]['groups']['modules'][1]
+    assert model1['cache'] == {'hits':1,'misses':2}
+    assert 'memory' in model1['steps']['execute']
+    pipeline.log_profile_report()
+    pipeline.cleanup()
+    with open(profile_fn,'r') as file:
+        assert json.load(file)['name'] == 'main'
+
+    os.chdir(base_dir)
+    main(config=os.path.join(demo_dir,'demo4.ini'),profile=True)
+
+
+def test_binary():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo1.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    values = np.linspace(-1.,4.,5)
+    ref = pipeline.execute_batch({'a':values})
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    data = DataVector.load_txt(data_fn.format(0),mapping_proj=mapping_proj)
+    cov = CovarianceMatrix.load_txt(covariance_fn,data=data,mapping_header={'nobs':'.*?Nobs: (.*)'})
+    config_block['data','data_file'] = os.path.join(data_dir,'data_0.cpb')
+    config_block['cov','covariance_file'] = os.path.join(data_dir,'covariance.cpb')
+    data.save_binary(config_block['data','data_file'])
+    cov.save_binary(config_block['cov','covariance_file'])
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    assert np.allclose(pipeline.execute_batch({'a':values}),ref)
+    pipeline.cleanup()
+
+
+def test_data_block():
+
+    data_block = DataBlock(mapping={('section1','alias'):('section1','name1')})
+    data_block['section1','name1'] = 1.
+    data_block['section1','array'] = np.arange(4)
+    data_block['section1','list'] = ['a','b']
+    assert data_block.get_float('section1','alias') == 1.
+    assert data_block.get_double('section1','name2',2.) == 2.
+    assert data_block.get_type('section1','array','int_array_1d').size == 4
+    assert data_block.get_type('section1','list','string_array_1d') == ['a','b']
+    assert data_block.get_type('section1','name1',float) == 1.
+    for name,type_ in [('name1','int'),('array','float_array_1d'),('array','int_array_2d'),('list','int_array_1d'),('name1','unknown')]:
+        try:
+            data_block.get_type('section1',name,type_)
+        except BlockError as exc:
+            assert exc.type_ == type_ and name in str(exc)
+        else:
+            raise AssertionError('BlockError should have been raised for {} of type {}'.format(name,type_))
+    assert data_block.has_value('section1','alias') and not data_block.has_value('section2','name1')
+    options = SectionBlock(data_block,'section1')
+    assert options.get_int('name2',3) == 3
+    data_block2 = pickle.loads(pickle.dumps(data_block))
+    assert data_block2['section1','alias'] == 1. and data_block2.mapping.get('section1','alias') == ('section1','name1')
+
+
+def test_handles():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    assert not pipeline.varied_parameter_names()
+    names = ('a','b_model1')
+    for values in [[0.,1.],[1.,2.]]:
+        pipeline.execute_parameter_values(**dict(zip(names,values)))
+        ref = pipeline.data_block[section_names.likelihood,'loglkl']
+        pipeline.execute_parameter_values(**dict(zip(names,[-1.,-1.])))
+        pipeline.execute_parameter_vector(np.array(values),names=names)
+        assert pipeline.data_block[section_names.likelihood,'loglkl'] == ref
+        assert np.all(pipeline.data_block.get_vector_handle(section_names.parameters,names).get() == values)
+    assert pipeline.get_parameter_handle(names) is pipeline.get_parameter_handle(list(names))
+    # handle resolves specific parameter b of model1 to b_model1
+    model1 = pipeline.modules[0].join[0].modules[1]
+    assert model1.handle_b.name == 'b_model1' and model1.handle_b.get() == 2.
+    handle = model1.data_block.get_handle(section_names.parameters,'c')
+    assert handle.get(None) is None
+    pipeline.cleanup()
+
+
+def test_incremental():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    points = [(0.,1.),(0.,2.),(1.,2.),(0.,1.),(0.,2.)]
+
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    refs = []
+    for a,b in points:
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        refs.append(pipeline.data_block[section_names.likelihood,'loglkl'])
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    config_block['main','incremental'] = True
+    pipeline = BasePipeline(config_block=config_block)
+    like = pipeline.modules[0]
+    assert like.incremental and like.join[0].incremental
+    pipeline.setup()
+    for (a,b),ref in zip(points,refs):
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+        assert like.model.shape == like.data.shape
+    trackers = {tuple(tracker.modules):tracker for tracker in like._trackers.values()}
+    # like1 depends on a and b_model1, like2 on a only, cov on nothing
+    assert trackers[tuple(like.join)].ncalls == [5,3] and trackers[tuple(like.join)].nskips == [0,2]
+    assert trackers[tuple(like.after)].ncalls == [1]
+    like1 = like.join[0]
+    assert [tracker.ncalls for tracker in like1._trackers.values()] == [[1,5]]
+    # input arrays are compared by identity (not hashed), except outputs filled in place
+    from cosmopipe.pipeline import cache
+    freeze,hashed = cache._freeze,[]
+    cache._freeze = lambda value: hashed.append(value) or freeze(value)
+    try:
+        pipeline.execute_parameter_values(a=0.,b_model1=1.)
+    finally:
+        cache._freeze = freeze
+    assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],refs[0])
+    arrays = [value for value in hashed if isinstance(value,np.ndarray)]
+    assert all(is_output(value) for value in arrays)
+    pipeline.cleanup()
+
+
+def test_joint_buffer():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    points = [(0.,1.),(0.,2.),(1.,2.)]
+    for incremental in [False,True]:
+        config_block = ConfigBlock(config_fn)
+        config_block['main','incremental'] = incremental
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        like = pipeline.modules[0]
+        like1,like2 = like.join
+        buffers = []
+        for a,b in points:
+            pipeline.execute_parameter_values(a=a,b_model1=b)
+            model = like.pipe_block[section_names.model,'y']
+            buffers.append(model)
+            x = like1.pipe_block[section_names.data,'x']
+            ref = np.concatenate([a + b*x,np.full(like2.data.size,a)])
+            assert np.allclose(model,ref) and np.allclose(like.model,ref)
+            assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],-0.5*(ref-like.data).dot(like.precision).dot(ref-like.data))
+        # model is preallocated, and updated in place
+        assert all(buffer is buffers[0] for buffer in buffers)
+        pipeline.cleanup()
+
+    # batch mode: shape changes, hence buffers are reallocated
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    loglkl = pipeline.execute_batch({'a':np.linspace(0.,1.,3),'b_model1':np.linspace(1.,2.,3)})
+    for a,b,ref in zip(np.linspace(0.,1.,3),np.linspace(1.,2.,3),loglkl):
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+    pipeline.cleanup()
+
+
+def test_scheduler():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_fn = os.path.join(demo_dir,'demo4.ini')
+    points = [(0.,1.),(0.,2.),(1.,2.)]
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    refs = []
+    for a,b in points:
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        refs.append(pipeline.data_block[section_names.likelihood,'loglkl'])
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    config_block['like','max_workers'] = 2
+    config_block['like1','max_workers'] = 2
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    like = pipeline.modules[0]
+    for a,b in points*2:
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+    for (a,b),ref in zip(points,refs):
+        pipeline.execute_parameter_values(a=a,b_model1=b)
+        assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],ref)
+    # join members are independent
+    assert like._schedulers[tuple(id(module) for module in like.join)].depends == [set(),set()]
+    pipeline.cleanup()
+
+
+def test_shared_memory():
+
+    from cosmopipe.data import shared
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    values = np.linspace(-1.,4.,5)
+    config_fn = os.path.join(demo_dir,'demo2.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    ref = pipeline.execute_batch({'a':values})
+    pipeline.cleanup()
+
+    config_block = ConfigBlock(config_fn)
+    for name in ['data1','cov1','data2','cov2']:
+        config_block[name,'shared_memory'] = True
+    keys = set(shared._segments)
+    for i in range(2):
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        assert np.allclose(pipeline.execute_batch({'a':values}),ref)
+        pipeline.cleanup()
+    keys = set(shared._segments) - keys
+    # data1 and data2 read the same file, but differ by xlim (hence cov1 and cov2 too)
+    assert len(keys) == 4
+    shared.unlink(keys)
+
+
+class CachedFlatModel(BaseModule):
+
+    # setup() only writes to data_block, hence can be restored from the setup cache
+    setup_cacheable = True
+    batch = True
+
+    def setup(self):
+        self.data_block[section_names.model,'size'] = self.data_block.get(section_names.data,'y').size
+
+    def execute(self):
+        a = np.asarray(self.data_block[section_names.parameters,'a'],dtype='f8')
+        y = self.data_block.get_output(section_names.model,'y',a.shape + (self.data_block[section_names.model,'size'],))
+        y[...] = a[...,None]
+
+    def cleanup(self):
+        return 0
+
+
+def test_setup_cache():
+
+    from cosmopipe.pipeline import cache, setup_cache
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    cache_dir = os.path.join(data_dir,'setup_cache')
+    setup_cache.main(['clear',cache_dir])
+    values = np.linspace(-1.,4.,5)
+    config_fn = os.path.join(demo_dir,'demo2.ini')
+    pipeline = BasePipeline(config_block=config_fn)
+    pipeline.setup()
+    ref = pipeline.execute_batch({'a':values})
+    pipeline.cleanup()
+
+    names = ['data1','cov1','data2','cov2']
+    for xlim,nmisses in zip(['{"ell_0": [0.0,0.5]}','{"ell_0": [0.0,0.5]}','{"ell_0": [0.0,0.8]}'],[4,0,2]):
+        config_block = ConfigBlock(config_fn)
+        config_block['data1','xlim'] = xlim
+        for name in names:
+            config_block[name,'setup_cache_dir'] = cache_dir
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        loglkl = pipeline.execute_batch({'a':values})
+        if xlim == '{"ell_0": [0.0,0.5]}':
+            assert np.allclose(loglkl,ref)
+        modules = {module.name:module for module in pipeline.leaves()}
+        assert sum(modules[name].setup_cache.misses for name in names) == nmisses
+        pipeline.cleanup()
+    assert len(cache.list_entries(cache_dir)) == 6
+    setup_cache.main(['list',cache_dir])
+    cache.evict(cache_dir,max_size=1)
+    assert len(cache.list_entries(cache_dir)) == 0
+
+    config_block = ConfigBlock(config_fn)
+    config_block['like1','setup_cache_dir'] = cache_dir
+    try:
+        BasePipeline(config_block=config_block)
+    except ModuleError:
+        pass
+    else:
+        raise AssertionError('Setup cache should not be available for pipelines')
+
+    # FlatModel sets attributes in setup(), which would be lost when restoring from the cache
+    config_block = ConfigBlock(config_fn)
+    config_block['model1','setup_cache_dir'] = cache_dir
+    try:
+        BasePipeline(config_block=config_block)
+    except ModuleError:
+        pass
+    else:
+        raise AssertionError('Setup cache should not be available for class-based modules, unless they opt in')
+
+    for nmisses in [1,0]:
+        config_block = ConfigBlock(config_fn)
+        config_block['model1','module_name'] = 'cosmopipe.pipeline.tests.test_pipeline'
+        config_block['model1','module_class'] = 'CachedFlatModel'
+        config_block['model1','setup_cache_dir'] = cache_dir
+        pipeline = BasePipeline(config_block=config_block)
+        pipeline.setup()
+        assert np.allclose(pipeline.execute_batch({'a':values}),ref)
+        module = {module.name:module for module in pipeline.leaves()}['model1']
+        assert module.__class__.__name__ == 'CachedFlatModel' and module.setup_cache.misses == nmisses
+        pipeline.cleanup()
+
+
+def test_lazy_import():
+
+    # plotting libraries are not imported with cosmopipe, and libraries of modules are only imported at setup
+    script = '''
+import os, sys
+from cosmopipe.pipeline import BasePipeline
+os.chdir({!r})
+pipeline = BasePipeline(config_block=os.path.join('demos','demo1.ini'))
+assert 'cosmopipe.data' not in sys.modules
+pipeline.setup()
+assert 'cosmopipe.data.covariance' in sys.modules
+import cosmopipe.data, cosmopipe.likelihood, cosmopipe.theory
+assert not any(name in sys.modules for name in ['matplotlib','pygraphviz'])
+'''.format(base_dir)
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.join(base_dir,'..','..','..')] + sys.path))
+    subprocess.run([sys.executable,'-c',script],env=env,check=True)
+    # import time itself is measured by bench_import.py
+
+
+def test_library_module():
+
+    utils.mkdir(data_dir)
+    # library defining class Module: instance of this class, as with module_class = Module
+    library_fn = os.path.join(data_dir,'library_class.py')
+    with open(library_fn,'w') as file:
+        file.write('from cosmopipe.pipeline import BaseModule\n\n\nclass Module(BaseModule):\n\n    def setup(self):\n        self.data_block["test","value"] = 1\n')
+    module = BaseModule.from_library('lib',options={'module_file':library_fn})
+    assert type(module).__name__ == 'Module'
+    module.setup()
+    assert module.data_block['test','value'] == 1
+    # library of functions: imported at setup only
+    library_fn = os.path.join(data_dir,'library_functions.py')
+    with open(library_fn,'w') as file:
+        file.write('def setup(name, config_block, data_block):\n    data_block["test","value"] = 2\n\n\nexecute = cleanup = setup\n')
+    module = BaseModule.from_library('lib',options={'module_file':library_fn})
+    assert isinstance(module,LibraryModule) and module._library is None
+    module.setup()
+    assert module.data_block['test','value'] == 2
+
+
+def test_prior():
+
+    parameters = ParamBlock(os.path.join(demo_dir,'param4.ini'))
+    parameters['b'] = Param(name='b',value=0.5,prior='normal 0.5 0.3',limit=[0.,1.])
+    parameters['c'] = Param(name='c',value=0.,prior='normal 0. 1.')
+    parameters['d'] = Param(name='d',value=0.)
+    # a is fixed
+    assert parameters.sample().shape == (2,)
+    samples = parameters.sample(1000,names=['a','b','c'],seed=42)
+    assert samples.shape == (1000,3)
+    assert np.all((samples[:,0] > -10.) & (samples[:,0] < 10.) & (samples[:,1] > 0.) & (samples[:,1] < 1.))
+    assert np.allclose(parameters.sample(10,seed=42),parameters.sample(10,seed=42))
+    rngs = get_rngs(seed=42,size=2)
+    assert not np.allclose(parameters.sample(10,rng=rngs[0]),parameters.sample(10,rng=rngs[1]))
+    samples = parameters.sample(100,names=['a','b','c'],seed=42,ref=True)
+    assert np.all(np.abs(samples[:,0]) < 10.)
+    logprior = parameters.logprior(samples,names=['a','b','c'])
+    ref = [sum(parameters[name].prior(value) for name,value in zip(['a','b','c'],sample)) for sample in samples]
+    assert np.allclose(logprior,ref)
+    assert parameters.logprior([20.,0.5,0.],names=['a','b','c']) == -np.inf
+    assert np.isscalar(parameters.logprior(samples[0],names=['a','b','c']))
+    # truncated normal, sampled by inverse cdf
+    prior = NormalPrior(0.,1.,limit=(4.,5.))
+    samples = prior.sample(1000,seed=42)
+    assert np.all((samples > 4.) & (samples < 5.))
+    assert np.all(prior(samples) > -np.inf) and prior(6.) == -np.inf
+
+
+def test_param_block():
+
+    parameters = ParamBlock(os.path.join(demo_dir,'param4.ini'))
+    for name in ['b','c']:
+        parameters[name] = Param(name=name,value=0.5,limit=[0.,1.])
+    parameters.append(Param(name='d',value=0.))
+    assert list(parameters.keys()) == ['a','b','c','d'] and 'c' in parameters and 'e' not in parameters
+    assert parameters['c'].name == 'c' and parameters[2].name == 'c'
+    assert parameters.varied_names == ('b','c')
+    assert np.all(parameters.fixed == [True,False,False,True])
+    assert np.allclose(parameters.varied_values,[0.5,0.5]) and np.allclose(parameters.varied_limits,[[0.,1.]]*2)
+    del parameters['b']
+    assert list(parameters.keys()) == ['a','c','d'] and parameters['d'].name == 'd' and parameters.varied_names == ('c',)
+    parameters.insert(0,Param(name='b',value=0.))
+    assert parameters['a'].name == 'a' and parameters[0].name == 'b'
+    parameters.pop(0)
+    parameters['d'].fixed = False
+    parameters.reindex()
+    assert parameters.varied_names == ('c','d')
+    other = ParamBlock(os.path.join(demo_dir,'param4.ini'))
+    for param in other: param.add_suffix('model1')
+    other.reindex()
+    parameters.update(other)
+    assert list(parameters.keys()) == ['a','c','d','a_model1'] and parameters['a_model1'].name == 'a_model1'
+    # overlapping names: parameters are replaced in place
+    parameters.update([Param(name='d',value=2.,fixed=True),Param(name='e',value=0.,limit=[-1.,1.])])
+    assert list(parameters.keys()) == ['a','c','d','a_model1','e'] and parameters['d'].value == 2.
+    assert parameters.varied_names == ('c','e')
+    parameters[1] = Param(name='f',value=0.,fixed=True)
+    assert list(parameters.keys()) == ['a','f','d','a_model1','e'] and 'c' not in parameters and parameters['f'] is parameters[1]
+    assert parameters.varied_names == ('e',)
+    # a name can only be used once
+    try:
+        parameters[1] = Param(name='e',value=1.,limit=[-1.,1.])
+    except ParamError:
+        pass
+    else:
+        raise AssertionError('ParamError should be raised for duplicate name e')
+    assert list(parameters.keys()) == ['a','f','d','a_model1','e'] and parameters.varied_names == ('e',)
+
+
+def test_check_prior():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_block = ConfigBlock(os.path.join(demo_dir,'demo1.ini'))
+    # prior on a is uniform in [-10, 10]
+    config_block['main','common_parameters'] = os.path.join(demo_dir,'param4.ini')
+    config_block['main','profile'] = True
+    values = np.array([-20.,0.,4.,20.])
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    loglkl = pipeline.execute_batch({'a':values})
+    assert np.all(loglkl[[0,3]] == -np.inf) and np.all(np.isfinite(loglkl[1:3]))
+    pipeline.execute_parameter_values(a=20.)
+    assert pipeline.data_block[section_names.likelihood,'loglkl'] == -np.inf
+    pipeline.execute_parameter_vector([0.],names=['a'])
+    assert np.allclose(pipeline.data_block[section_names.likelihood,'loglkl'],loglkl[1])
+    report = pipeline.profile_report()
+    assert report['prior']['skipped'] == 3
+    # like executed once for the 2 valid points of the batch, then for 1 point
+    assert report['groups']['modules'][0]['steps']['execute']['ncalls'] == 2
+    pipeline.cleanup()
+
+    config_block['main','check_prior'] = False
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    assert np.all(np.isfinite(pipeline.execute_batch({'a':values})))
+    assert 'prior' not in pipeline.profile_report()
+    pipeline.cleanup()
+
+
 if __name__ == '__main__':
 
     setup_logging()
@@ -151,3 +805,22 @@ if __name__ == '__main__':
     test_demo3()
     test_demo3b()
     test_demo4()
+    test_batch()
+    test_cholesky()
+    test_sum_nprocs()
+    test_execute_cache()
+    test_parameter_blocks()
+    test_profile()
+    test_binary()
+    test_data_block()
+    test_handles()
+    test_incremental()
+    test_joint_buffer()
+    test_scheduler()
+    test_shared_memory()
+    test_setup_cache()
+    test_lazy_import()
+    test_library_module()
+    test_prior()
+    test_param_block()
+    test_check_prior()
@@ -3,12 +3,17 @@ import logging
 import re
 import functools
 
-from matplotlib import pyplot as plt
-
 from . import utils
 
 logger = logging.getLogger('Plotting')
 
+
+def _import_pyplot():
+    # matplotlib is slow to import: only import it when actually plotting
+    from matplotlib import pyplot as plt
+    return plt
+
+
 def saveplot(giveax=True):
     """
     Decorate plotting methods, to achieve the following behaviour for the decorated method:
@@ -27,6 +32,7 @@ def saveplot(giveax=True):
 
         @functools.wraps(func)
         def wrapper(self, ax=None, filename=None, kwargs_fig=None, **kwargs):
+            plt = _import_pyplot()
             isax = True
             if giveax:
                 if ax is None:
@@ -51,6 +57,7 @@ def saveplot(giveax=True):
 
 def savefig(filename, bbox_inches='tight', pad_inches=0.1, dpi=200, **kwargs):
     """Save matplotlib figure to ``filename``."""
+    plt = _import_pyplot()
     utils.mkdir(os.path.dirname(filename))
     logger.info('Saving figure to {}.'.format(filename))
     plt.savefig(filename,bbox_inches=bbox_inches,pad_inches=pad_inches,dpi=dpi,**kwargs)
@@ -80,6 +87,7 @@ def suplabel(axis,label,shift=0,labelpad=5,ha='center',va='center',**kwargs):
         kwargs for :meth:`matplotlib.pyplot.text`
 
     """
+    plt = _import_pyplot()
     fig = plt.gcf()
     xmin = []
     ymin = []
@@ -0,0 +1,259 @@
+"""Base classes and utilities for cosmopipe-native samplers."""
+
+import os
+import logging
+
+import numpy as np
+
+from cosmopipe import utils
+from cosmopipe.pipeline import BasePipeline, section_names
+from cosmopipe.pipeline.param import get_rngs
+
+
+def autocorrelation_function(x):
+    """Return normalised autocorrelation function of ``x`` (array of shape (nsteps, ...)) along the first axis, computed by FFT."""
+    x = np.asarray(x,dtype='f8')
+    nsteps = len(x)
+    nfft = 2**int(np.ceil(np.log2(2*nsteps)))
+    x = x - np.mean(x,axis=0)
+    f = np.fft.rfft(x,n=nfft,axis=0)
+    acf = np.fft.irfft(f*np.conj(f),n=nfft,axis=0)[:nsteps]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        acf = acf/acf[0]
+    return np.nan_to_num(acf)
+
+
+def _get_window(acf, c=5.):
+    # integrated autocorrelation time of acf (array of shape (nlags, ndim)) at the smallest lag m such that m >= c*tau(m);
+    # and whether such a lag exists
+    taus = 2.*np.cumsum(acf,axis=0) - 1.
+    lags = np.arange(len(acf))[:,None]
+    window = lags >= c*taus
+    found = window.any(axis=0)
+    # first lag satisfying the window condition, last lag if none
+    iwindow = np.where(found,np.argmax(window,axis=0),len(acf) - 1)
+    return taus[iwindow,np.arange(taus.shape[-1])],found
+
+
+def integrated_autocorrelation_time(chain, c=5.):
+    """
+    Return integrated autocorrelation time of ``chain``, of shape (nsteps, nwalkers, ndim), for each dimension.
+    Autocorrelation functions are averaged over walkers, and summed up to the smallest lag ``m`` such that ``m >= c*tau(m)`` (Sokal 1989).
+    """
+    chain = np.asarray(chain,dtype='f8')
+    return _get_window(np.mean(autocorrelation_function(chain),axis=1),c=c)[0]
+
+
+class AutocorrelationAccumulator(object):
+    """
+    Autocorrelation function of a chain, updated incrementally at each step, see :meth:`update`.
+
+    Products of positions at lags smaller than :attr:`maxlag` are accumulated, at a cost proportional to :attr:`maxlag` per step;
+    the autocorrelation function (same estimator as :func:`autocorrelation_function`) then follows from these and running sums.
+    :attr:`maxlag` is doubled when too small to find the summation window of the integrated autocorrelation time,
+    which requires the full chain (products at the new lags are then computed at once, by FFT).
+    """
+    def __init__(self, maxlag=64):
+        """
+        Initialise :class:`AutocorrelationAccumulator`.
+
+        Parameters
+        ----------
+        maxlag : int, default=64
+            Initial maximum lag.
+        """
+        self.maxlag = maxlag
+        self.nsteps = 0
+
+    def _set(self, chain):
+        # set all sums from chain (shifted), of shape (nsteps, nwalkers, ndim)
+        nsteps = len(chain)
+        nfft = 2**int(np.ceil(np.log2(2*nsteps)))
+        f = np.fft.rfft(chain,n=nfft,axis=0)
+        # products[k] = sum_t x_t x_{t-k}
+        self.products = np.zeros((self.maxlag,) + chain.shape[1:],dtype='f8')
+        nlags = min(nsteps,self.maxlag)
+        self.products[:nlags] = np.fft.irfft(f*np.conj(f),n=nfft,axis=0)[:nlags]
+        self.head = np.zeros((self.maxlag + 1,) + chain.shape[1:],dtype='f8')
+        np.cumsum(chain[:self.maxlag],axis=0,out=self.head[1:min(nsteps,self.maxlag) + 1])
+        self.head[nsteps + 1:] = self.head[min(nsteps,self.maxlag)]
+        self.last = np.zeros((self.maxlag,) + chain.shape[1:],dtype='f8')
+        istart = max(nsteps - self.maxlag,0)
+        self.last[np.arange(istart,nsteps) % self.maxlag] = chain[istart:]
+        self.total = chain.sum(axis=0)
+        self.nsteps = nsteps
+
+    def update(self, positions):
+        """Add ``positions`` (array of shape (nwalkers, ndim)) of the next step."""
+        if not self.nsteps:
+            # shift by the first positions, to limit cancellations in sums of products
+            self.shift = np.array(positions,dtype='f8')
+            self._set(np.zeros((1,) + self.shift.shape,dtype='f8'))
+            return
+        x = positions - self.shift
+        nlags = min(self.maxlag,self.nsteps + 1)
+        self.last[self.nsteps % self.maxlag] = x
+        self.products[:nlags] += x*self.last[(self.nsteps - np.arange(nlags)) % self.maxlag]
+        if self.nsteps < self.maxlag:
+            self.head[self.nsteps + 1:] += x
+        self.total += x
+        self.nsteps += 1
+
+    def autocorrelation_function(self):
+        """Return normalised autocorrelation function, of shape (min(maxlag, nsteps), nwalkers, ndim)."""
+        nlags = min(self.maxlag,self.nsteps)
+        mean = self.total/self.nsteps
+        # sum of the last k positions
+        tail = np.zeros_like(self.head[:nlags])
+        np.cumsum(self.last[(self.nsteps - 1 - np.arange(nlags - 1)) % self.maxlag],axis=0,out=tail[1:])
+        lags = np.arange(nlags).reshape((-1,) + (1,)*mean.ndim)
+        # sum_t (x_t - mean) (x_{t-k} - mean)
+        acf = self.products[:nlags] - mean*(2.*self.total - tail - self.head[:nlags]) + (self.nsteps - lags)*mean**2
+        with np.errstate(invalid='ignore',divide='ignore'):
+            acf = acf/acf[0]
+        return np.nan_to_num(acf)
+
+    def integrated_autocorrelation_time(self, chain, c=5.):
+        """
+        Return integrated autocorrelation time for each dimension, as :func:`integrated_autocorrelation_time`.
+        ``chain``, of shape (nsteps, nwalkers, ndim), is the chain accumulated so far; it is only used if :attr:`maxlag` is to be increased.
+        """
+        while True:
+            tau,found = _get_window(np.mean(self.autocorrelation_function(),axis=1),c=c)
+            if found.all() or self.maxlag >= self.nsteps:
+                return tau
+            self.maxlag *= 2
+            self._set(np.asarray(chain,dtype='f8') - self.shift)
+
+
+class ChainWriter(object):
+    """
+    Stream samples to a text file, one line per sample, with columns ``step``, ``walker``, parameter values and ``logposterior``.
+    The file is flushed after each step, such that it can be read (e.g. with :func:`numpy.loadtxt`) while sampling is running.
+    """
+    def __init__(self, filename, names):
+        """
+        Initialise :class:`ChainWriter`.
+
+        Parameters
+        ----------
+        filename : string
+            Output file name.
+
+        names : list
+            Parameter names.
+        """
+        self.filename = filename
+        utils.mkdir(os.path.dirname(filename))
+        self.file = open(filename,'w')
+        self.file.write('# {}\n'.format(' '.join(['step','walker'] + list(names) + ['logposterior'])))
+
+    def write(self, step, positions, logposterior):
+        """Write ``positions`` (array of shape (nwalkers, ndim)) and ``logposterior`` (array of shape (nwalkers,)) at ``step``."""
+        nwalkers = len(positions)
+        array = np.column_stack([np.full(nwalkers,step),np.arange(nwalkers),positions,logposterior])
+        np.savetxt(self.file,array,fmt=['%d','%d'] + ['%.18e']*(array.shape[-1] - 2))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BaseSampler(BasePipeline):
+    """
+    Base class for samplers of the (varied) parameters of the pipeline made of its modules.
+
+    Samplers evaluate the log-posterior (:meth:`logposterior`) of several points at once, executing modules only for points within the prior limits.
+    Samples are streamed to option ``chain_file`` if provided (see :class:`ChainWriter`), and saved in ``data_block``, section ``samples``:
+    ``names`` (parameter names), ``chain`` (array of shape (nsteps, nwalkers, ndim)) and ``logposterior`` (array of shape (nsteps, nwalkers)).
+
+    Options common to all samplers are:
+
+      - ``max_steps``: maximum number of steps (default 10000)
+      - ``check_every``: number of steps between two estimations of the autocorrelation time (default 100)
+      - ``min_autocorr``: sampling is stopped when the number of steps is larger than ``min_autocorr`` times the autocorrelation time (default 50.)
+      - ``autocorr_rtol``: ... and the autocorrelation time varied by less than ``autocorr_rtol`` since the previous estimation (default 0.01)
+      - ``chain_file``: if provided, samples are appended to this file at each step, see :class:`ChainWriter`
+      - ``seed``: random seed
+    """
+    logger = logging.getLogger('BaseSampler')
+
+    def setup(self):
+        super(BaseSampler,self).setup()
+        self.varied_names = list(self.varied_parameter_names())
+        if not self.varied_names:
+            raise ValueError('No varied parameter to sample for {}.'.format(self))
+        self.rng = get_rngs(seed=self.options.get_int('seed',None))
+        self.chain_fn = self.options.get_string('chain_file',None)
+        self.max_steps = self.options.get_int('max_steps',10000)
+        self.check_every = self.options.get_int('check_every',100)
+        self.min_autocorr = self.options.get_float('min_autocorr',50.)
+        self.autocorr_rtol = self.options.get_float('autocorr_rtol',0.01)
+
+    def check_convergence(self, accumulator, chain, tau):
+        """
+        Return whether ``chain`` (array of shape (nsteps, nwalkers, ndim)) has converged, i.e. is longer than :attr:`min_autocorr` times
+        its autocorrelation time, which changed by less than :attr:`autocorr_rtol` compared to the previous estimate ``tau``;
+        and the new estimate of the autocorrelation time, from ``accumulator`` (see :class:`AutocorrelationAccumulator`), updated with ``chain``.
+        """
+        newtau = accumulator.integrated_autocorrelation_time(chain)
+        converged = np.all(len(chain) > self.min_autocorr*newtau) and np.all(np.abs(newtau - tau) < self.autocorr_rtol*newtau)
+        return converged,newtau
+
+    def reserve(self, array, size):
+        """Return ``array`` (e.g. chain), grown along its first axis by chunks of (at least) :attr:`check_every` steps to hold ``size`` steps."""
+        if len(array) >= size:
+            return array
+        toret = np.empty((min(max(size,len(array) + self.check_every,2*len(array)),max(self.max_steps,size)),) + array.shape[1:],dtype=array.dtype)
+        toret[:len(array)] = array
+        return toret
+
+    def loglkl(self, points):
+        """Return log-likelihood of ``points``, array of shape (npoints, ndim), executing the modules (at once if they are batch-aware)."""
+        handle = self.get_parameter_handle(self.varied_names)
+        if self.batch:
+            handle.set(list(points.T))
+            self.execute_modules(self.modules)
+            return np.broadcast_to(self.pipe_block[section_names.likelihood,'loglkl'],(len(points),)).copy()
+        loglkl = np.empty(len(points),dtype='f8')
+        for ipoint,point in enumerate(points):
+            handle.set(point)
+            self.execute_modules(self.modules)
+            loglkl[ipoint] = self.pipe_block[section_names.likelihood,'loglkl']
+        return loglkl
+
+    def logposterior(self, points):
+        """
+        Return log-posterior of ``points``, array of shape (npoints, ndim).
+        Modules are not executed for points out of the prior limits, see :attr:`prior_skipped`.
+        """
+        points = np.asarray(points,dtype='f8')
+        toret = self.parameters.logprior(points,names=self.varied_names)
+        mask = np.isfinite(toret)
+        self.prior_skipped += len(points) - mask.sum()
+        if mask.any():
+            toret[mask] += self.loglkl(points[mask])
+        return toret
+
+    def initial_positions(self, nwalkers, maxtries=100):
+        """
+        Return initial positions of ``nwalkers`` walkers (array of shape (nwalkers, ndim)), drawn from the reference distributions :attr:`Param.ref`,
+        and their log-posterior; positions with zero posterior are drawn again, up to ``maxtries`` times.
+        """
+        positions = self.parameters.sample(nwalkers,names=self.varied_names,rng=self.rng,ref=True)
+        logposterior = self.logposterior(positions)
+        for itry in range(maxtries):
+            mask = ~np.isfinite(logposterior)
+            if not mask.any():
+                return positions,logposterior
+            positions[mask] = self.parameters.sample(mask.sum(),names=self.varied_names,rng=self.rng,ref=True)
+            logposterior[mask] = self.logposterior(positions[mask])
+        raise ValueError('Could not find initial positions with finite posterior after {:d} tries.'.format(maxtries))
+
+    def set_samples(self, chain, logposterior, **kwargs):
+        """Save ``chain``, ``logposterior`` and other statistics ``kwargs`` in ``data_block``."""
+        self.data_block[section_names.samples,'names'] = list(self.varied_names)
+        self.data_block[section_names.samples,'chain'] = chain
+        self.data_block[section_names.samples,'logposterior'] = logposterior
+        for name,value in kwargs.items():
+            self.data_block[section_names.samples,name] = value
@@ -1 +1 @@
-from .likelihood import CosmoPipeLikelihood
+from .likelihood import CosmoPipeLikelihood, set_blocking
@@ -13,10 +13,56 @@ class CosmoPipeLikelihood(Likelihood):
         return {}
 
     def logp(self, **kwargs):
-        for key,val in kwargs.items():
-            self.pipeline.data_block[section_names.parameters,key] = val
-        self.pipeline.execute()
+        self.pipeline.execute_parameter_values(**kwargs)
         return self.pipeline.data_block[section_names.likelihood,'loglkl']
 
     def clean(self):
         pass
+
+
+def set_blocking(info, niterations=1, oversample_power=0.4):
+    """
+    Set blocking of sampled parameters (option ``blocking`` of cobaya's mcmc sampler) in cobaya input dictionary ``info``,
+    from the fast/slow decomposition of the pipelines of :class:`CosmoPipeLikelihood` likelihoods, see :meth:`BasePipeline.get_parameter_blocks`;
+    with several likelihoods, parameters take their smallest oversampling factor.
+    Sampled parameters not read by these pipelines are put in the slowest block.
+    Cobaya only oversamples whole likelihoods: to avoid re-executing expensive modules when fast parameters are varied,
+    set ``cache_size`` in their configuration.
+
+    Parameters
+    ----------
+    info : dict
+        Cobaya input dictionary, as provided to :func:`cobaya.run.run`, with ``mcmc`` sampler.
+
+    niterations : int, default=1
+        Number of executions of each module to measure its execution time.
+
+    oversample_power : float, default=0.4
+        Blocks are oversampled by a factor (slowest cost / block cost)**oversample_power, rounded.
+
+    Returns
+    -------
+    info : dict
+        Input dictionary, updated in place.
+    """
+    sampled = [name for name,param in info['params'].items() if isinstance(param,dict) and 'prior' in param]
+    factors = {}
+    for name,like in info['likelihood'].items():
+        like = like or {}
+        if CosmoPipeLikelihood.__name__ not in [name.split('.')[-1],like.get('class','').split('.')[-1]]:
+            continue
+        pipeline = BasePipeline(config_block=like['config_file'])
+        pipeline.setup()
+        blocks = pipeline.get_parameter_blocks(names=[name for name in sampled if name in pipeline.parameters],niterations=niterations,oversample_power=oversample_power)
+        pipeline.cleanup()
+        for factor,names in blocks:
+            for name in names: factors[name] = min(factors.get(name,factor),factor)
+    blocking = {}
+    for name in sampled:
+        factor = factors.get(name,1)
+        blocking.setdefault(factor,[]).append(name)
+    sampler = info['sampler']
+    if sampler.get('mcmc',None) is None:
+        sampler['mcmc'] = {}
+    sampler['mcmc']['blocking'] = [[factor,blocking[factor]] for factor in sorted(blocking)]
+    return info
@@ -13,9 +13,8 @@ class CosmoPipeLikelihood(object):
         self.pipeline.setup()
 
     def execute(self, block):
-        for section,name in block.keys(section=cosmosis_names.cosmological_parameters):
-            self.pipeline.data_block[section_names.parameters,name] = block[section,name]
-        self.pipeline.execute()
+        params = {name:block[section,name] for section,name in block.keys(section=cosmosis_names.cosmological_parameters)}
+        self.pipeline.execute_parameter_values(**params)
         block[cosmosis_names.likelihoods,'cosmopipe_like'] = self.pipeline.data_block[section_names.likelihood,'loglkl']
 
     def cleanup(self):
@@ -0,0 +1,86 @@
+import logging
+
+import numpy as np
+
+from .base import BaseSampler, ChainWriter, AutocorrelationAccumulator
+
+
+class EnsembleSampler(BaseSampler):
+    """
+    Affine-invariant ensemble sampler, with the stretch move of Goodman & Weare 2010 (as in emcee).
+
+    Walkers are split into two halves, which are updated in turn, each with a single evaluation of the log-posterior for the whole half
+    (see :meth:`BaseSampler.logposterior`): make modules batch-aware (:attr:`BaseModule.batch`) to evaluate all points at once.
+    Initial positions are drawn from the reference distributions :attr:`Param.ref`.
+
+    Options, in addition to those of :class:`BaseSampler`, are:
+
+      - ``nwalkers``: number of walkers (even), defaults to twice the number of varied parameters, and at least 4
+      - ``stretch``: scale of the stretch move (default 2.)
+
+    Autocorrelation times (``autocorr_time``, for each parameter), acceptance rate (``acceptance``)
+    and whether convergence criteria are met (``converged``) are saved in section ``samples``, in addition to the chain.
+    The autocorrelation function is updated incrementally at each step (see :class:`AutocorrelationAccumulator`),
+    and the chain is kept in memory in a buffer grown by chunks (see :meth:`BaseSampler.reserve`).
+    """
+    logger = logging.getLogger('EnsembleSampler')
+
+    def setup(self):
+        super(EnsembleSampler,self).setup()
+        ndim = len(self.varied_names)
+        self.nwalkers = self.options.get_int('nwalkers',max(2*ndim,4))
+        if self.nwalkers % 2 or self.nwalkers < 4:
+            raise ValueError('Number of walkers should be even and at least 4, found {:d}'.format(self.nwalkers))
+        self.stretch = self.options.get_float('stretch',2.)
+
+    def step(self, positions, logposterior):
+        """
+        Update ``positions`` (array of shape (nwalkers, ndim)) and ``logposterior`` in place, one half of the walkers after the other.
+        Return number of accepted moves.
+        """
+        nwalkers,ndim = positions.shape
+        half = nwalkers//2
+        naccepted = 0
+        for active,inactive in [(slice(0,half),slice(half,None)),(slice(half,None),slice(0,half))]:
+            current,others = positions[active],positions[inactive]
+            z = ((self.stretch - 1.)*self.rng.uniform(size=half) + 1.)**2/self.stretch
+            partners = others[self.rng.integers(0,len(others),size=half)]
+            proposed = partners + z[:,None]*(current - partners)
+            # single evaluation for the whole half
+            newlogposterior = self.logposterior(proposed)
+            logaccept = (ndim - 1.)*np.log(z) + newlogposterior - logposterior[active]
+            accept = np.log(self.rng.uniform(size=half)) < logaccept
+            current[accept] = proposed[accept]
+            logposterior[active][accept] = newlogposterior[accept]
+            naccepted += accept.sum()
+        return naccepted
+
+    def execute(self):
+        positions,logposterior = self.initial_positions(self.nwalkers)
+        ndim = positions.shape[-1]
+        chain = np.empty((0,self.nwalkers,ndim),dtype='f8')
+        chain_logposterior = np.empty((0,self.nwalkers),dtype='f8')
+        accumulator = AutocorrelationAccumulator()
+        writer = ChainWriter(self.chain_fn,self.varied_names) if self.chain_fn is not None else None
+        naccepted,tau,converged = 0,np.full(ndim,np.inf),False
+        try:
+            for istep in range(self.max_steps):
+                naccepted += self.step(positions,logposterior)
+                nsteps = istep + 1
+                chain,chain_logposterior = self.reserve(chain,nsteps),self.reserve(chain_logposterior,nsteps)
+                chain[istep],chain_logposterior[istep] = positions,logposterior
+                accumulator.update(positions)
+                if writer is not None:
+                    writer.write(istep,positions,logposterior)
+                if nsteps % self.check_every == 0:
+                    # the autocorrelation time is estimated on the fly, to stop as soon as the chain is long enough
+                    converged,tau = self.check_convergence(accumulator,chain[:nsteps],tau)
+                    self.logger.info('Step {:d}: autocorrelation time {}, acceptance rate {:.3f}.'.format(nsteps,tau,naccepted/(nsteps*self.nwalkers)))
+                    if converged:
+                        break
+        finally:
+            if writer is not None:
+                writer.close()
+        if not converged:
+            self.logger.warning('Chain has not converged after {:d} steps.'.format(nsteps))
+        self.set_samples(chain[:nsteps],chain_logposterior[:nsteps],autocorr_time=tau,acceptance=naccepted/(nsteps*self.nwalkers),converged=converged)
@@ -0,0 +1,182 @@
+import logging
+
+import numpy as np
+
+from cosmopipe.pipeline.cache import ExecuteCache
+from cosmopipe.data.covariance import CovarianceAccumulator
+from .base import BaseSampler, ChainWriter, AutocorrelationAccumulator
+
+
+class MetropolisSampler(BaseSampler):
+    """
+    Adaptive Metropolis-Hastings sampler, with fast/slow decomposition of parameters and dragging (Neal 2005, Lewis 2013).
+
+    Parameters are grouped into blocks according to the (non-pipeline) modules which depend on them, i.e. which read them
+    or declare them in their ``common_parameters`` or ``specific_parameters``, and module execution times, see :meth:`BasePipeline.get_parameter_blocks`.
+    Parameters of the slowest block are "slow", the others are "fast" (e.g. nuisance parameters, only read by cheap modules).
+    At each step, a move of the slow parameters is proposed, along which fast parameters are dragged with ``ndrag`` steps;
+    each of these evaluates the posterior at both ends of the slow move at once (see :meth:`BaseSampler.logposterior`).
+    Products of modules which depend on slow parameters only are cached (see :class:`ExecuteCache`), such that they are not executed during dragging;
+    these caches are removed once sampling is done.
+    Fast moves follow the covariance of fast parameters conditioned on slow ones, i.e. the fast block of the Cholesky factor
+    of the proposal covariance, with slow parameters first (see :meth:`get_proposals`).
+    The proposal covariance is updated online (see :class:`CovarianceAccumulator`) every ``learn_every`` steps (Haario et al. 2001),
+    up to ``learn_stop`` steps; the autocorrelation time is estimated on the following steps only.
+
+    Options, in addition to those of :class:`BaseSampler`, are:
+
+      - ``learn_every``: number of steps between two updates of the proposal covariance (default 20 times the number of varied parameters)
+      - ``learn_stop``: number of steps after which the proposal covariance is fixed (default min(2000, max_steps//2))
+      - ``drag``: whether to drag fast parameters (default ``True``); else, all parameters are updated at once
+      - ``ndrag``: number of dragging steps, defaults to the oversampling factor of the fast parameters
+      - ``oversample_power``: power to compute oversampling factors from module execution times, see :meth:`BasePipeline.get_parameter_blocks` (default 0.4)
+
+    Autocorrelation times (``autocorr_time``), acceptance rate (``acceptance``), whether convergence criteria are met (``converged``),
+    number of learning steps (``learn_stop``), proposal covariance (``covariance``), slow and fast parameter names (``slow``, ``fast``)
+    and number of dragging steps (``ndrag``) are saved in section ``samples``, in addition to the chain (with a single walker).
+    """
+    logger = logging.getLogger('MetropolisSampler')
+
+    def setup(self):
+        super(MetropolisSampler,self).setup()
+        ndim = len(self.varied_names)
+        self.learn_every = self.options.get_int('learn_every',20*ndim)
+        self.learn_stop = self.options.get_int('learn_stop',min(2000,self.max_steps//2))
+        self.drag = self.options.get_bool('drag',True)
+        self.ndrag = self.options.get_int('ndrag',None)
+        self.oversample_power = self.options.get_float('oversample_power',0.4)
+
+    def set_blocks(self):
+        """
+        Set slow and fast parameter indices, number of dragging steps, and cache products of modules which only depend on slow parameters;
+        these caches are listed in :attr:`drag_caches`, and removed by :meth:`unset_blocks`.
+        """
+        ndim = len(self.varied_names)
+        self.slow,self.fast = np.arange(ndim),np.arange(0)
+        self.drag_caches = []
+        # a single run of the pipeline to measure module costs and dependencies
+        dependencies = self.get_leaf_dependencies()
+        blocks = self.get_parameter_blocks(names=self.varied_names,oversample_power=self.oversample_power,dependencies=dependencies)
+        if not self.drag or len(blocks) < 2:
+            return
+        slow = blocks[0][1]
+        self.slow = np.array([self.varied_names.index(name) for name in slow])
+        self.fast = np.array([index for index in range(ndim) if index not in self.slow])
+        if self.ndrag is None:
+            self.ndrag = max(block[0] for block in blocks[1:])
+        fast = {self.varied_names[index] for index in self.fast}
+        for module,cost,depends in zip(*dependencies):
+            if module.execute_cache is None and depends & set(slow) and not depends & fast:
+                # the two ends of the slow move
+                module.execute_cache = ExecuteCache(size=2,depends=module.get_depends())
+                self.drag_caches.append((module,module.execute_cache))
+        self.logger.info('Slow parameters {} are dragged along fast parameters {} with {:d} steps.'.format(slow,sorted(fast),self.ndrag))
+
+    def unset_blocks(self):
+        """Remove caches set by :meth:`set_blocks`, such that modules are left as configured."""
+        for module,cache in self.drag_caches:
+            if module.execute_cache is cache:
+                module.execute_cache = None
+
+    def get_proposals(self, covariance):
+        """
+        Return matrices transforming vectors of unit normals into proposal moves, given ``covariance``:
+        that of the slow move, of shape (ndim, nslow), and that of fast moves, of shape (nfast, nfast), if any.
+        The Cholesky factor of ``covariance``, with slow parameters first, is split into slow and fast columns (Lewis 2013):
+        the slow move also shifts fast parameters along their correlations with slow ones,
+        and fast moves follow the covariance of fast parameters conditioned on slow ones.
+        Raise :class:`numpy.linalg.LinAlgError` if ``covariance`` is not positive-definite.
+        """
+        order = np.concatenate([self.slow,self.fast])
+        cholesky = np.linalg.cholesky(covariance[np.ix_(order,order)])
+        nslow = len(self.slow)
+        slow = np.empty((len(order),nslow),dtype='f8')
+        slow[order] = cholesky[:,:nslow]
+        proposals = [2.38/np.sqrt(nslow)*slow]
+        if len(self.fast):
+            proposals.append(2.38/np.sqrt(len(self.fast))*cholesky[nslow:,nslow:])
+        return proposals
+
+    def propose(self, proposal, indices, position):
+        """Return copy of ``position`` moved along parameters ``indices`` with ``proposal`` (see :meth:`get_proposals`)."""
+        toret = position.copy()
+        toret[...,indices] += proposal.dot(self.rng.normal(size=proposal.shape[-1]))
+        return toret
+
+    def step(self, position, logposterior, proposals):
+        """Return new position and log-posterior, and whether the move is accepted, starting from ``position``."""
+        end = self.propose(proposals[0],slice(None),position)
+        endlogposterior = self.logposterior(end[None,:])[0]
+        if not len(self.fast):
+            if np.log(self.rng.uniform()) < endlogposterior - logposterior:
+                return end,endlogposterior,True
+            return position,logposterior,False
+        if not np.isfinite(endlogposterior):
+            return position,logposterior,False
+        start,startlogposterior = position,logposterior
+        delta = endlogposterior - startlogposterior
+        for idrag in range(1,self.ndrag + 1):
+            weight = idrag/(self.ndrag + 1.)
+            # same move of fast parameters at both ends of the slow move; both are evaluated at once
+            move = self.propose(proposals[1],self.fast,np.zeros_like(position))
+            newstart,newend = start + move,end + move
+            newstartlogposterior,newendlogposterior = self.logposterior(np.array([newstart,newend]))
+            if np.isfinite(newstartlogposterior) and np.isfinite(newendlogposterior):
+                logaccept = (1. - weight)*(newstartlogposterior - startlogposterior) + weight*(newendlogposterior - endlogposterior)
+                if np.log(self.rng.uniform()) < logaccept:
+                    start,startlogposterior,end,endlogposterior = newstart,newstartlogposterior,newend,newendlogposterior
+            delta += endlogposterior - startlogposterior
+        if np.log(self.rng.uniform()) < delta/(self.ndrag + 1.):
+            return end,endlogposterior,True
+        return position,logposterior,False
+
+    def execute(self):
+        positions,logposteriors = self.initial_positions(1)
+        position,logposterior = positions[0],logposteriors[0]
+        ndim = len(position)
+        # initial proposal from the reference distributions
+        covariance = np.diag(np.var(self.parameters.sample(1000,names=self.varied_names,rng=self.rng,ref=True),axis=0))
+        chain = np.empty((0,1,ndim),dtype='f8')
+        chain_logposterior = np.empty((0,1),dtype='f8')
+        accumulator,covariances = AutocorrelationAccumulator(),CovarianceAccumulator()
+        writer = ChainWriter(self.chain_fn,self.varied_names) if self.chain_fn is not None else None
+        naccepted,tau,converged,proposals = 0,np.full(ndim,np.inf),False,None
+        try:
+            self.set_blocks()
+            for istep in range(self.max_steps):
+                nsteps = istep + 1
+                if istep % self.learn_every == 0 and 0 < istep <= self.learn_stop and istep > ndim + 1:
+                    # learn proposal covariance online, from the steps since the last update, if positive-definite
+                    covariances.update_samples(chain[covariances.nobs:istep,0])
+                    newcovariance = covariances.covariance()
+                    try:
+                        proposals = self.get_proposals(newcovariance)
+                    except np.linalg.LinAlgError:
+                        self.logger.warning('Proposal covariance could not be updated at step {:d}.'.format(istep))
+                    else:
+                        covariance = newcovariance
+                if proposals is None:
+                    proposals = self.get_proposals(covariance)
+                position,logposterior,accepted = self.step(position,logposterior,proposals)
+                naccepted += accepted
+                chain,chain_logposterior = self.reserve(chain,nsteps),self.reserve(chain_logposterior,nsteps)
+                chain[istep],chain_logposterior[istep] = position,logposterior
+                if writer is not None:
+                    writer.write(istep,position[None,:],[logposterior])
+                nlearned = nsteps - self.learn_stop
+                if nlearned > 0:
+                    accumulator.update(chain[istep])
+                if nlearned > 0 and nlearned % self.check_every == 0:
+                    converged,tau = self.check_convergence(accumulator,chain[self.learn_stop:nsteps],tau)
+                    self.logger.info('Step {:d}: autocorrelation time {}, acceptance rate {:.3f}.'.format(nsteps,tau,naccepted/nsteps))
+                    if converged:
+                        break
+        finally:
+            self.unset_blocks()
+            if writer is not None:
+                writer.close()
+        if not converged:
+            self.logger.warning('Chain has not converged after {:d} steps.'.format(nsteps))
+        self.set_samples(chain[:nsteps],chain_logposterior[:nsteps],autocorr_time=tau,acceptance=naccepted/nsteps,converged=converged,
+                        learn_stop=self.learn_stop,covariance=covariance,ndrag=self.ndrag or 0,
+                        slow=[self.varied_names[index] for index in self.slow],fast=[self.varied_names[index] for index in self.fast])
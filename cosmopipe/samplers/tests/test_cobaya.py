@@ -6,6 +6,8 @@ from cosmopipe.data.tests.test_data import make_data_covariance
 from cobaya.yaml import yaml_load_file
 from cobaya.run import run
 
+from cosmopipe.samplers.cobaya import set_blocking
+
 base_dir = os.path.dirname(os.path.realpath(__file__))
 data_dir = os.path.join(base_dir,'_data')
 demo_dir = os.path.join(base_dir,'demos')
@@ -24,7 +26,21 @@ def test_external():
     assert 'sample' in sampler.products()
 
 
+def test_blocking():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    info = set_blocking(yaml_load_file('./test_cobaya_blocking.yaml'))
+    # b is only read by the (cheap) model, a by the model and the likelihood
+    blocking = info['sampler']['mcmc']['blocking']
+    assert [names for factor,names in blocking] == [['a'],['b']] and blocking[0][0] <= blocking[1][0]
+    updated_info, sampler = run(info)
+    assert 'sample' in sampler.products()
+
+
 if __name__ == '__main__':
 
     setup_logging()
     test_external()
+    test_blocking()
@@ -0,0 +1,139 @@
+import os
+import time
+
+import numpy as np
+
+from cosmopipe.pipeline import BasePipeline, ConfigBlock, section_names
+from cosmopipe.theory.flat import FlatModel, AffineModel
+from cosmopipe.samplers.base import autocorrelation_function, integrated_autocorrelation_time, AutocorrelationAccumulator
+from cosmopipe.utils import setup_logging
+from cosmopipe.data.tests.test_data import make_data_covariance
+
+
+base_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.join(base_dir,'_data')
+data_fn = os.path.join(data_dir,'data_{:d}.txt')
+covariance_fn = os.path.join(data_dir,'covariance.txt')
+
+
+class SlowFlatModel(FlatModel):
+
+    def execute(self):
+        time.sleep(0.001)
+        super(SlowFlatModel,self).execute()
+
+
+def get_reference(likes):
+    # linear models: posterior is Gaussian, with mean and covariance given by least squares
+    precision,projection = 0.,0.
+    for like in likes:
+        x = like.pipe_block[section_names.data,'x']
+        design = np.array([np.ones_like(x),x if isinstance(like.modules[1],AffineModel) else 0.*x]).T
+        precision += design.T.dot(like.precision).dot(design)
+        projection += design.T.dot(like.precision).dot(like.data)
+    cov = np.linalg.inv(precision)
+    return cov.dot(projection),cov
+
+
+def check_samples(samples, mean, cov):
+    chain = samples['chain']
+    chain = chain[len(chain)//2:].reshape(-1,chain.shape[-1])
+    # 5 sigma, with the effective number of samples
+    assert np.all(np.abs(chain.mean(axis=0) - mean) < 5.*np.diag(cov)**0.5*(samples['autocorr_time']/len(chain))**0.5)
+    assert np.allclose(np.cov(chain.T),cov,rtol=0.2,atol=0.2*np.max(np.abs(cov)))
+
+
+def test_autocorrelation():
+
+    rng = np.random.RandomState(seed=42)
+    # AR(1) process, with integrated autocorrelation time (1 + rho)/(1 - rho) = 3
+    rho,nsteps = 0.5,20000
+    chain = np.empty((nsteps,4,1),dtype='f8')
+    chain[0] = rng.normal(size=(4,1))
+    for istep in range(1,nsteps):
+        chain[istep] = rho*chain[istep-1] + np.sqrt(1. - rho**2)*rng.normal(size=(4,1))
+    tau = integrated_autocorrelation_time(chain)
+    assert np.allclose(tau,3.,rtol=0.1)
+    # same estimate, updated incrementally; maximum lag is increased when needed
+    accumulator = AutocorrelationAccumulator(maxlag=2)
+    for istep in range(nsteps):
+        accumulator.update(chain[istep])
+        if istep in [0,10,1000]:
+            assert np.allclose(accumulator.autocorrelation_function(),autocorrelation_function(chain[:istep+1])[:accumulator.maxlag])
+    assert np.allclose(accumulator.integrated_autocorrelation_time(chain),tau) and accumulator.maxlag > 2
+
+
+def test_ensemble():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    config_block = ConfigBlock('demo_ensemble.yaml')
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    pipeline.execute()
+    sampler = pipeline.modules[0]
+    samples = pipeline.pipe_block[section_names.samples]
+    chain = samples['chain']
+    nsteps = len(chain)
+    assert samples['names'] == ['a','b'] and chain.shape == (nsteps,8,2) and samples['logposterior'].shape == (nsteps,8)
+    assert samples['converged'] and 0. < samples['acceptance'] < 1.
+    # chain streamed to disk
+    array = np.loadtxt(sampler.chain_fn)
+    assert array.shape == (nsteps*8,5)
+    assert np.allclose(array[:,2:4].reshape(chain.shape),chain)
+    check_samples(samples,*get_reference([sampler.modules[0]]))
+    pipeline.cleanup()
+
+
+def test_metropolis():
+
+    os.chdir(base_dir)
+    mapping_proj = ['ell_0','ell_2','ell_4']
+    make_data_covariance(data_fn=data_fn,covariance_fn=covariance_fn,mapping_proj=mapping_proj)
+    pipeline = BasePipeline(config_block=ConfigBlock('demo_metropolis.yaml'))
+    pipeline.setup()
+    pipeline.execute()
+    sampler = pipeline.modules[0]
+    samples = pipeline.pipe_block[section_names.samples]
+    # a is read by the slow model, b by the fast one only
+    assert samples['slow'] == ['a'] and samples['fast'] == ['b'] and samples['ndrag'] == 3
+    chain = samples['chain']
+    nsteps = len(chain)
+    assert chain.shape == (nsteps,1,2) and samples['converged'] and 0. < samples['acceptance'] < 1.
+    assert np.loadtxt(sampler.chain_fn).shape == (nsteps,5)
+    likes = sampler.modules[0].modules
+    # slow model is not executed again while dragging fast parameters
+    slow = likes[0].modules[1]
+    assert [module for module,cache in sampler.drag_caches] == [slow] and sampler.drag_caches[0][1].hits > nsteps
+    # caches are removed after sampling
+    assert slow.execute_cache is None
+    reference = get_reference(likes)
+    check_samples(samples,*reference)
+    # fast moves follow the covariance of b conditioned on a
+    covariance = samples['covariance']
+    proposals = sampler.get_proposals(covariance)
+    assert proposals[0].shape == (2,1) and proposals[1].shape == (1,1)
+    conditional = covariance[1,1] - covariance[0,1]**2/covariance[0,0]
+    assert np.allclose(proposals[1]**2,2.38**2*conditional)
+    assert np.allclose(proposals[0].dot(proposals[0].T) + np.diag([0.,proposals[1][0,0]**2]),2.38**2*covariance)
+    pipeline.cleanup()
+
+    config_block = ConfigBlock('demo_metropolis.yaml')
+    config_block['metropolis','drag'] = False
+    del config_block['metropolis','chain_file']
+    pipeline = BasePipeline(config_block=config_block)
+    pipeline.setup()
+    pipeline.execute()
+    samples = pipeline.pipe_block[section_names.samples]
+    assert samples['slow'] == ['a','b'] and samples['fast'] == [] and samples['converged']
+    check_samples(samples,*reference)
+    pipeline.cleanup()
+
+
+if __name__ == '__main__':
+
+    setup_logging()
+    test_autocorrelation()
+    test_ensemble()
+    test_metropolis()
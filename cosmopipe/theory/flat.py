@@ -8,13 +8,16 @@ from cosmopipe.pipeline import BaseModule, section_names
 class FlatModel(BaseModule):
 
     logger = logging.getLogger('FlatModel')
+    batch = True
 
     def setup(self):
         self.size = self.data_block.get(section_names.data,'y').size
+        self.handle_a = self.data_block.get_handle(section_names.parameters,'a')
 
     def execute(self):
-        a = self.data_block.get_float(section_names.parameters,'a')
-        self.data_block[section_names.model,'y'] = np.full(self.size,a,dtype='f8')
+        a = np.asarray(self.handle_a.get(),dtype='f8')
+        y = self.data_block.get_output(section_names.model,'y',a.shape + (self.size,))
+        y[...] = a[...,None]
 
     def cleanup(self):
         return 0
@@ -23,14 +26,20 @@ class FlatModel(BaseModule):
 class AffineModel(BaseModule):
 
     logger = logging.getLogger('AffineModel')
+    batch = True
 
     def setup(self):
         self.size = self.data_block.get(section_names.data,'y').size
+        self.handle_a = self.data_block.get_handle(section_names.parameters,'a')
+        self.handle_b = self.data_block.get_handle(section_names.parameters,'b')
 
     def execute(self):
-        a = self.data_block.get_float(section_names.parameters,'a')
-        b = self.data_block.get_float(section_names.parameters,'b')
-        self.data_block[section_names.model,'y'] = a + b*self.data_block[section_names.data,'x']
+        a = np.asarray(self.handle_a.get(),dtype='f8')
+        b = np.asarray(self.handle_b.get(),dtype='f8')
+        x = self.data_block[section_names.data,'x']
+        y = self.data_block.get_output(section_names.model,'y',np.broadcast_shapes(a.shape + (1,),b.shape + (1,),x.shape))
+        np.multiply(b[...,None],x,out=y)
+        y += a[...,None]
 
     def cleanup(self):
         return 0
@@ -66,6 +66,8 @@ def savefile(func):
 
 class BaseClass(object):
 
+    __slots__ = ()
+
     def __setstate__(self,state):
         self.__dict__.update(state)
 
@@ -185,19 +187,85 @@ class MappingArray(BaseClass):
         return state
 
 
-def blockinv(blocks,inv=np.linalg.inv):
-    A = blocks[0][0]
-    if (len(blocks),len(blocks[0])) == (1,1):
-        return inv(A)
-    B = np.bmat(blocks[0][1:]).A
-    C = np.bmat([b[0].T for b in blocks[1:]]).A.T
-    invD = blockinv([b[1:] for b in blocks[1:]],inv=inv)
+def _get_lapack_funcs(names, arrays):
+    try:
+        from scipy.linalg import lapack
+    except ImportError:
+        return None
+    return lapack.get_lapack_funcs(names,arrays)
+
+
+def cholinv(matrix, overwrite=False):
+    """
+    Return inverse of symmetric positive-definite ``matrix`` (or stack of matrices, of shape (..., n, n)), computed from its Cholesky factor.
+    Raise :class:`numpy.linalg.LinAlgError` if ``matrix`` is not positive-definite.
+    If ``overwrite``, and ``matrix`` is a C-contiguous float array, the inverse is computed in place.
+    """
+    matrix = np.asarray(matrix)
+    funcs = None
+    if matrix.dtype.char in 'fd':
+        funcs = _get_lapack_funcs(('potrf','potri'),(matrix,))
+    if funcs is None:
+        # no scipy: batched numpy version
+        invL = np.linalg.inv(np.linalg.cholesky(matrix))
+        return np.matmul(np.swapaxes(invL,-2,-1),invL)
+    potrf,potri = funcs
+    toret = matrix if overwrite and matrix.flags.c_contiguous else np.array(matrix,order='C')
+    n = toret.shape[-1]
+    upper = np.triu_indices(n,k=1)
+    lower = upper[::-1]
+    for mat in toret.reshape(-1,n,n):
+        # transposed view is Fortran-ordered, hence can be overwritten in place by lapack; mat is symmetric, so "upper" of mat.T is lower of mat
+        c,info = potrf(mat.T,lower=False,overwrite_a=True,clean=False)
+        if info == 0:
+            c,info = potri(c,lower=False,overwrite_c=True)
+        if info != 0:
+            raise np.linalg.LinAlgError('Matrix is not positive-definite.')
+        if not np.shares_memory(c,mat):
+            mat.T[...] = c
+        # potri only fills in the lower triangle of mat
+        mat[upper] = mat[lower]
+    return toret
+
+
+def _assemble(blocks):
+    blocks = [[np.asarray(block) for block in row] for row in blocks]
+    rows = np.cumsum([0] + [row[0].shape[-2] for row in blocks])
+    cols = np.cumsum([0] + [block.shape[-1] for block in blocks[0]])
+    shape = np.broadcast_shapes(*[block.shape[:-2] for row in blocks for block in row])
+    dtype = np.result_type(*[block for row in blocks for block in row])
+    toret = np.empty(shape + (rows[-1],cols[-1]),dtype=dtype)
+    for irow,row in enumerate(blocks):
+        for icol,block in enumerate(row):
+            toret[...,rows[irow]:rows[irow+1],cols[icol]:cols[icol+1]] = block
+    return toret
+
+
+def blockinv(blocks, inv=np.linalg.inv, cholesky=True):
+    """
+    Return inverse of block matrix, as a single array.
+
+    Parameters
+    ----------
+    blocks : list
+        List of rows, each row being a list of blocks; blocks can be stacks of matrices, of shape (..., n_i, n_j),
+        in which case a stack of inverses is returned.
 
-    def dot(*args):
-        return np.linalg.multi_dot(args)
+    inv : callable, default=np.linalg.inv
+        Function to invert the assembled matrix, if not inverted through its Cholesky factor.
 
-    invShur = inv(A - dot(B,invD,C))
-    return np.bmat([[invShur,-dot(invShur,B,invD)],[-dot(invD,C,invShur), invD + dot(invD,C,invShur,B,invD)]]).A
+    cholesky : bool, default=True
+        If ``True``, invert the assembled matrix in place, through its Cholesky factor (see :func:`cholinv`),
+        which is about twice faster than ``inv`` for symmetric positive-definite matrices (e.g. covariances);
+        if the matrix is not positive-definite, fall back to ``inv``.
+    """
+    matrix = _assemble(blocks)
+    if cholesky:
+        try:
+            return cholinv(matrix,overwrite=True)
+        except np.linalg.LinAlgError:
+            matrix = _assemble(blocks)
+    return inv(matrix)
 
 
 def txt_to_latex(txt):